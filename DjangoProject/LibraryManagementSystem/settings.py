@@ -134,6 +134,25 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Cache (used for reference-data lists, see app/refdata.py)
+# The local-memory cache is per process. That is safe for reference data,
+# whose payloads are keyed by version counters kept in the database; a
+# shared backend such as Redis or Memcached just avoids rebuilding them
+# once per process.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'library-cache',
+    }
+}
+
+# Email (notification delivery, see app/outbox.py and deliver_notifications)
+# The console backend prints messages; to send for real use
+# 'django.core.mail.backends.smtp.EmailBackend' and set EMAIL_HOST,
+# EMAIL_PORT, EMAIL_HOST_USER, EMAIL_HOST_PASSWORD and EMAIL_USE_TLS.
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'Library <library@localhost>'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
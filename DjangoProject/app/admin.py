@@ -1,7 +1,7 @@
 from django.contrib import admin
 from .models import (
     Users, Books, Authors, Publishers, Catalogs, Librarybranches,
-    Students, Librarians, Loans, Fines, Reservations, Notifications,
+    Students, Librarians, Loans, Overdueloans, Fines, Reservations, Notifications, Notificationoutbox,
     Bookauthors, Bookcatalogs
 )
 
@@ -112,6 +112,24 @@ class LoansAdmin(admin.ModelAdmin):
     is_overdue.short_description = 'Overdue'
 
 
+# -----------------------
+# Overdue Loans Admin
+# -----------------------
+@admin.register(Overdueloans)
+class OverdueloansAdmin(admin.ModelAdmin):
+    # Maintained by checkout/return and the roll_overdue command, so read-only here
+    list_display = ['loan', 'user', 'book', 'due_date']
+    search_fields = ['user__username', 'book__title', 'book__isbn']
+    date_hierarchy = 'due_date'
+    list_select_related = ['user', 'book']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 # -----------------------
 # Fines Admin
 # -----------------------
@@ -154,6 +172,25 @@ class NotificationsAdmin(admin.ModelAdmin):
     date_hierarchy = 'created_at'
 
 
+# -----------------------
+# Notification Outbox Admin
+# -----------------------
+@admin.register(Notificationoutbox)
+class NotificationoutboxAdmin(admin.ModelAdmin):
+    # Written with notifications and drained by deliver_notifications, so read-only here
+    list_display = ['outbox_id', 'user', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status']
+    search_fields = ['user__username', 'user__email', 'subject']
+    date_hierarchy = 'created_at'
+    list_select_related = ['user']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 # -----------------------
 # Book Authors (Many-to-Many) Admin
 # -----------------------
@@ -6,10 +6,15 @@ app_name = 'api'
 urlpatterns = [
     # Books API
     path('books/', api_views.book_list_create, name='book_list_create'),
+    path('books/import/', api_views.book_import, name='book_import'),
+    path('books/export/', api_views.book_export, name='book_export'),
     path('books/<int:book_id>/', api_views.book_detail, name='book_detail'),
     
     # Loans API
     path('loans/', api_views.loan_list_create, name='loan_list_create'),
+    path('loans/counts/', api_views.loan_counts, name='loan_counts'),
+    path('loans/checkout/', api_views.loan_batch_checkout, name='loan_batch_checkout'),
+    path('loans/return/', api_views.loan_bulk_return, name='loan_bulk_return'),
     path('loans/<int:loan_id>/return/', api_views.loan_return, name='loan_return'),
     
     # Reservations API
@@ -21,6 +26,10 @@ urlpatterns = [
     path('notifications/', api_views.notification_list, name='notification_list'),
     path('notifications/create/', api_views.notification_create, name='notification_create'),
     path('notifications/trigger-overdue/', api_views.notification_trigger_overdue, name='notification_trigger_overdue'),
+    path('notifications/read/', api_views.notification_mark_read_bulk, name='notification_mark_read_bulk'),
+    path('notifications/unread-count/', api_views.notification_unread_count, name='notification_unread_count'),
+    path('notifications/stream/', api_views.notification_stream, name='notification_stream'),
+    path('notifications/stream/ticket/', api_views.notification_stream_ticket, name='notification_stream_ticket'),
     path('notifications/<int:notification_id>/read/', api_views.notification_mark_read, name='notification_mark_read'),
     
     # Fines API
@@ -2,22 +2,47 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+from django.views.decorators.http import require_GET
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
+from django.utils.cache import get_conditional_response
+from django.db import transaction
+import asyncio
+import hashlib
+import json
 import secrets
 import logging
 
-from .models import Books, Loans, Reservations, Notifications, Fines, Users, Librarybranches, Authors, Catalogs, Bookauthors, Bookcatalogs
+from .models import Books, Loans, Overdueloans, Reservations, Notifications, Fines, Users, Librarybranches, Authors, Catalogs, Publishers
 from .serializers import (
     BookSerializer, BookCreateSerializer,
-    LoanSerializer, LoanCreateSerializer,
+    LoanSerializer, LoanCreateSerializer, BatchCheckoutSerializer, BulkReturnSerializer,
     ReservationSerializer, ReservationCreateSerializer,
-    NotificationSerializer, NotificationCreateSerializer, 
+    NotificationSerializer, NotificationCreateSerializer, NotificationMarkReadSerializer,
     FineSerializer, FineUpdateSerializer,
     UserBasicSerializer, UserSerializer, UserCreateSerializer, UserUpdateSerializer,
     LibraryBranchSerializer, AuthorSerializer, CatalogSerializer, PublisherSerializer
 )
+from .pagination import BookCursorPagination, LoanCursorPagination
+from .search import search_books
+from .catalog import sync_book_links, filter_books, catalog_facets
+from .catalog_import import import_catalog, guess_format, IMPORT_FORMATS
+from .catalog_export import export_catalog, EXPORT_FORMATS, EXPORT_CONTENT_TYPES
+from .circulation import (
+    checkout, checkout_many, return_many, filter_loans, loan_history, loan_status_counts,
+    adjust_fine_balance, CheckoutError,
+    ensure_circulation, reserve, set_reservation_status, send_overdue_notices,
+)
+from .streams import hub
+from .outbox import queue_delivery
+from .refdata import cached_reference_response, get_versions
 
 
 # -----------------------
@@ -84,6 +109,35 @@ def get_app_user(user):
                 return None
 
 
+def get_book_field_options(request):
+    """
+    Parse the ?fields= and ?expand= query params (comma-separated) into
+    BookSerializer sparse-fieldset options
+    """
+    options = {}
+    for param in ('fields', 'expand'):
+        value = request.query_params.get(param, None)
+        options[param] = [name.strip() for name in value.split(',') if name.strip()] if value else None
+    return options
+
+
+def book_etag(book_id, updated_at, field_options):
+    """
+    ETag for a book detail response: the book's row version, the versions
+    of the reference tables embedded in it (authors, categories...) and the
+    ?fields=/?expand= options that shape the representation. No
+    Last-Modified is sent alongside it: the row's updated_at doesn't move
+    when an embedded author or category changes.
+    """
+    versions = ':'.join(str(version) for version in get_versions().values())
+    shape = ':'.join(
+        ','.join(sorted(set(names))) if names is not None else '*'
+        for names in (field_options['fields'], field_options['expand'])
+    )
+    digest = hashlib.md5(f'{book_id}:{updated_at.isoformat()}:{versions}:{shape}'.encode()).hexdigest()
+    return f'"book-{book_id}-{digest}"'
+
+
 # -----------------------
 # Books API Views
 # -----------------------
@@ -93,13 +147,21 @@ def get_app_user(user):
 def book_list_create(request):
     """
     GET: List all books (with optional search/filter)
+         Filters: search, branch, category, year, decade, available_only.
+         Results for `search` are ranked by relevance among the filtered
+         books; when more than SEARCH_RESULT_LIMIT match, only the best are
+         returned and the response carries `X-Search-Truncated: true`.
+         Pass `facets=true` to get per-branch, per-category, per-decade and
+         availability counts for the filtered set instead of the books.
+         Pass `fields=` (and optionally `expand=authors,categories`) for a
+         lighter representation with only those fields.
+         Results come in keyset-paginated pages ({next, prev, results}) of
+         `page_size` books (default 50, max 200); follow `next` for more.
     POST: Create a new book (librarian only)
     """
     if request.method == 'GET':
         # Get query parameters
         search = request.query_params.get('search', None)
-        branch_id = request.query_params.get('branch', None)
-        available_only = request.query_params.get('available_only', None)
         
         # Filter out deleted books if is_deleted field exists
         # Handle case where migration hasn't been run yet
@@ -114,20 +176,31 @@ def book_list_create(request):
             # Other errors - fallback to get all books
             books = Books.objects.all()
         
-        # Apply filters
+        # Apply filters: branch, category, year, decade, available_only
+        books = filter_books(books, request.query_params)
+        
+        # Ranked full-text search (title, ISBN, description, authors, categories)
+        # over the filtered books
+        search_truncated = False
         if search:
-            books = books.filter(
-                Q(title__icontains=search) | Q(isbn__icontains=search)
-            )
+            books, search_truncated = search_books(books, search)
         
-        if branch_id:
-            books = books.filter(branch_id=branch_id)
+        # Facets mode: counts for the current search/filters instead of rows
+        if request.query_params.get('facets') == 'true':
+            return Response(catalog_facets(books), status=status.HTTP_200_OK)
         
-        if available_only == 'true':
-            books = books.filter(available_copies__gt=0)
+        # Sparse fieldsets: only query and serialize what was asked for
+        field_options = get_book_field_options(request)
+        books = BookSerializer.setup_eager_loading(books, field_options['fields'])
         
-        serializer = BookSerializer(books, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        paginator = BookCursorPagination()
+        page = paginator.paginate_queryset(books, request)
+        serializer = BookSerializer(page, many=True, **field_options)
+        response = paginator.get_paginated_response(serializer.data)
+        if search_truncated:
+            # Only the best SEARCH_RESULT_LIMIT matches were returned
+            response['X-Search-Truncated'] = 'true'
+        return response
     
     elif request.method == 'POST':
         # Only librarians can create books
@@ -140,36 +213,17 @@ def book_list_create(request):
         serializer = BookCreateSerializer(data=request.data)
         if serializer.is_valid():
             # Extract authors and categories before saving
-            authors_ids = request.data.get('authors', [])
-            categories_ids = request.data.get('categories', [])
-            
-            # Save book
-            book = serializer.save()
+            authors_ids = serializer.validated_data.pop('authors', None)
+            categories_ids = serializer.validated_data.pop('categories', None)
             
-            # Handle authors (many-to-many)
-            if authors_ids:
-                # Clear existing authors
-                Bookauthors.objects.filter(book=book).delete()
-                # Add new authors
-                for author_id in authors_ids:
-                    try:
-                        author = Authors.objects.get(pk=author_id)
-                        Bookauthors.objects.get_or_create(book=book, author=author)
-                    except Authors.DoesNotExist:
-                        pass
-            
-            # Handle categories (many-to-many)
-            if categories_ids:
-                # Clear existing categories
-                Bookcatalogs.objects.filter(book=book).delete()
-                # Add new categories
-                for category_id in categories_ids:
-                    try:
-                        catalog = Catalogs.objects.get(pk=category_id)
-                        Bookcatalogs.objects.get_or_create(book=book, catalog=catalog)
-                    except Catalogs.DoesNotExist:
-                        pass
+            with transaction.atomic():
+                # Save book
+                book = serializer.save()
+                
+                # Link authors and categories (many-to-many)
+                sync_book_links(book, authors_ids or None, categories_ids or None)
             
+            book = BookSerializer.setup_eager_loading(Books.objects.all()).get(pk=book.book_id)
             return Response(
                 BookSerializer(book).data,
                 status=status.HTTP_201_CREATED
@@ -177,19 +231,98 @@ def book_list_create(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def book_import(request):
+    """
+    Bulk import books from an uploaded CSV or JSONL file (librarian only)
+    Form fields: file, file_format (optional: csv or jsonl, guessed from the file name)
+    Returns created/updated counts and per-row errors.
+    """
+    if not is_librarian(request.user):
+        return Response(
+            {'error': 'Only librarians can import books.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    upload = request.FILES.get('file')
+    if not upload:
+        return Response(
+            {'error': 'A file upload is required.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    file_format = request.data.get('file_format') or guess_format(upload.name)
+    if file_format not in IMPORT_FORMATS:
+        return Response(
+            {'error': f'Invalid file_format. Must be one of: {", ".join(IMPORT_FORMATS)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    result = import_catalog(upload.file, file_format)
+    return Response(result.as_dict(), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def book_export(request):
+    """
+    Stream the full catalog as JSON Lines or CSV (librarian only)
+    Query params: output (jsonl or csv, default jsonl), plus the catalog
+    filters (branch, category, year, decade, available_only)
+    """
+    if not is_librarian(request.user):
+        return Response(
+            {'error': 'Only librarians can export the catalog.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    file_format = request.query_params.get('output', 'jsonl')
+    if file_format not in EXPORT_FORMATS:
+        return Response(
+            {'error': f'Invalid output. Must be one of: {", ".join(EXPORT_FORMATS)}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    books = filter_books(Books.objects.filter(is_deleted=False), request.query_params)
+    response = StreamingHttpResponse(
+        export_catalog(books, file_format),
+        content_type=EXPORT_CONTENT_TYPES[file_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="catalog.{file_format}"'
+    return response
+
+
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def book_detail(request, book_id):
     """
-    GET: Get book details
+    GET: Get book details (sends an ETag; unchanged re-fetches get a 304)
     PUT: Update book (librarian only)
     DELETE: Delete book (librarian only)
     """
-    book = get_object_or_404(Books, pk=book_id)
+    field_options = get_book_field_options(request)
+    if request.method == 'GET':
+        # Revalidation (If-None-Match) only needs the row version
+        if 'HTTP_IF_NONE_MATCH' in request.META:
+            updated_at = Books.objects.filter(pk=book_id).values_list('updated_at', flat=True).first()
+            if updated_at is not None:
+                etag = book_etag(book_id, updated_at, field_options)
+                response = get_conditional_response(request, etag=etag)
+                if response is not None:
+                    response['ETag'] = etag
+                    return response
     
+    books = Books.objects.all()
     if request.method == 'GET':
-        serializer = BookSerializer(book)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        books = BookSerializer.setup_eager_loading(books, field_options['fields'])
+    book = get_object_or_404(books, pk=book_id)
+    
+    if request.method == 'GET':
+        serializer = BookSerializer(book, **field_options)
+        response = Response(serializer.data, status=status.HTTP_200_OK)
+        response['ETag'] = book_etag(book.book_id, book.updated_at, field_options)
+        return response
     
     elif request.method == 'PUT':
         if not is_librarian(request.user):
@@ -201,38 +334,18 @@ def book_detail(request, book_id):
         serializer = BookCreateSerializer(book, data=request.data, partial=True)
         if serializer.is_valid():
             # Extract authors and categories before saving
-            authors_ids = request.data.get('authors', None)
-            categories_ids = request.data.get('categories', None)
-            
-            # Save book
-            serializer.save()
-            
-            # Handle authors (many-to-many) - only if provided
-            if authors_ids is not None:
-                # Clear existing authors
-                Bookauthors.objects.filter(book=book).delete()
-                # Add new authors
-                for author_id in authors_ids:
-                    try:
-                        author = Authors.objects.get(pk=author_id)
-                        Bookauthors.objects.get_or_create(book=book, author=author)
-                    except Authors.DoesNotExist:
-                        pass
+            authors_ids = serializer.validated_data.pop('authors', None)
+            categories_ids = serializer.validated_data.pop('categories', None)
             
-            # Handle categories (many-to-many) - only if provided
-            if categories_ids is not None:
-                # Clear existing categories
-                Bookcatalogs.objects.filter(book=book).delete()
-                # Add new categories
-                for category_id in categories_ids:
-                    try:
-                        catalog = Catalogs.objects.get(pk=category_id)
-                        Bookcatalogs.objects.get_or_create(book=book, catalog=catalog)
-                    except Catalogs.DoesNotExist:
-                        pass
+            with transaction.atomic():
+                # Save book
+                serializer.save()
+                
+                # Apply only the author/category changes - only if provided
+                sync_book_links(book, authors_ids, categories_ids)
             
-            # Refresh book to get updated relationships
-            book.refresh_from_db()
+            # Reload book with its updated relationships
+            book = BookSerializer.setup_eager_loading(Books.objects.all()).get(pk=book_id)
             return Response(BookSerializer(book).data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -264,31 +377,46 @@ def book_detail(request, book_id):
 # Loans API Views
 # -----------------------
 
+def _visible_loans(request, params):
+    """
+    The loans this user may list, with the circulation filters applied
+    (students see their own, librarians see all), or None if the student
+    has no library account. One patron's history includes archived loans.
+    """
+    user_id = params.get('user', None)
+    if is_librarian(request.user):
+        if user_id and user_id.isdigit():
+            return loan_history(user_id, params)
+        return filter_loans(Loans.objects.select_related('user', 'book'), params)
+    app_user = get_app_user(request.user)
+    if not app_user:
+        return None
+    return loan_history(app_user.user_id, params)
+
+
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def loan_list_create(request):
     """
-    GET: List loans (students see their own, librarians see all)
+    GET: List loans (students see their own, librarians see all), in
+         keyset-paginated pages of `page_size` loans (default 50, max 200)
     POST: Create a new loan (librarian only)
     """
     if request.method == 'GET':
-        app_user = get_app_user(request.user)
-        
-        if is_librarian(request.user):
-            # Librarians see all loans
-            loans = Loans.objects.all().order_by('-loan_date')
-        else:
-            # Students see only their loans
-            if app_user:
-                loans = Loans.objects.filter(user=app_user).order_by('-loan_date')
-            else:
-                return Response(
-                    {'error': 'User not found in library system.'},
-                    status=status.HTTP_404_NOT_FOUND
-                )
+        # Filters: status, user, book, branch, loaned_from, loaned_to
+        loans = _visible_loans(request, request.query_params)
+        if loans is None:
+            return Response(
+                {'error': 'User not found in library system.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        loans = loans.order_by('-loan_date', '-loan_id')
         
-        serializer = LoanSerializer(loans, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # Keyset pages ({next, prev, results}), newest loans first
+        paginator = LoanCursorPagination()
+        page = paginator.paginate_queryset(loans, request)
+        serializer = LoanSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
     elif request.method == 'POST':
         # Only librarians can create loans
@@ -300,24 +428,17 @@ def loan_list_create(request):
         
         serializer = LoanCreateSerializer(data=request.data)
         if serializer.is_valid():
-            # Get the book before creating loan
-            book_id = serializer.validated_data['book'].book_id
-            book = Books.objects.get(pk=book_id)
-            
-            # Check availability
-            if book.available_copies <= 0:
+            # Claim a loan slot and a copy and create the loan in one
+            # transaction; a patron at their limit, or a racing checkout
+            # that took the last copy, makes this fail cleanly
+            try:
+                loan = checkout(**serializer.validated_data)
+            except CheckoutError as e:
                 return Response(
-                    {'error': 'No available copies for this book.'},
+                    {'error': str(e)},
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Create loan with loan_date set
-            loan = serializer.save(loan_date=timezone.now())
-            
-            # Update book availability
-            book.available_copies -= 1
-            book.save()
-            
             return Response(
                 LoanSerializer(loan).data,
                 status=status.HTTP_201_CREATED
@@ -325,6 +446,64 @@ def loan_list_create(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def loan_counts(request):
+    """
+    Count the loans the list would show by status ({all, active, overdue,
+    returned}) in one aggregate query, for tab and summary badges. Takes
+    the same filters as the loan list except `status`.
+    """
+    params = request.query_params.copy()
+    params.pop('status', None)
+    loans = _visible_loans(request, params)
+    if loans is None:
+        return Response(
+            {'error': 'User not found in library system.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return Response(loan_status_counts(loans), status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def loan_batch_checkout(request):
+    """
+    Check out several books to one patron in one transaction (librarian only)
+    Body: {"user": id, "due_date": "YYYY-MM-DD", "items": [{"book": id, "due_date": optional}, ...]}
+    Items that can't be lent are reported without failing the others.
+    """
+    if not is_librarian(request.user):
+        return Response(
+            {'error': 'Only librarians can create loans.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    serializer = BatchCheckoutSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    user = serializer.validated_data['user']
+    results = checkout_many(
+        user,
+        [(item['book'], item['due_date']) for item in serializer.validated_data['items']]
+    )
+    
+    items = []
+    for book_id, loan, error in results:
+        if loan:
+            items.append({'book': book_id, 'status': 'loaned', 'loan': LoanSerializer(loan).data})
+        else:
+            items.append({'book': book_id, 'status': 'failed', 'error': error})
+    loaned = sum(1 for item in items if item['status'] == 'loaned')
+    
+    return Response({
+        'loaned': loaned,
+        'failed': len(items) - loaned,
+        'results': items,
+    }, status=status.HTTP_201_CREATED if loaned else status.HTTP_400_BAD_REQUEST)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def loan_return(request, loan_id):
@@ -345,72 +524,18 @@ def loan_return(request, loan_id):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Calculate return date
-    return_date = timezone.now().date()
-    
-    # Calculate late days and create fine if overdue
-    late_days = 0
-    fine_created = False
-    fine_amount = 0.00
-    if return_date > loan.due_date:
-        late_days = (return_date - loan.due_date).days
-        # Calculate fine: $1.00 per day late (minimum $1.00)
-        fine_amount = max(1.00, late_days * 1.00)
-        
-        # Check if fine already exists for this loan
-        existing_fine = Fines.objects.filter(loan=loan).first()
-        if not existing_fine:
-            # Create fine automatically
-            Fines.objects.create(
-                user=loan.user,
-                loan=loan,
-                amount=fine_amount,
-                paid=0,
-                date_issued=timezone.now()
-            )
-            fine_created = True
-            
-            # Create notification for the student about the fine
-            notification_message = f"Fine of ${fine_amount:.2f} issued for late return of '{loan.book.title}' ({late_days} day{'s' if late_days > 1 else ''} late)."
-            Notifications.objects.create(
-                user=loan.user,
-                message=notification_message,
-                notification_type='overdue',
-                created_at=timezone.now(),
-                is_read=0
-            )
-    
-    # Update loan
-    loan.return_date = return_date
-    loan.save()
-    
-    # Update book availability
-    loan.book.available_copies += 1
-    loan.book.save()
-    
-    # Check for pending reservations and notify the first student in queue
-    pending_reservations = Reservations.objects.filter(
-        book=loan.book,
-        status='pending'
-    ).order_by('reservation_date')
-    
-    if pending_reservations.exists() and loan.book.available_copies > 0:
-        # Notify the first student in the reservation queue
-        first_reservation = pending_reservations.first()
-        
-        # Create notification for the student
-        notification_message = f"Book '{loan.book.title}' is now available! Your reservation is ready."
-        Notifications.objects.create(
-            user=first_reservation.user,
-            message=notification_message,
-            notification_type='reservation',
-            created_at=timezone.now(),
-            is_read=0
+    # Shares the bulk return path: fine, notices and reservation queue included
+    result = return_many(loan_ids=[loan.pk])[0]
+    if 'error' in result:
+        # Returned by someone else since the check above
+        return Response(
+            {'error': result['error']},
+            status=status.HTTP_400_BAD_REQUEST
         )
-        
-        # Update reservation status to 'ready'
-        first_reservation.status = 'ready'
-        first_reservation.save()
+    loan = result['loan']
+    late_days = result['late_days']
+    fine_created = result['fine_created']
+    fine_amount = result['fine_amount']
     
     response_data = {
         'message': 'Book returned successfully.',
@@ -427,6 +552,48 @@ def loan_return(request, loan_id):
     return Response(response_data, status=status.HTTP_200_OK)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def loan_bulk_return(request):
+    """
+    Check in a batch of returned books, e.g. the overnight return bin (librarian only)
+    Body: {"loan_ids": [...], "isbns": [...]} (either or both)
+    Fines, notices and reservation updates are applied set-wise in one transaction.
+    """
+    if not is_librarian(request.user):
+        return Response(
+            {'error': 'Only librarians can return books.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    serializer = BulkReturnSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    results = return_many(**serializer.validated_data)
+    
+    items = []
+    fines_issued = 0
+    for result in results:
+        loan = result.pop('loan', None)
+        if loan:
+            fines_issued += result['fine_created']
+            if result['fine_amount'] is not None:
+                result['fine_amount'] = float(result['fine_amount'])
+            result.update(status='returned', loan=LoanSerializer(loan).data)
+        else:
+            result['status'] = 'failed'
+        items.append(result)
+    returned = sum(1 for item in items if item['status'] == 'returned')
+    
+    return Response({
+        'returned': returned,
+        'failed': len(items) - returned,
+        'fines_issued': fines_issued,
+        'results': items,
+    }, status=status.HTTP_200_OK)
+
+
 # -----------------------
 # Reservations API Views
 # -----------------------
@@ -473,10 +640,11 @@ def reservation_list_create(request):
         
         serializer = ReservationCreateSerializer(data=data)
         if serializer.is_valid():
-            # Ensure required fields are set before hitting DB
-            reservation = serializer.save(
-                reservation_date=timezone.now(),
-                status=data.get('status', 'pending')
+            # Pending reservations join the back of the title's queue
+            reservation = reserve(
+                serializer.validated_data['user'],
+                serializer.validated_data['book'],
+                serializer.validated_data.get('status', 'pending')
             )
 
             return Response(
@@ -509,8 +677,7 @@ def reservation_cancel(request, reservation_id):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    reservation.status = 'cancelled'
-    reservation.save()
+    set_reservation_status(reservation, 'cancelled')
     
     return Response(
         {
@@ -582,9 +749,8 @@ def reservation_update_status(request, reservation_id):
                 status=status.HTTP_400_BAD_REQUEST
             )
     
-    # Update status
-    reservation.status = new_status
-    reservation.save()
+    # Update status (leaving the queue if it was pending)
+    set_reservation_status(reservation, new_status)
     
     return Response(
         {
@@ -657,7 +823,7 @@ def notification_mark_read(request, notification_id):
     
     # Check permission: students can only mark their own, librarians can mark any
     if not is_librarian(request.user):
-        if not app_user or notification.user != app_user:
+        if not app_user or notification.user_id != app_user.user_id:
             return Response(
                 {'error': 'You can only mark your own notifications as read.'},
                 status=status.HTTP_403_FORBIDDEN
@@ -675,6 +841,68 @@ def notification_mark_read(request, notification_id):
     )
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def notification_mark_read_bulk(request):
+    """
+    Mark many notifications as read with one UPDATE
+    - notification_ids: these notifications
+    - before: all unread notifications created up to this time
+    Students only ever touch their own; librarians may mark any ids, and
+    mark another user's notifications by `before` with user_id.
+    """
+    serializer = NotificationMarkReadSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    data = serializer.validated_data
+    
+    app_user = get_app_user(request.user)
+    if not app_user:
+        return Response(
+            {'error': 'User not found in library system.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    notifications = Notifications.objects.filter(is_read=0)
+    if not is_librarian(request.user):
+        notifications = notifications.filter(user=app_user)
+    elif 'before' in data:
+        notifications = notifications.filter(user_id=data.get('user_id', app_user.user_id))
+    
+    if 'notification_ids' in data:
+        notifications = notifications.filter(pk__in=data['notification_ids'])
+    else:
+        notifications = notifications.filter(created_at__lte=data['before'])
+    
+    marked = notifications.update(is_read=1)
+    
+    return Response(
+        {
+            'message': f'{marked} notification{"s" if marked != 1 else ""} marked as read.',
+            'marked': marked
+        },
+        status=status.HTTP_200_OK
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def notification_unread_count(request):
+    """
+    Number of unread notifications for the current user (navbar badge).
+    Counted from the (user, is_read, created_at) index alone.
+    """
+    app_user = get_app_user(request.user)
+    if not app_user:
+        return Response(
+            {'error': 'User not found in library system.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    unread = Notifications.objects.filter(user=app_user, is_read=0).count()
+    return Response({'unread': unread}, status=status.HTTP_200_OK)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def notification_create(request):
@@ -689,7 +917,9 @@ def notification_create(request):
     
     serializer = NotificationCreateSerializer(data=request.data)
     if serializer.is_valid():
-        notification = serializer.save()
+        with transaction.atomic():
+            notification = serializer.save()
+            queue_delivery([notification])
         return Response(
             {
                 'message': 'Notification sent successfully.',
@@ -712,62 +942,157 @@ def notification_trigger_overdue(request):
             status=status.HTTP_403_FORBIDDEN
         )
     
-    today = timezone.now().date()
+    # One query finds the overdue loans without a recent notice; notices
+    # are bulk inserted in chunks
+    result = send_overdue_notices()
     
-    # Find all overdue loans (due_date < today and return_date is None)
-    overdue_loans = Loans.objects.filter(
-        due_date__lt=today,
-        return_date__isnull=True
+    return Response(
+        {
+            'message': f'Overdue notices processed. {result["created"]} new notifications created, {result["skipped"]} already exist.',
+            'notifications_created': result['created'],
+            'overdue_loans_count': result['overdue_loans'],
+            'timings_ms': result['timings_ms']
+        },
+        status=status.HTTP_200_OK
     )
-    
-    notifications_created = 0
-    notifications_updated = 0
-    
-    for loan in overdue_loans:
-        # Calculate late days
-        late_days = (today - loan.due_date).days
-        
-        # Check if notification already exists for this loan
-        existing_notification = Notifications.objects.filter(
-            user=loan.user,
-            notification_type='overdue',
-            message__icontains=loan.book.title
-        ).order_by('-created_at').first()
-        
-        # Only create notification if it doesn't exist or if it's been more than 7 days
-        should_create = True
-        if existing_notification:
-            days_since_notification = (today - existing_notification.created_at.date()).days
-            if days_since_notification < 7:
-                should_create = False
-        
-        if should_create:
-            notification_message = (
-                f"Overdue Notice: Your book '{loan.book.title}' is {late_days} day{'s' if late_days > 1 else ''} overdue. "
-                f"Please return it as soon as possible to avoid additional fines."
-            )
-            
-            Notifications.objects.create(
-                user=loan.user,
-                message=notification_message,
-                notification_type='overdue',
-                created_at=timezone.now(),
-                is_read=0
-            )
-            notifications_created += 1
-        else:
-            notifications_updated += 1
+
+
+# Seconds between keep-alive comments on an idle stream
+STREAM_KEEPALIVE = 25
+# Notifications read per query when a stream catches up
+STREAM_BATCH_SIZE = 100
+# Seconds a stream ticket stays valid; clients fetch a new one per connection
+STREAM_TICKET_MAX_AGE = 60
+STREAM_TICKET_SALT = 'app.notification_stream'
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def notification_stream_ticket(request):
+    """
+    Issue a short-lived signed ticket for opening the notification stream.
+    EventSource can't send an Authorization header, and a JWT in the query
+    string would end up in access logs; the ticket expires in seconds.
+    """
+    app_user = get_app_user(request.user)
+    if not app_user:
+        return Response(
+            {'error': 'User not found in library system.'},
+            status=status.HTTP_404_NOT_FOUND
+        )
     
     return Response(
         {
-            'message': f'Overdue notices processed. {notifications_created} new notifications created, {notifications_updated} already exist.',
-            'notifications_created': notifications_created,
-            'overdue_loans_count': overdue_loans.count()
+            'ticket': signing.dumps(app_user.user_id, salt=STREAM_TICKET_SALT),
+            'expires_in': STREAM_TICKET_MAX_AGE
         },
         status=status.HTTP_200_OK
     )
 
 
+def _stream_user(request):
+    """Authenticate a stream request by JWT header, or by ?ticket= for EventSource"""
+    ticket = request.GET.get('ticket')
+    if ticket:
+        try:
+            user_id = signing.loads(ticket, salt=STREAM_TICKET_SALT, max_age=STREAM_TICKET_MAX_AGE)
+        except signing.BadSignature:
+            return None
+        return Users.objects.filter(pk=user_id).first()
+    
+    authenticator = JWTAuthentication()
+    header = authenticator.get_header(request)
+    raw_token = authenticator.get_raw_token(header) if header else None
+    if not raw_token:
+        return None
+    try:
+        user = authenticator.get_user(authenticator.get_validated_token(raw_token))
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+    return get_app_user(user)
+
+
+def _notifications_after(user_id, last_id):
+    notifications = (Notifications.objects.filter(user_id=user_id, notification_id__gt=last_id)
+                     .select_related('user').order_by('notification_id')[:STREAM_BATCH_SIZE])
+    return NotificationSerializer(notifications, many=True).data
+
+
+def _latest_notification_id(user_id):
+    latest = Notifications.objects.filter(user_id=user_id).order_by('-notification_id') \
+                                  .values_list('notification_id', flat=True).first()
+    return latest or 0
+
+
+async def notification_events(user_id, last_id):
+    """
+    Server-Sent Events for one user: notifications with ids past `last_id`,
+    read once on connect and then only when the hub wakes the stream, with
+    keep-alive comments while idle.
+    """
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    hub.subscribe(user_id, loop, wake)
+    wake.set()  # catch up on anything since last_id
+    try:
+        while True:
+            if wake.is_set():
+                wake.clear()
+                while True:
+                    rows = await sync_to_async(_notifications_after)(user_id, last_id)
+                    for row in rows:
+                        last_id = row['notification_id']
+                        yield f"id: {last_id}\nevent: notification\ndata: {json.dumps(row)}\n\n"
+                    if len(rows) < STREAM_BATCH_SIZE:
+                        break
+            try:
+                await asyncio.wait_for(wake.wait(), STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+    finally:
+        hub.unsubscribe(user_id, loop, wake)
+
+
+@require_GET
+async def notification_stream(request):
+    """
+    Stream the current user's new notifications as Server-Sent Events.
+    Resumes after Last-Event-ID (or ?last_id=) when given, otherwise starts
+    from the newest notification.
+
+    A plain async Django view: DRF views are synchronous, so the JWT or
+    stream ticket is checked here directly. Under WSGI (e.g. runserver) each
+    open stream would hold a worker thread, so it answers 501 there; serve
+    LibraryManagementSystem.asgi with an ASGI server instead.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'error': 'The notification stream is only served under ASGI.'},
+            status=501
+        )
+    
+    app_user = await sync_to_async(_stream_user)(request)
+    if not app_user:
+        return JsonResponse(
+            {'error': 'Authentication credentials were not provided or are invalid.'},
+            status=401
+        )
+    
+    last_id = request.headers.get('Last-Event-ID') or request.GET.get('last_id')
+    if last_id and last_id.isdigit():
+        last_id = int(last_id)
+    else:
+        last_id = await sync_to_async(_latest_notification_id)(app_user.user_id)
+    
+    response = StreamingHttpResponse(
+        notification_events(app_user.user_id, last_id),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # -----------------------
 # Fines API Views
 # -----------------------
@@ -799,7 +1124,9 @@ def fine_list(request):
         paid_bool = paid.lower() == 'true'
         fines = fines.filter(paid=1 if paid_bool else 0)
     
-    serializer = FineSerializer(fines, many=True)
+    # Titles for live and archived loans in two queries rather than per fine
+    fines = list(fines.select_related('user'))
+    serializer = FineSerializer(fines, many=True, context={'loan_titles': FineSerializer.loan_titles(fines)})
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -817,15 +1144,20 @@ def fine_pay(request, fine_id):
     
     fine = get_object_or_404(Fines, pk=fine_id)
     
-    if fine.paid == 1:
+    # Only the request that actually flips paid 0 -> 1 reduces the balance
+    with transaction.atomic():
+        ensure_circulation([fine.user_id])
+        marked = Fines.objects.filter(pk=fine_id, paid=0).update(paid=1)
+        if marked:
+            fine.refresh_from_db()
+            adjust_fine_balance(fine.user_id, -fine.amount)
+    
+    if not marked:
         return Response(
             {'error': 'This fine has already been paid.'},
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    fine.paid = 1
-    fine.save()
-    
     return Response(
         {
             'message': 'Fine marked as paid.',
@@ -847,19 +1179,25 @@ def fine_update(request, fine_id):
             status=status.HTTP_403_FORBIDDEN
         )
     
-    fine = get_object_or_404(Fines, pk=fine_id)
-    
-    serializer = FineUpdateSerializer(fine, data=request.data, partial=True)
-    if serializer.is_valid():
+    # Lock the fine so a concurrent payment can't change what the balance owes
+    with transaction.atomic():
+        fine = get_object_or_404(Fines.objects.select_for_update(), pk=fine_id)
+        ensure_circulation([fine.user_id])
+        old_amount = fine.amount
+        serializer = FineUpdateSerializer(fine, data=request.data, partial=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         serializer.save()
-        return Response(
-            {
-                'message': 'Fine amount updated successfully.',
-                'fine': FineSerializer(fine).data
-            },
-            status=status.HTTP_200_OK
-        )
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if fine.paid == 0:
+            adjust_fine_balance(fine.user_id, fine.amount - old_amount)
+    
+    return Response(
+        {
+            'message': 'Fine amount updated successfully.',
+            'fine': FineSerializer(fine).data
+        },
+        status=status.HTTP_200_OK
+    )
 
 
 @api_view(['DELETE'])
@@ -874,8 +1212,12 @@ def fine_delete(request, fine_id):
             status=status.HTTP_403_FORBIDDEN
         )
     
-    fine = get_object_or_404(Fines, pk=fine_id)
-    fine.delete()
+    with transaction.atomic():
+        fine = get_object_or_404(Fines.objects.select_for_update(), pk=fine_id)
+        ensure_circulation([fine.user_id])
+        fine.delete()
+        if fine.paid == 0:
+            adjust_fine_balance(fine.user_id, -fine.amount)
     
     return Response(
         {'message': 'Fine deleted successfully.'},
@@ -997,10 +1339,12 @@ def user_detail(request, user_id):
 def branch_list(request):
     """
     Get list of library branches (for librarian assignment)
+    Served from the versioned reference-data cache (supports If-None-Match)
     """
-    branches = Librarybranches.objects.all().order_by('branch_name')
-    serializer = LibraryBranchSerializer(branches, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    def build():
+        branches = Librarybranches.objects.all().order_by('branch_name')
+        return LibraryBranchSerializer(branches, many=True).data
+    return cached_reference_response(request, 'branches', build)
 
 
 @api_view(['GET'])
@@ -1008,10 +1352,12 @@ def branch_list(request):
 def author_list(request):
     """
     Get list of authors (for book form)
+    Served from the versioned reference-data cache (supports If-None-Match)
     """
-    authors = Authors.objects.all().order_by('last_name', 'first_name')
-    serializer = AuthorSerializer(authors, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    def build():
+        authors = Authors.objects.all().order_by('last_name', 'first_name')
+        return AuthorSerializer(authors, many=True).data
+    return cached_reference_response(request, 'authors', build)
 
 
 @api_view(['GET'])
@@ -1019,10 +1365,12 @@ def author_list(request):
 def category_list(request):
     """
     Get list of categories (for book form)
+    Served from the versioned reference-data cache (supports If-None-Match)
     """
-    categories = Catalogs.objects.all().order_by('category_name')
-    serializer = CatalogSerializer(categories, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    def build():
+        categories = Catalogs.objects.all().order_by('category_name')
+        return CatalogSerializer(categories, many=True).data
+    return cached_reference_response(request, 'categories', build)
 
 
 @api_view(['GET'])
@@ -1030,12 +1378,12 @@ def category_list(request):
 def publisher_list(request):
     """
     Get list of publishers (for book form)
+    Served from the versioned reference-data cache (supports If-None-Match)
     """
-    from .models import Publishers
-    from .serializers import PublisherSerializer
-    publishers = Publishers.objects.all().order_by('name')
-    serializer = PublisherSerializer(publishers, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    def build():
+        publishers = Publishers.objects.all().order_by('name')
+        return PublisherSerializer(publishers, many=True).data
+    return cached_reference_response(request, 'publishers', build)
 
 
 # -----------------------
@@ -1050,6 +1398,7 @@ def dashboard_stats(request):
     Returns:
     - total_books: Total number of books in library (excluding soft-deleted)
     - total_students: Total number of student users
+    - overdue_loans: Number of open loans past their due date
     """
     if not is_librarian(request.user):
         return Response(
@@ -1066,9 +1415,13 @@ def dashboard_stats(request):
     # Total students
     total_students = Users.objects.filter(role='student').count()
     
+    # Overdue loans (maintained table, see app.circulation)
+    overdue_loans = Overdueloans.objects.count()
+    
     stats = {
         'total_books': total_books,
-        'total_students': total_students
+        'total_students': total_students,
+        'overdue_loans': overdue_loans
     }
     
     return Response(stats, status=status.HTTP_200_OK)
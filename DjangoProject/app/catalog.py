@@ -0,0 +1,148 @@
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import Substr
+from django.utils import timezone
+
+from .models import Books, Authors, Catalogs, Bookauthors, Bookcatalogs
+from .search import invalidate_search_index
+
+
+# -----------------------
+# Book relationship sync
+# -----------------------
+
+# True while sync_book_links writes link rows; it bumps the book's row
+# version once itself, so the per-row link signals (app.signals) skip it
+syncing_book_links = ContextVar('syncing_book_links', default=False)
+
+def _sync_links(book, link_model, target_model, target_field, requested_ids):
+    """
+    Make a book's link rows match requested_ids by applying only the
+    difference. Unknown ids are ignored. Returns True if anything changed.
+    """
+    requested = set(requested_ids)
+    if requested:
+        # Validate every requested id with a single query
+        requested = set(target_model.objects.filter(pk__in=requested).values_list('pk', flat=True))
+
+    column = f'{target_field}_id'
+    existing = set(link_model.objects.filter(book=book).values_list(column, flat=True))
+    to_remove = existing - requested
+    to_add = requested - existing
+
+    if to_remove:
+        link_model.objects.filter(book=book, **{f'{column}__in': to_remove}).delete()
+    if to_add:
+        link_model.objects.bulk_create([link_model(book=book, **{column: pk}) for pk in to_add])
+    return bool(to_remove or to_add)
+
+
+def sync_book_links(book, author_ids=None, category_ids=None):
+    """
+    Sync a book's authors and/or categories to the requested id lists.
+    Passing None leaves that relationship untouched; an empty list clears it.
+    Unchanged relationships cost no writes. Returns True if anything changed.
+    """
+    changed = False
+    syncing = syncing_book_links.set(True)
+    try:
+        with transaction.atomic():
+            if author_ids is not None:
+                changed |= _sync_links(book, Bookauthors, Authors, 'author', author_ids)
+            if category_ids is not None:
+                changed |= _sync_links(book, Bookcatalogs, Catalogs, 'catalog', category_ids)
+            if changed:
+                # One row version bump for the whole change
+                Books.objects.filter(pk=book.pk).update(updated_at=timezone.now())
+    finally:
+        syncing_book_links.reset(syncing)
+    if changed:
+        invalidate_search_index()
+    return changed
+
+
+# -----------------------
+# Catalog filters and facets
+# -----------------------
+
+def filter_books(books, params):
+    """
+    Apply the catalog filters from query params to a Books queryset:
+    branch, category, year, decade (e.g. 1990) and available_only.
+    Malformed ids and years are ignored rather than raising.
+    """
+    branch_id = params.get('branch', None)
+    category_id = params.get('category', None)
+    year = params.get('year', None)
+    decade = params.get('decade', None)
+    available_only = params.get('available_only', None)
+
+    if branch_id and branch_id.isdigit():
+        books = books.filter(branch_id=branch_id)
+
+    if category_id and category_id.isdigit():
+        books = books.filter(
+            book_id__in=Bookcatalogs.objects.filter(catalog_id=category_id).values('book_id')
+        )
+
+    if year and year.isdigit():
+        books = books.filter(publication_year=year)
+
+    if decade and decade.isdigit() and len(decade) == 4:
+        # publication_year is stored as text, so a decade is a 3-digit prefix
+        books = books.filter(publication_year__startswith=decade[:3])
+
+    if available_only == 'true':
+        books = books.filter(available_copies__gt=0)
+
+    return books
+
+
+def catalog_facets(books):
+    """
+    Count a filtered Books queryset by branch, category, decade and
+    availability. Each facet is one grouped aggregate query in the database.
+    """
+    # Ordering (e.g. search relevance) would otherwise leak into GROUP BY
+    books = books.order_by()
+
+    branches = [
+        {'branch': row['branch_id'], 'branch_name': row['branch__branch_name'], 'count': row['count']}
+        for row in books.values('branch_id', 'branch__branch_name')
+                        .annotate(count=Count('book_id')).order_by('-count', 'branch__branch_name')
+    ]
+
+    categories = [
+        {'category': row['catalog_id'], 'category_name': row['catalog__category_name'], 'count': row['count']}
+        for row in Bookcatalogs.objects.filter(book__in=books.values('book_id'))
+                                        .values('catalog_id', 'catalog__category_name')
+                                        .annotate(count=Count('book_id'))
+                                        .order_by('-count', 'catalog__category_name')
+    ]
+
+    decades = [
+        {'decade': int(row['decade_prefix'] + '0'), 'count': row['count']}
+        for row in books.exclude(publication_year__isnull=True)
+                        .annotate(decade_prefix=Substr('publication_year', 1, 3))
+                        .values('decade_prefix').annotate(count=Count('book_id'))
+                        .order_by('-decade_prefix')
+        if row['decade_prefix'] and row['decade_prefix'].isdigit()
+    ]
+
+    availability = books.aggregate(
+        total=Count('book_id'),
+        available=Count('book_id', filter=Q(available_copies__gt=0)),
+        unavailable=Count('book_id', filter=Q(available_copies__lte=0)),
+    )
+
+    return {
+        'count': availability.pop('total'),
+        'facets': {
+            'branch': branches,
+            'category': categories,
+            'decade': decades,
+            'availability': availability,
+        },
+    }
@@ -0,0 +1,77 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .serializers import BookSerializer
+
+
+# -----------------------
+# Streaming catalog export
+# -----------------------
+# Writes the catalog row by row as JSON Lines or CSV. Books are read in
+# keyset-bounded chunks (book_id > last seen id), each with its own batched
+# author/category prefetch, so memory stays flat however big the catalog is.
+# (MySQL drivers buffer whole result sets client-side, so chunking the query
+# is what keeps memory bounded rather than a server-side cursor.)
+
+EXPORT_FORMATS = ('jsonl', 'csv')
+
+# Books fetched (and authors/categories prefetched) per query
+EXPORT_CHUNK_SIZE = 2000
+
+CSV_COLUMNS = [
+    'book_id', 'title', 'isbn', 'pages', 'publication_year', 'description',
+    'publisher', 'publisher_name', 'branch', 'branch_name',
+    'available_copies', 'status', 'authors', 'categories',
+]
+
+EXPORT_CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class Echo:
+    """File-like object whose write() just returns the value (for csv.writer)"""
+
+    def write(self, value):
+        return value
+
+
+def iter_book_chunks(books, chunk_size=EXPORT_CHUNK_SIZE, fields=None):
+    """Yield lists of books in book_id order, one bounded query per chunk"""
+    books = BookSerializer.setup_eager_loading(books.order_by('book_id'), fields)
+    last_id = 0
+    while True:
+        chunk = list(books.filter(book_id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1].book_id
+
+
+def export_catalog(books, file_format='jsonl', chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the export of a Books queryset line by line.
+    JSONL rows use the full API representation; CSV rows flatten authors
+    and categories to '; '-separated names.
+    """
+    if file_format == 'jsonl':
+        for chunk in iter_book_chunks(books, chunk_size):
+            for row in BookSerializer(chunk, many=True).data:
+                yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+    elif file_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(CSV_COLUMNS)
+        for chunk in iter_book_chunks(books, chunk_size, fields=CSV_COLUMNS):
+            for row in BookSerializer(chunk, many=True, fields=CSV_COLUMNS).data:
+                row['authors'] = '; '.join(row['authors'])
+                row['categories'] = '; '.join(row['categories'])
+                yield writer.writerow([row.get(column) for column in CSV_COLUMNS])
+
+    else:
+        raise ValueError(f'Unsupported export format: {file_format}')
@@ -0,0 +1,299 @@
+import csv
+import io
+import json
+import os
+
+from django.core.exceptions import ValidationError
+from django.db import transaction, DatabaseError
+from django.utils import timezone
+
+from .models import Books, Authors, Catalogs, Publishers, Librarybranches, Bookauthors, Bookcatalogs
+from .search import invalidate_search_index
+
+
+# -----------------------
+# Bulk catalog import
+# -----------------------
+# Streams vendor files (CSV with a header row, or JSON Lines) and upserts
+# books by ISBN in batches. Each batch is validated in memory, checked
+# against the database with one query per referenced table, and written with
+# bulk inserts/updates inside its own transaction.
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+# Rows validated and written per transaction
+IMPORT_BATCH_SIZE = 1000
+
+# Stop listing individual row errors after this many (they are still counted)
+MAX_REPORTED_ERRORS = 1000
+
+# Import column -> Books field
+BOOK_COLUMNS = {
+    'title': 'title',
+    'isbn': 'isbn',
+    'pages': 'pages',
+    'publication_year': 'publication_year',
+    'description': 'description',
+    'publisher': 'publisher_id',
+    'branch': 'branch_id',
+    'available_copies': 'available_copies',
+}
+
+# Fields never overwritten on existing books: the matching key, and the
+# live copy count, which checkouts and returns keep current
+UPDATE_EXCLUDED_FIELDS = {'isbn', 'available_copies'}
+
+# Separators accepted for author/category id lists in CSV cells
+LIST_SEPARATORS = (';', '|')
+
+
+class ImportResult:
+    """Running totals and per-row errors for one import"""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, row_number, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def guess_format(filename):
+    """Guess the import format from a file name (defaults to csv)"""
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension in ('jsonl', 'ndjson', 'json'):
+        return 'jsonl'
+    return 'csv'
+
+
+def read_rows(stream, file_format):
+    """
+    Yield (row_number, row_dict, error) for each record in a binary stream.
+    Rows are read lazily so memory stays flat for large files.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row, None
+    elif file_format == 'jsonl':
+        for line_number, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, None, f'Invalid JSON: {e}'
+                continue
+            if not isinstance(row, dict):
+                yield line_number, None, 'Each line must be a JSON object.'
+                continue
+            yield line_number, row, None
+    else:
+        raise ValueError(f'Unsupported import format: {file_format}')
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _parse_int(value, field, errors):
+    if _blank(value):
+        return None
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        errors[field] = ['A valid integer is required.']
+        return None
+
+
+def _parse_id_list(value, field, errors):
+    """Accept a JSON list or a ';'/'|' separated CSV cell of ids"""
+    if _blank(value):
+        return []
+    if isinstance(value, str):
+        for separator in LIST_SEPARATORS:
+            value = value.replace(separator, ',')
+        value = [part for part in value.split(',') if part.strip()]
+    if not isinstance(value, (list, tuple)):
+        errors[field] = ['Expected a list of ids.']
+        return []
+    ids = []
+    for item in value:
+        item_id = _parse_int(item, field, errors)
+        if item_id is not None:
+            ids.append(item_id)
+    return ids
+
+
+def _clean_row(row):
+    """
+    Build an unsaved Books instance from a raw row.
+    Returns (book, fields, author_ids, category_ids, errors), where `fields`
+    are the Books fields the row gave a value for.
+    """
+    errors = {}
+
+    def text(field):
+        value = row.get(field)
+        return None if _blank(value) else str(value).strip()
+
+    book = Books(
+        title=text('title'),
+        isbn=text('isbn'),
+        pages=_parse_int(row.get('pages'), 'pages', errors),
+        publication_year=text('publication_year'),
+        description=text('description'),
+        publisher_id=_parse_int(row.get('publisher'), 'publisher', errors),
+        branch_id=_parse_int(row.get('branch'), 'branch', errors),
+        available_copies=_parse_int(row.get('available_copies'), 'available_copies', errors),
+    )
+    fields = {field for column, field in BOOK_COLUMNS.items() if not _blank(row.get(column))}
+    author_ids = _parse_id_list(row.get('authors'), 'authors', errors)
+    category_ids = _parse_id_list(row.get('categories'), 'categories', errors)
+
+    if 'isbn' not in fields:
+        errors['isbn'] = ['This field cannot be blank.']
+    # Field-level checks of the given values only; required fields are
+    # checked once we know the row creates a book, foreign keys per batch
+    missing = [field.name for field in Books._meta.fields if field.attname not in fields]
+    try:
+        book.clean_fields(exclude=['publisher', 'branch'] + missing + list(errors))
+    except ValidationError as e:
+        for field, messages in e.message_dict.items():
+            errors.setdefault(field, messages)
+    return book, fields, author_ids, category_ids, errors
+
+
+def _existing_ids(model, ids):
+    if not ids:
+        return set()
+    return set(model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+
+
+def _import_batch(batch, result):
+    """Validate and write one batch of (row_number, book, fields, author_ids, category_ids)"""
+    publishers = _existing_ids(Publishers, {book.publisher_id for _, book, _, _, _ in batch} - {None})
+    branches = _existing_ids(Librarybranches, {book.branch_id for _, book, _, _, _ in batch} - {None})
+    authors = _existing_ids(Authors, {i for _, _, _, ids, _ in batch for i in ids})
+    categories = _existing_ids(Catalogs, {i for _, _, _, _, ids in batch for i in ids})
+    existing = dict(Books.objects.filter(isbn__in=[book.isbn for _, book, _, _, _ in batch])
+                    .values_list('isbn', 'book_id'))
+
+    valid = []
+    for row_number, book, fields, author_ids, category_ids in batch:
+        errors = {}
+        if book.isbn not in existing:
+            # A new book needs every required field
+            try:
+                book.clean_fields(exclude=['publisher', 'branch'])
+            except ValidationError as e:
+                errors.update(e.message_dict)
+        if book.publisher_id is not None and book.publisher_id not in publishers:
+            errors['publisher'] = [f'Publisher {book.publisher_id} does not exist.']
+        if book.branch_id is not None and book.branch_id not in branches:
+            errors['branch'] = [f'Branch {book.branch_id} does not exist.']
+        missing_authors = [i for i in author_ids if i not in authors]
+        if missing_authors:
+            errors['authors'] = [f'Unknown author ids: {missing_authors}']
+        missing_categories = [i for i in category_ids if i not in categories]
+        if missing_categories:
+            errors['categories'] = [f'Unknown category ids: {missing_categories}']
+        if errors:
+            result.add_error(row_number, errors)
+        else:
+            valid.append((book, fields, author_ids, category_ids))
+    if not valid:
+        return
+
+    isbns = [book.isbn for book, _, _, _ in valid]
+    to_create = [book for book, _, _, _ in valid if book.isbn not in existing]
+    # Existing books only get the columns their row supplied, grouped so
+    # each distinct column set is one bulk UPDATE
+    to_update = {}
+    now = timezone.now()
+    for book, fields, _, _ in valid:
+        if book.isbn in existing:
+            book.book_id = existing[book.isbn]
+            # bulk_update doesn't apply auto_now
+            book.updated_at = now
+            to_update.setdefault(frozenset(fields - UPDATE_EXCLUDED_FIELDS), []).append(book)
+
+    with transaction.atomic():
+        Books.objects.bulk_create(to_create)
+        for fields, books in to_update.items():
+            Books.objects.bulk_update(books, sorted(fields) + ['updated_at'])
+        # bulk_create doesn't return ids on every backend, so look them up
+        book_ids = dict(Books.objects.filter(isbn__in=isbns).values_list('isbn', 'book_id'))
+        Bookauthors.objects.bulk_create(
+            [Bookauthors(book_id=book_ids[book.isbn], author_id=author_id)
+             for book, _, author_ids, _ in valid for author_id in set(author_ids)],
+            ignore_conflicts=True,
+        )
+        Bookcatalogs.objects.bulk_create(
+            [Bookcatalogs(book_id=book_ids[book.isbn], catalog_id=category_id)
+             for book, _, _, category_ids in valid for category_id in set(category_ids)],
+            ignore_conflicts=True,
+        )
+    result.created += len(to_create)
+    result.updated += sum(len(books) for books in to_update.values())
+
+
+def import_catalog(stream, file_format='csv', batch_size=IMPORT_BATCH_SIZE):
+    """
+    Import books from a binary stream of CSV or JSONL records.
+
+    Columns: title, isbn, pages, publication_year, description, publisher
+    (id), branch (id), available_copies, authors and categories (id lists).
+    Existing books are matched by ISBN and updated with the columns the row
+    gives a value for (blank or absent columns are left alone, and
+    available_copies is only used for new books); author/category links are
+    added if missing. Returns an ImportResult.
+    """
+    result = ImportResult()
+    seen_isbns = set()
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        try:
+            _import_batch(batch, result)
+        except DatabaseError as e:
+            for row_number, _, _, _, _ in batch:
+                result.add_error(row_number, {'non_field_errors': [f'Database error: {e}']})
+        batch.clear()
+
+    for row_number, row, error in read_rows(stream, file_format):
+        result.rows += 1
+        if error:
+            result.add_error(row_number, {'non_field_errors': [error]})
+            continue
+        book, fields, author_ids, category_ids, errors = _clean_row(row)
+        if not errors and book.isbn in seen_isbns:
+            errors['isbn'] = ['Duplicate ISBN earlier in this file.']
+        if errors:
+            result.add_error(row_number, errors)
+            continue
+        seen_isbns.add(book.isbn)
+        batch.append((row_number, book, fields, author_ids, category_ids))
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    invalidate_search_index()
+    return result
@@ -0,0 +1,903 @@
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    F, Q, Case, When, Value, Count, Sum, Max, Exists, OuterRef, Subquery, DecimalField, Func,
+    prefetch_related_objects,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import (
+    Books, Loans, Loansarchive, Overdueloans, Patroncirculation, Fines, Notifications, Reservations,
+)
+from .outbox import queue_delivery
+
+
+# -----------------------
+# Loan filters
+# -----------------------
+
+LOAN_STATUSES = ('active', 'overdue', 'returned')
+
+
+def _parse_day(value):
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        return None
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def filter_loans(loans, params):
+    """
+    Apply the circulation filters from query params to a Loans queryset:
+    status (active, overdue or returned), user, book, branch, and
+    loaned_from / loaned_to (YYYY-MM-DD, inclusive). Malformed values are
+    ignored. Date bounds are turned into loan_date ranges so they can use
+    an index.
+    """
+    loan_status = params.get('status', None)
+    today = timezone.now().date()
+    if loan_status == 'active':
+        loans = loans.filter(return_date__isnull=True)
+    elif loan_status == 'overdue':
+        loans = loans.filter(return_date__isnull=True, due_date__lt=today)
+    elif loan_status == 'returned':
+        loans = loans.filter(return_date__isnull=False)
+
+    for param, lookup in (('user', 'user_id'), ('book', 'book_id'), ('branch', 'book__branch_id')):
+        value = params.get(param, None)
+        if value and value.isdigit():
+            loans = loans.filter(**{lookup: value})
+
+    loaned_from = _parse_day(params.get('loaned_from', None))
+    loaned_to = _parse_day(params.get('loaned_to', None))
+    if loaned_from:
+        loans = loans.filter(loan_date__gte=_start_of_day(loaned_from))
+    if loaned_to:
+        loans = loans.filter(loan_date__lt=_start_of_day(loaned_to + timedelta(days=1)))
+
+    return loans
+
+
+# -----------------------
+# Overdue loans
+# -----------------------
+# overdue_loans holds every open loan past its due date. Checkout adds
+# loans that are already past due, return removes them, and roll_overdue
+# (run daily, shortly after midnight) adds the loans that fell due since
+# the last run and clears any rows that no longer apply.
+
+# Rows inserted per statement by roll_overdue
+OVERDUE_BATCH_SIZE = 1000
+
+
+def flag_overdue(loans, today):
+    """Record any of `loans` (new, open) that are already past due"""
+    flagged = [loan for loan in loans if loan.due_date < today]
+    if not flagged:
+        return
+    Overdueloans.objects.bulk_create(
+        [Overdueloans(loan_id=loan.pk, user_id=loan.user_id, book_id=loan.book_id, due_date=loan.due_date)
+         for loan in flagged],
+        ignore_conflicts=True,
+    )
+    deltas = {}
+    for loan in flagged:
+        deltas[loan.user_id] = deltas.get(loan.user_id, 0) + 1
+    adjust_circulation({user_id: (0, count, 0) for user_id, count in deltas.items()})
+
+
+def roll_overdue(today=None):
+    """
+    Bring overdue_loans up to date for `today`. Returns the number of
+    loans flagged and cleared.
+    """
+    today = today or timezone.now().date()
+    with transaction.atomic():
+        cleared, _ = Overdueloans.objects.filter(
+            Q(loan__return_date__isnull=False) | Q(loan__due_date__gte=today)
+        ).delete()
+
+        # Open loans past due that aren't flagged yet (uses loans_return_due_idx)
+        missing = Loans.objects.filter(
+            return_date__isnull=True, due_date__lt=today, overdue__isnull=True
+        ).values_list('loan_id', 'user_id', 'book_id', 'due_date')
+        flagged = 0
+        batch = []
+        for loan_id, user_id, book_id, due_date in missing.iterator(chunk_size=OVERDUE_BATCH_SIZE):
+            batch.append(Overdueloans(loan_id=loan_id, user_id=user_id, book_id=book_id, due_date=due_date))
+            if len(batch) >= OVERDUE_BATCH_SIZE:
+                flagged += len(Overdueloans.objects.bulk_create(batch))
+                batch = []
+        flagged += len(Overdueloans.objects.bulk_create(batch))
+
+        # Recount overdue loans for every patron whose count may have changed
+        ensure_circulation(set(Overdueloans.objects.values_list('user_id', flat=True).distinct()))
+        overdue_count = (Overdueloans.objects.filter(user_id=OuterRef('user_id'))
+                         .values('user_id').annotate(n=Count('loan_id')).values('n'))
+        Patroncirculation.objects.filter(
+            Q(overdue_loans__gt=0) | Q(user_id__in=Overdueloans.objects.values('user_id'))
+        ).update(overdue_loans=Coalesce(Subquery(overdue_count), 0))
+    return flagged, cleared
+
+
+# -----------------------
+# Overdue notices
+# -----------------------
+
+# A loan gets another overdue notice once its last one is this many days old
+NOTICE_INTERVAL_DAYS = 7
+# Notices inserted per statement by send_overdue_notices
+NOTICE_BATCH_SIZE = 1000
+
+
+def overdue_notice_message(title, late_days):
+    return (f"Overdue Notice: Your book '{title}' is {late_days} day{'s' if late_days > 1 else ''} overdue. "
+            f"Please return it as soon as possible to avoid additional fines.")
+
+
+def send_overdue_notices(today=None, chunk_size=NOTICE_BATCH_SIZE):
+    """
+    Notify patrons of overdue loans that have had no overdue notice in the
+    last NOTICE_INTERVAL_DAYS days. overdue_loans is rolled forward to
+    `today` first, so loans that fell due since the last roll are included
+    and returned ones are not. One query selects the loans (the recent
+    notice check is an indexed NOT EXISTS on the loan's notifications) and
+    notices are bulk inserted `chunk_size` at a time, each chunk with its
+    email deliveries. The per-day dedupe key makes a concurrent second pass
+    insert (and send) nothing.
+
+    Returns the counts and per-phase timings in milliseconds.
+    """
+    today = today or timezone.now().date()
+    now = timezone.now()
+    timings = {'roll': 0.0, 'select': 0.0, 'insert': 0.0}
+
+    started = time.perf_counter()
+    roll_overdue(today)
+    timings['roll'] = time.perf_counter() - started
+    overdue_count = Overdueloans.objects.count()
+    recent_notice = Notifications.objects.filter(
+        loan_id=OuterRef('loan_id'),
+        event='overdue',
+        created_at__gte=_start_of_day(today - timedelta(days=NOTICE_INTERVAL_DAYS - 1)),
+    )
+    due = (Overdueloans.objects.filter(~Exists(recent_notice))
+           .order_by('loan_id').values_list('loan_id', 'user_id', 'due_date', 'book__title'))
+
+    created = 0
+    batch = []
+    rows = due.iterator(chunk_size=chunk_size)
+    while True:
+        mark = time.perf_counter()
+        for loan_id, user_id, due_date, title in rows:
+            batch.append(Notifications(user_id=user_id,
+                                       message=overdue_notice_message(title, (today - due_date).days),
+                                       notification_type='overdue', created_at=now, is_read=0,
+                                       event='overdue', loan_id=loan_id,
+                                       dedupe_key=f'overdue:{loan_id}:{today.isoformat()}'))
+            if len(batch) >= chunk_size:
+                break
+        timings['select'] += time.perf_counter() - mark
+        if not batch:
+            break
+        mark = time.perf_counter()
+        with transaction.atomic():
+            Notifications.objects.bulk_create(batch, ignore_conflicts=True)
+            # Only what this pass inserted (a concurrent pass has its own `now`)
+            inserted = list(Notifications.objects.filter(dedupe_key__in=[n.dedupe_key for n in batch],
+                                                         created_at=now))
+            queue_delivery(inserted)
+        created += len(inserted)
+        timings['insert'] += time.perf_counter() - mark
+        batch = []
+    timings['total'] = time.perf_counter() - started
+
+    return {
+        'overdue_loans': overdue_count,
+        'created': created,
+        'skipped': overdue_count - created,
+        'timings_ms': {phase: round(seconds * 1000, 1) for phase, seconds in timings.items()},
+    }
+
+
+# -----------------------
+# Patron circulation summary
+# -----------------------
+# patron_circulation keeps each patron's active loans, overdue loans and
+# unpaid fine balance, so checkout can enforce limits with one conditional
+# UPDATE instead of aggregating loans and fines. Every write path below
+# adjusts it in the same transaction; a missing row is built from the live
+# tables on first use, and reconcile_circulation repairs any drift.
+
+# Checkout limits
+MAX_ACTIVE_LOANS = 10
+MAX_FINE_BALANCE = Decimal('10.00')
+
+
+def compute_circulation(user_ids=None):
+    """
+    Recompute {user_id: [active_loans, overdue_loans, fine_balance]} from
+    the live tables with one grouped query each (all patrons by default).
+    """
+    sources = [
+        (Loans.objects.filter(return_date__isnull=True), Count('loan_id')),
+        (Overdueloans.objects.all(), Count('loan_id')),
+        (Fines.objects.filter(paid=0), Sum('amount')),
+    ]
+    totals = {}
+    for i, (queryset, aggregate) in enumerate(sources):
+        if user_ids is not None:
+            queryset = queryset.filter(user_id__in=user_ids)
+        for user_id, value in queryset.order_by().values('user_id').annotate(value=aggregate) \
+                                      .values_list('user_id', 'value'):
+            totals.setdefault(user_id, [0, 0, Decimal('0.00')])[i] = value
+    return totals
+
+
+def ensure_circulation(user_ids):
+    """Create summary rows (from live data) for any of these patrons lacking one"""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    missing = user_ids - set(
+        Patroncirculation.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True)
+    )
+    if not missing:
+        return
+    totals = compute_circulation(missing)
+    Patroncirculation.objects.bulk_create(
+        [Patroncirculation(user_id=user_id, active_loans=active, overdue_loans=overdue, fine_balance=balance)
+         for user_id, (active, overdue, balance) in
+         ((user_id, totals.get(user_id, (0, 0, Decimal('0.00')))) for user_id in missing)],
+        ignore_conflicts=True,
+    )
+
+
+def adjust_circulation(deltas):
+    """
+    Apply {user_id: (active_loans, overdue_loans, fine_balance)} deltas to
+    the patrons' summaries with one UPDATE.
+
+    Callers must ensure_circulation() the patrons before writing the loans,
+    overdue rows or fines the deltas describe: a summary built afterwards
+    would already count the change, and the delta would count it twice.
+    """
+    if not deltas:
+        return
+
+    def delta(i, output_field=None):
+        return Case(*[When(user_id=user_id, then=Value(values[i])) for user_id, values in deltas.items()],
+                    default=Value(0), output_field=output_field)
+
+    Patroncirculation.objects.filter(user_id__in=deltas).update(
+        active_loans=F('active_loans') + delta(0),
+        overdue_loans=F('overdue_loans') + delta(1),
+        fine_balance=F('fine_balance') + delta(2, DecimalField(max_digits=10, decimal_places=2)),
+    )
+
+
+def adjust_fine_balance(user_id, amount):
+    """Add `amount` (negative to reduce) to a patron's unpaid fine balance"""
+    adjust_circulation({user_id: (0, 0, amount)})
+
+
+def claim_loan_slot(user_id, count=1):
+    """
+    Count `count` more active loans for a patron if that stays within the
+    loan limit and their fine balance is under the threshold. One UPDATE;
+    returns True if the slots were claimed.
+    """
+    return Patroncirculation.objects.filter(
+        user_id=user_id,
+        active_loans__lte=MAX_ACTIVE_LOANS - count,
+        fine_balance__lte=MAX_FINE_BALANCE,
+    ).update(active_loans=F('active_loans') + count) == 1
+
+
+def checkout_block_reason(stats):
+    """Why a patron's summary blocks checkout, or None"""
+    if stats.fine_balance > MAX_FINE_BALANCE:
+        return (f'Outstanding fines of ${stats.fine_balance:.2f} exceed the '
+                f'${MAX_FINE_BALANCE:.2f} limit.')
+    if stats.active_loans >= MAX_ACTIVE_LOANS:
+        return f'Loan limit reached ({MAX_ACTIVE_LOANS} active loans).'
+    return None
+
+
+def reconcile_circulation(fix=True):
+    """
+    Recompute every patron's summary set-wise and compare it with the
+    stored one. Returns a list of (user_id, stored, actual) for drifted
+    patrons; with `fix`, stored values are corrected.
+    """
+    zero = (0, 0, Decimal('0.00'))
+    actual = compute_circulation()
+    stored = {
+        row.user_id: row
+        for row in Patroncirculation.objects.all()
+    }
+    drift = []
+    to_update = []
+    to_create = []
+    for user_id in set(actual) | set(stored):
+        values = tuple(actual.get(user_id, zero))
+        row = stored.get(user_id)
+        if row is None:
+            drift.append((user_id, None, values))
+            to_create.append(Patroncirculation(user_id=user_id, active_loans=values[0],
+                                               overdue_loans=values[1], fine_balance=values[2]))
+        elif (row.active_loans, row.overdue_loans, row.fine_balance) != values:
+            drift.append((user_id, (row.active_loans, row.overdue_loans, row.fine_balance), values))
+            row.active_loans, row.overdue_loans, row.fine_balance = values
+            to_update.append(row)
+    if fix:
+        with transaction.atomic():
+            Patroncirculation.objects.bulk_create(to_create, batch_size=1000, ignore_conflicts=True)
+            Patroncirculation.objects.bulk_update(
+                to_update, ['active_loans', 'overdue_loans', 'fine_balance'], batch_size=1000
+            )
+    return sorted(drift, key=lambda item: item[0])
+
+
+# -----------------------
+# Checkout
+# -----------------------
+# A copy is claimed with a single conditional UPDATE
+# (available_copies = available_copies - 1 WHERE available_copies > 0) in the
+# same transaction as the loan insert. The UPDATE takes the book's row lock,
+# so concurrent checkouts of the same title queue behind each other and can
+# never push the count below zero: once the last copy is taken, every later
+# claim matches no row and fails with NoCopiesAvailable.
+
+class CheckoutError(Exception):
+    """Base class for reasons a checkout is refused"""
+
+
+class NoCopiesAvailable(CheckoutError):
+    """Raised when a checkout finds no available copies of the book"""
+
+    def __init__(self, book_id):
+        self.book_id = book_id
+        super().__init__('No available copies for this book.')
+
+
+class CheckoutBlocked(CheckoutError):
+    """Raised when a patron is over the loan limit or owes too much in fines"""
+
+
+def claim_copy(book_id, now=None):
+    """Atomically take one copy of a book. Returns True if a copy was claimed."""
+    # queryset updates skip auto_now, so bump the row version here
+    return Books.objects.filter(pk=book_id, available_copies__gt=0).update(
+        available_copies=F('available_copies') - 1,
+        updated_at=now or timezone.now(),
+    ) == 1
+
+
+def checkout(user, book, due_date):
+    """
+    Lend one copy of `book` to `user`, returning the new loan.
+    Raises CheckoutBlocked if the patron is at a limit, or NoCopiesAvailable
+    if no copy is free; either way nothing is written.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        if not claim_loan_slot(user.pk):
+            # Either blocked, or the patron has no summary row yet
+            ensure_circulation([user.pk])
+            if not claim_loan_slot(user.pk):
+                raise CheckoutBlocked(checkout_block_reason(Patroncirculation.objects.get(user_id=user.pk)))
+        if not claim_copy(book.pk, now):
+            raise NoCopiesAvailable(book.pk)
+        loan = Loans(user=user, book=book, loan_date=now, due_date=due_date)
+        loan.save()
+        flag_overdue([loan], now.date())
+    return loan
+
+
+# -----------------------
+# Batch checkout
+# -----------------------
+
+def _adjust_copies(counts, now):
+    """Add counts[book_id] (negative to take) to each book's copies with one UPDATE"""
+    Books.objects.filter(pk__in=counts).update(
+        available_copies=F('available_copies') + Case(
+            *[When(pk=book_id, then=Value(count)) for book_id, count in counts.items()]
+        ),
+        updated_at=now,
+    )
+
+
+# Most books a single desk transaction may lend
+MAX_BATCH_CHECKOUT = 20
+
+
+def checkout_many(user, items):
+    """
+    Lend several books to one patron in a single transaction.
+
+    `items` is a list of (book_id, due_date). The requested book rows are
+    locked (in book_id order, so overlapping batches can't deadlock), copies
+    are allocated in request order, availability is decremented with one
+    UPDATE and the loans are bulk inserted. Items that can't be satisfied
+    are skipped. Returns a list of (book_id, loan or None, error or None)
+    in request order.
+    """
+    now = timezone.now()
+    book_ids = {book_id for book_id, _ in items}
+
+    with transaction.atomic():
+        # Lock the patron's summary first, as single checkouts do
+        stats = Patroncirculation.objects.select_for_update().filter(user_id=user.pk).first()
+        if stats is None:
+            ensure_circulation([user.pk])
+            stats = Patroncirculation.objects.select_for_update().get(user_id=user.pk)
+        blocked = checkout_block_reason(stats)
+        allowance = 0 if blocked else MAX_ACTIVE_LOANS - stats.active_loans
+
+        books = {
+            book.book_id: book
+            for book in Books.objects.select_for_update().filter(pk__in=book_ids).order_by('book_id')
+        }
+
+        remaining = {book_id: book.available_copies for book_id, book in books.items()}
+        results = []
+        loans = []
+        for book_id, due_date in items:
+            book = books.get(book_id)
+            if book is None:
+                results.append((book_id, None, 'Book not found.'))
+            elif len(loans) >= allowance:
+                results.append((book_id, None, blocked or f'Loan limit reached ({MAX_ACTIVE_LOANS} active loans).'))
+            elif remaining[book_id] <= 0:
+                results.append((book_id, None, 'No available copies for this book.'))
+            else:
+                remaining[book_id] -= 1
+                loan = Loans(user=user, book=book, loan_date=now, due_date=due_date)
+                loans.append(loan)
+                results.append((book_id, loan, None))
+
+        if loans:
+            taken = {book_id: remaining[book_id] - book.available_copies
+                     for book_id, book in books.items() if remaining[book_id] != book.available_copies}
+            _adjust_copies(taken, now)
+            Patroncirculation.objects.filter(user_id=user.pk).update(
+                active_loans=F('active_loans') + len(loans)
+            )
+            Loans.objects.bulk_create(loans)
+
+            if loans[0].pk is None:
+                # bulk_create doesn't return ids on every backend, so look them up
+                # (this batch's loans are the only ones stamped with `now`)
+                created = Loans.objects.filter(user=user, loan_date=now).order_by('loan_id')
+                unassigned = {}
+                for loan_id, book_id in created.values_list('loan_id', 'book_id'):
+                    unassigned.setdefault(book_id, []).append(loan_id)
+                for loan in loans:
+                    loan.pk = unassigned[loan.book_id].pop(0)
+
+            flag_overdue(loans, now.date())
+
+        for book_id, count in remaining.items():
+            books[book_id].available_copies = count
+
+    return results
+
+
+# -----------------------
+# Reservation queue
+# -----------------------
+# Pending reservations for a title carry a queue_position (1 = next in
+# line), kept contiguous as reservations join and leave the queue, so the
+# next patron is an indexed (book_id, queue_position) lookup and a patron's
+# place in line needs no counting. Other statuses have no position.
+
+
+def reserve(user, book, reservation_status='pending'):
+    """Create a reservation, at the back of the title's queue if pending"""
+    with transaction.atomic():
+        position = None
+        if reservation_status == 'pending':
+            # Lock the title so concurrent reservations get distinct positions
+            Books.objects.select_for_update().filter(pk=book.pk).exists()
+            last = Reservations.objects.filter(book=book, queue_position__isnull=False) \
+                                       .aggregate(last=Max('queue_position'))['last']
+            position = (last or 0) + 1
+        now = timezone.now()
+        reservation = Reservations(user=user, book=book, reservation_date=now,
+                                   status=reservation_status, queue_position=position,
+                                   ready_date=now if reservation_status == 'ready' else None)
+        reservation.save()
+    return reservation
+
+
+def _close_queue_gaps(left):
+    """Move up the queues `left` ({book_id: [positions vacated]}) with one UPDATE"""
+    if not left:
+        return
+    # Each remaining reservation moves up by the number of vacated positions
+    # ahead of it: test the furthest-back vacated position first
+    whens = []
+    for book_id, positions in left.items():
+        positions = sorted(positions, reverse=True)
+        whens += [When(book_id=book_id, queue_position__gt=position, then=Value(len(positions) - i))
+                  for i, position in enumerate(positions)]
+    Reservations.objects.filter(book_id__in=left, queue_position__isnull=False).update(
+        queue_position=F('queue_position') - Case(*whens, default=Value(0))
+    )
+
+
+def set_reservation_status(reservation, new_status):
+    """Change a reservation's status, taking it out of its queue if it leaves 'pending'"""
+    with transaction.atomic():
+        # Same title lock as reserve(), so positions don't shift underneath us;
+        # then re-read where the reservation stands now
+        Books.objects.select_for_update().filter(pk=reservation.book_id).exists()
+        reservation.refresh_from_db(fields=['status', 'queue_position'])
+        position = reservation.queue_position
+        if new_status == 'ready' and reservation.status != 'ready':
+            reservation.ready_date = timezone.now()
+        reservation.status = new_status
+        if new_status != 'pending':
+            reservation.queue_position = None
+        reservation.save()
+        if position is not None and reservation.queue_position is None:
+            _close_queue_gaps({reservation.book_id: [position]})
+    return reservation
+
+
+def reservation_ready_message(book):
+    return f"Book '{book.title}' is now available! Your reservation is ready."
+
+
+def promote_reservations(copies, now):
+    """
+    Mark the head of each title's queue ready, one reservation per copy
+    freed ({book_id: copies}): a title lock, one indexed lookup and two
+    UPDATEs. Returns the (unsaved) ready notifications. Must run inside a
+    transaction.
+    """
+    # Take reserve()'s title locks (in id order) so the queues hold still
+    list(Books.objects.select_for_update().filter(pk__in=copies).order_by('pk').values_list('pk', flat=True))
+    heads = Q()
+    for book_id, count in copies.items():
+        heads |= Q(book_id=book_id, queue_position__lte=count)
+    promoted = []
+    left = {}
+    notifications = []
+    for reservation in Reservations.objects.filter(heads).select_related('book'):
+        promoted.append(reservation.pk)
+        left.setdefault(reservation.book_id, []).append(reservation.queue_position)
+        notifications.append(Notifications(user_id=reservation.user_id,
+                                           message=reservation_ready_message(reservation.book),
+                                           notification_type='reservation',
+                                           created_at=now, is_read=0,
+                                           event='reservation_ready', reservation_id=reservation.pk,
+                                           dedupe_key=f'reservation_ready:{reservation.pk}'))
+    if promoted:
+        Reservations.objects.filter(pk__in=promoted).update(status='ready', queue_position=None, ready_date=now)
+        _close_queue_gaps(left)
+    return notifications
+
+
+# -----------------------
+# Ready reservation expiry
+# -----------------------
+# A ready reservation holds a copy on the shelf for PICKUP_WINDOW_DAYS.
+# expire_reservations (run by the expire_reservations command) expires
+# uncollected ones in one UPDATE and passes each copy to the next in line.
+
+PICKUP_WINDOW_DAYS = 7
+# Titles promoted per query by expire_reservations
+EXPIRY_BATCH_SIZE = 500
+
+
+def expired_message(title):
+    return f"Your reservation for '{title}' has expired because it was not collected."
+
+
+def expire_reservations(pickup_days=PICKUP_WINDOW_DAYS, now=None):
+    """
+    Expire ready reservations made ready more than `pickup_days` ago,
+    promote the next pending reservation for each copy released and notify
+    both patrons. Returns (expired, promoted).
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=pickup_days)
+    with transaction.atomic():
+        stale = Reservations.objects.filter(status='ready', ready_date__lt=cutoff)
+        rows = list(stale.select_for_update(of=('self',))
+                    .values_list('reservation_id', 'user_id', 'book_id', 'book__title'))
+        if not rows:
+            return 0, 0
+        stale.update(status='expired')
+
+        notifications = [Notifications(user_id=user_id, message=expired_message(title),
+                                       notification_type='reservation', created_at=now, is_read=0,
+                                       event='reservation_expired', reservation_id=reservation_id,
+                                       dedupe_key=f'reservation_expired:{reservation_id}')
+                         for reservation_id, user_id, _, title in rows]
+        released = {}
+        for _, _, book_id, _ in rows:
+            released[book_id] = released.get(book_id, 0) + 1
+        book_ids = list(released)
+        promoted = 0
+        for i in range(0, len(book_ids), EXPIRY_BATCH_SIZE):
+            ready = promote_reservations({book_id: released[book_id]
+                                          for book_id in book_ids[i:i + EXPIRY_BATCH_SIZE]}, now)
+            promoted += len(ready)
+            notifications += ready
+        Notifications.objects.bulk_create(notifications, batch_size=1000)
+        queue_delivery(notifications)
+    return len(rows), promoted
+
+
+# -----------------------
+# Bulk return
+# -----------------------
+
+# $1.00 per day late, minimum $1.00
+FINE_PER_DAY = Decimal('1.00')
+MIN_FINE = Decimal('1.00')
+
+
+def late_fine(late_days):
+    """Fine owed for a return `late_days` days after the due date"""
+    return max(MIN_FINE, late_days * FINE_PER_DAY)
+
+
+def fine_message(loan, amount, late_days):
+    return (f"Fine of ${amount:.2f} issued for late return of '{loan.book.title}' "
+            f"({late_days} day{'s' if late_days > 1 else ''} late).")
+
+
+def return_many(loan_ids=(), isbns=()):
+    """
+    Check in a batch of loans, identified by loan id or by the ISBN of the
+    book handed back (the open loan due soonest is closed for each ISBN).
+
+    Work is done set-wise in one transaction, with a fixed number of queries
+    however many items are returned: late fines and notices are bulk
+    inserted, loans and book copies are updated with one UPDATE each, and
+    the reservations at the head of each returned title's queue are marked
+    ready (one per copy returned).
+
+    Returns one dict per requested item, in request order: loan ids first,
+    then ISBNs. Each has the `loan`, `late_days`, `fine_amount` and
+    `fine_created`, or an `error`.
+    """
+    now = timezone.now()
+    today = now.date()
+    results = []
+
+    with transaction.atomic():
+        # Resolve the requested items to open loans
+        by_id = {}
+        if loan_ids:
+            by_id = Loans.objects.select_for_update().select_related('book', 'user').in_bulk(set(loan_ids))
+        open_by_isbn = {}
+        if isbns:
+            open_loans = (Loans.objects.select_for_update().select_related('book', 'user')
+                          .filter(book__isbn__in=set(isbns), return_date__isnull=True)
+                          .order_by('due_date', 'loan_id'))
+            for loan in open_loans:
+                open_by_isbn.setdefault(loan.book.isbn, []).append(loan)
+
+        loans = []
+        seen = set()
+        for loan_id in loan_ids:
+            loan = by_id.get(loan_id)
+            if loan is None:
+                results.append({'loan_id': loan_id, 'error': 'Loan not found.'})
+            elif loan.return_date or loan.pk in seen:
+                results.append({'loan_id': loan_id, 'error': 'This book has already been returned.'})
+            else:
+                seen.add(loan.pk)
+                loans.append(loan)
+                results.append({'loan_id': loan_id, 'loan': loan})
+        for isbn in isbns:
+            queue = [loan for loan in open_by_isbn.get(isbn, []) if loan.pk not in seen]
+            if not queue:
+                results.append({'isbn': isbn, 'error': 'No open loan for this ISBN.'})
+                continue
+            loan = queue[0]
+            seen.add(loan.pk)
+            loans.append(loan)
+            results.append({'isbn': isbn, 'loan': loan})
+
+        if not loans:
+            return results
+        # Summaries must exist before the writes below (see adjust_circulation)
+        ensure_circulation({loan.user_id for loan in loans})
+
+        # Late fines and fine notices, skipping loans that already have a fine
+        late = [loan for loan in loans if today > loan.due_date]
+        already_fined = set(
+            Fines.objects.filter(loan__in=late).values_list('loan_id', flat=True)
+        ) if late else set()
+        fines = []
+        notifications = []
+        fined = {}
+        for loan in late:
+            late_days = (today - loan.due_date).days
+            amount = late_fine(late_days)
+            fined[loan.pk] = (late_days, amount, loan.pk not in already_fined)
+            if loan.pk not in already_fined:
+                fines.append(Fines(user_id=loan.user_id, loan=loan, amount=amount,
+                                   paid=0, date_issued=now))
+                notifications.append(Notifications(user_id=loan.user_id,
+                                                   message=fine_message(loan, amount, late_days),
+                                                   notification_type='overdue',
+                                                   created_at=now, is_read=0,
+                                                   event='fine_issued', loan_id=loan.pk,
+                                                   dedupe_key=f'fine_issued:{loan.pk}'))
+
+        returned_ids = [loan.pk for loan in loans]
+        Loans.objects.filter(pk__in=returned_ids).update(return_date=today)
+        was_overdue = list(Overdueloans.objects.filter(loan_id__in=returned_ids).values_list('user_id', flat=True))
+        Overdueloans.objects.filter(loan_id__in=returned_ids).delete()
+
+        # Patron summaries: fewer active/overdue loans, more fines owed
+        deltas = {}
+        for loan in loans:
+            deltas.setdefault(loan.user_id, [0, 0, Decimal('0.00')])[0] -= 1
+        for user_id in was_overdue:
+            deltas[user_id][1] -= 1
+        for fine in fines:
+            deltas[fine.user_id][2] += fine.amount
+        adjust_circulation(deltas)
+
+        returned = {}
+        for loan in loans:
+            loan.return_date = today
+            returned[loan.book_id] = returned.get(loan.book_id, 0) + 1
+        _adjust_copies(returned, now)
+
+        # Each copy returned moves the next reservation in its title's queue to ready
+        notifications += promote_reservations(returned, now)
+
+        Fines.objects.bulk_create(fines)
+        if fines:
+            # Link the fine notices (MySQL doesn't return ids from bulk inserts)
+            fine_ids = {fine.loan_id: fine.pk for fine in fines}
+            if None in fine_ids.values():
+                fine_ids = dict(Fines.objects.filter(loan_id__in=fine_ids).values_list('loan_id', 'fine_id'))
+            for notification in notifications:
+                if notification.event == 'fine_issued':
+                    notification.fine_id = fine_ids[notification.loan_id]
+        Notifications.objects.bulk_create(notifications)
+        queue_delivery(notifications)
+
+    for result in results:
+        loan = result.get('loan')
+        if loan:
+            late_days, amount, created = fined.get(loan.pk, (0, None, False))
+            result.update(late_days=late_days, fine_amount=amount, fine_created=created)
+    return results
+
+
+# -----------------------
+# Loan archive
+# -----------------------
+# Returned loans older than ARCHIVE_AFTER_DAYS move to loans_archive, keeping
+# their loan_id (fines reference it). Each chunk is moved in its own short
+# transaction so the job can run while the desk is open.
+
+ARCHIVE_AFTER_DAYS = 365
+ARCHIVE_CHUNK_SIZE = 500
+
+# Columns shared by Loans and Loansarchive
+LOAN_COLUMNS = ['loan_id', 'user_id', 'book_id', 'loan_date', 'due_date', 'return_date']
+
+
+def archive_loans(older_than_days=ARCHIVE_AFTER_DAYS, chunk_size=ARCHIVE_CHUNK_SIZE, pause=0):
+    """
+    Move loans returned more than `older_than_days` ago to loans_archive in
+    chunks of `chunk_size`, sleeping `pause` seconds between chunks.
+    Returns the number of loans moved.
+    """
+    cutoff = timezone.now().date() - timedelta(days=older_than_days)
+    moved = 0
+    while True:
+        with transaction.atomic():
+            # Uses loans_return_due_idx; locks only this chunk's rows
+            rows = list(
+                Loans.objects.select_for_update()
+                .filter(return_date__lt=cutoff)
+                .order_by('return_date', 'loan_id')
+                .values_list(*LOAN_COLUMNS)[:chunk_size]
+            )
+            if not rows:
+                return moved
+            Loansarchive.objects.bulk_create(
+                [Loansarchive(**dict(zip(LOAN_COLUMNS, row))) for row in rows],
+                ignore_conflicts=True,
+            )
+            Loans.objects.filter(pk__in=[row[0] for row in rows]).delete()
+        moved += len(rows)
+        if len(rows) < chunk_size:
+            return moved
+        if pause:
+            time.sleep(pause)
+
+
+class LoanHistory:
+    """
+    A patron's live and archived loans, queried as one ordered set.
+
+    Supports the subset of the QuerySet API that the listing and cursor
+    pagination use (filter, order_by, slicing, iteration). Filters are
+    applied to both tables before the UNION ALL; rows come back as Loans
+    instances with user and book prefetched.
+    """
+
+    def __init__(self, live, archived, ordering=('-loan_date', '-loan_id')):
+        self.live = live
+        self.archived = archived
+        self.ordering = ordering
+
+    def filter(self, *args, **kwargs):
+        return LoanHistory(self.live.filter(*args, **kwargs),
+                           self.archived.filter(*args, **kwargs), self.ordering)
+
+    def order_by(self, *ordering):
+        return LoanHistory(self.live, self.archived, ordering)
+
+    def _union(self):
+        return self.live.order_by().union(self.archived.order_by(), all=True).order_by(*self.ordering)
+
+    def _fetch(self, queryset):
+        loans = list(queryset)
+        prefetch_related_objects(loans, 'user', 'book')
+        return loans
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return self._fetch(self._union()[k])
+        return self._fetch(self._union()[k:k + 1])[0]
+
+    def __iter__(self):
+        return iter(self._fetch(self._union()))
+
+
+def loan_history(user_id, params):
+    """One patron's live and archived loans, with the circulation filters applied"""
+    return LoanHistory(
+        filter_loans(Loans.objects.filter(user_id=user_id), params),
+        filter_loans(Loansarchive.objects.filter(user_id=user_id), params),
+    )
+
+
+def loan_status_counts(loans):
+    """
+    Count a Loans queryset (or LoanHistory) by status with one aggregate
+    query: {all, active, overdue, returned}. Archived loans, all returned,
+    are counted by a subquery inside the same statement.
+    """
+    today = timezone.now().date()
+    archived = None
+    if isinstance(loans, LoanHistory):
+        loans, archived = loans.live, loans.archived
+    counts = {
+        'all': Count('loan_id'),
+        'active': Count('loan_id', filter=Q(return_date__isnull=True)),
+        'overdue': Count('loan_id', filter=Q(return_date__isnull=True, due_date__lt=today)),
+        'returned': Count('loan_id', filter=Q(return_date__isnull=False)),
+    }
+    if archived is not None:
+        archived_count = Coalesce(Subquery(
+            archived.order_by().annotate(n=Func('loan_id', function='COUNT')).values('n')
+        ), 0)
+        counts['all'] = counts['all'] + archived_count
+        counts['returned'] = counts['returned'] + archived_count
+    return loans.order_by().aggregate(**counts)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from app.circulation import archive_loans, ARCHIVE_AFTER_DAYS, ARCHIVE_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        "Move returned loans older than --older-than-days to loans_archive, "
+        "in small chunks that each commit on their own"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=ARCHIVE_AFTER_DAYS,
+                            help="Archive loans returned more than this many days ago")
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE,
+                            help="Loans moved per transaction")
+        parser.add_argument('--pause', type=float, default=0,
+                            help="Seconds to sleep between chunks")
+
+    def handle(self, *args, **options):
+        moved = archive_loans(options['older_than_days'], options['chunk_size'], options['pause'])
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} loans."))
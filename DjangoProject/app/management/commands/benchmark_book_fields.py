@@ -0,0 +1,83 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from app.models import Authors, Books, Bookauthors, Bookcatalogs, Catalogs, Librarybranches, Publishers
+from app.serializers import BookSerializer
+
+# (label, fields, expand) for each representation measured
+SCENARIOS = [
+    ("full (default)", None, None),
+    ("grid: fields=book_id,title,status,authors", ['book_id', 'title', 'status', 'authors'], None),
+    ("grid + expand=authors", ['book_id', 'title', 'status', 'authors'], ['authors']),
+    ("ids only: fields=book_id,title", ['book_id', 'title'], None),
+]
+
+ISBN_PREFIX = 'BENCH-'
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare payload size and latency of the book list for full vs sparse "
+        "fieldsets on a synthetic catalog. Test data is created inside a "
+        "transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000, help="Number of synthetic books")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per scenario (median is reported)")
+
+    def seed(self, count):
+        publisher = Publishers.objects.create(name="Benchmark Press")
+        branch = Librarybranches.objects.create(branch_name="Benchmark Branch", address="1 Bench St")
+        authors = [
+            Authors.objects.create(first_name=f"First{i}", last_name=f"Last{i}", bio="Author biography. " * 10)
+            for i in range(50)
+        ]
+        catalogs = [
+            Catalogs.objects.create(category_name=f"Benchmark Category {i}", description="Category description. " * 5)
+            for i in range(20)
+        ]
+        Books.objects.bulk_create(
+            [Books(title=f"Benchmark Book {i}", isbn=f"{ISBN_PREFIX}{i}", pages=300,
+                   publication_year="2001", description="A longer description of the book. " * 10,
+                   publisher=publisher, branch=branch, available_copies=i % 3)
+             for i in range(count)],
+            batch_size=1000,
+        )
+        book_ids = list(Books.objects.filter(isbn__startswith=ISBN_PREFIX).values_list('book_id', flat=True))
+        Bookauthors.objects.bulk_create(
+            [Bookauthors(book_id=book_id, author=authors[(i + k) % len(authors)])
+             for i, book_id in enumerate(book_ids) for k in range(2)],
+            batch_size=1000,
+        )
+        Bookcatalogs.objects.bulk_create(
+            [Bookcatalogs(book_id=book_id, catalog=catalogs[(i + k) % len(catalogs)])
+             for i, book_id in enumerate(book_ids) for k in range(2)],
+            batch_size=1000,
+        )
+
+    def handle(self, *args, **options):
+        renderer = JSONRenderer()
+        with transaction.atomic():
+            self.stdout.write(f"Seeding {options['books']} books...")
+            self.seed(options['books'])
+
+            self.stdout.write(f"{'scenario':<45} {'payload':>12} {'latency':>10}")
+            for label, fields, expand in SCENARIOS:
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    books = BookSerializer.setup_eager_loading(
+                        Books.objects.filter(isbn__startswith=ISBN_PREFIX), fields
+                    )
+                    payload = renderer.render(BookSerializer(books, many=True, fields=fields, expand=expand).data)
+                    timings.append(time.perf_counter() - start)
+                self.stdout.write(
+                    f"{label:<45} {len(payload) / 1024:>8.0f} KiB {statistics.median(timings) * 1000:>7.0f} ms"
+                )
+
+            transaction.set_rollback(True)
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.circulation import return_many
+
+
+class Command(BaseCommand):
+    help = (
+        "Check in a batch of returned books (e.g. the overnight return bin) "
+        "by loan id or ISBN, issuing fines and advancing reservation queues"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loan', type=int, action='append', default=[], dest='loan_ids',
+                            help="Loan id to return (repeatable)")
+        parser.add_argument('--isbn', action='append', default=[], dest='isbns',
+                            help="ISBN of a returned book (repeatable)")
+        parser.add_argument('--isbn-file',
+                            help="File with one scanned ISBN per line")
+
+    def handle(self, *args, **options):
+        isbns = list(options['isbns'])
+        if options['isbn_file']:
+            try:
+                with open(options['isbn_file'], encoding='utf-8') as f:
+                    isbns += [line.strip() for line in f if line.strip()]
+            except OSError as e:
+                raise CommandError(f"Cannot open {options['isbn_file']}: {e}")
+        if not options['loan_ids'] and not isbns:
+            raise CommandError("Give at least one --loan, --isbn or --isbn-file.")
+
+        start = time.perf_counter()
+        results = return_many(loan_ids=options['loan_ids'], isbns=isbns)
+        elapsed = time.perf_counter() - start
+
+        returned = [r for r in results if 'loan' in r]
+        for result in results:
+            if 'error' in result:
+                ref = result.get('loan_id', result.get('isbn'))
+                self.stderr.write(f"{ref}: {result['error']}")
+        fines = sum(1 for r in returned if r['fine_created'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Returned {len(returned)} of {len(results)} items, issued {fines} fines "
+            f"in {elapsed * 1000:.0f} ms."
+        ))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.outbox import drain_outbox, OUTBOX_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        "Email notifications waiting in the outbox with a pool of worker threads. "
+        "Drains what is due and exits, or keeps polling with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help="Delivery threads, each with its own SMTP connection")
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE,
+                            help="Rows claimed and sent per SMTP session")
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep running, polling the outbox every --interval seconds")
+        parser.add_argument('--interval', type=float, default=5,
+                            help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            totals = drain_outbox(options['workers'], options['batch_size'])
+            if any(totals.values()) or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Sent {totals['sent']}, rescheduled {totals['retried']}, dead-lettered {totals['dead']}."
+                ))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from app.circulation import expire_reservations, PICKUP_WINDOW_DAYS
+
+
+class Command(BaseCommand):
+    help = (
+        "Expire ready reservations not collected within the pickup window and "
+        "pass each released copy to the next reservation in line. Run daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=PICKUP_WINDOW_DAYS,
+                            help="Pickup window, in days after the reservation became ready")
+
+    def handle(self, *args, **options):
+        expired, promoted = expire_reservations(options['days'])
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} reservations, promoted {promoted}."))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.catalog_export import export_catalog, EXPORT_FORMATS, EXPORT_CHUNK_SIZE
+from app.models import Books
+
+
+class Command(BaseCommand):
+    help = "Stream the full catalog to a JSONL or CSV file (or stdout) in bounded chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='jsonl', dest='file_format',
+                            help="Output format (default: jsonl)")
+        parser.add_argument('--output', help="File to write (default: stdout)")
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+                            help="Books read per query")
+        parser.add_argument('--include-deleted', action='store_true',
+                            help="Also export soft-deleted books")
+
+    def handle(self, *args, **options):
+        books = Books.objects.all()
+        if not options['include_deleted']:
+            books = books.filter(is_deleted=False)
+
+        path = options['output']
+        try:
+            stream = open(path, 'w', encoding='utf-8', newline='') if path else None
+        except OSError as e:
+            raise CommandError(f"Cannot open {path}: {e}")
+
+        lines = 0
+        try:
+            for line in export_catalog(books, options['file_format'], chunk_size=options['chunk_size']):
+                if stream:
+                    stream.write(line)
+                else:
+                    self.stdout.write(line, ending='')
+                lines += 1
+        finally:
+            if stream:
+                stream.close()
+
+        if path:
+            self.stdout.write(self.style.SUCCESS(f"Wrote {lines} lines to {path}."))
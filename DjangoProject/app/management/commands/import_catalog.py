@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.catalog_import import import_catalog, guess_format, IMPORT_FORMATS, IMPORT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Bulk import books from a CSV or JSONL vendor file, upserting by ISBN"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Path to the CSV or JSONL file")
+        parser.add_argument('--format', choices=IMPORT_FORMATS, dest='file_format',
+                            help="File format (guessed from the extension by default)")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+                            help="Rows written per transaction")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or guess_format(path)
+        try:
+            stream = open(path, 'rb')
+        except OSError as e:
+            raise CommandError(f"Cannot open {path}: {e}")
+
+        with stream:
+            result = import_catalog(stream, file_format, batch_size=options['batch_size'])
+
+        for error in result.errors:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        if result.error_count > len(result.errors):
+            self.stderr.write(f"... {result.error_count - len(result.errors)} more errors not shown")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.rows} rows: {result.created} created, "
+            f"{result.updated} updated, {result.error_count} errors."
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from app.circulation import reconcile_circulation
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every patron's circulation summary (active loans, overdue "
+        "loans, unpaid fines) from the live tables and correct any drift"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report drift without correcting it")
+
+    def handle(self, *args, **options):
+        drift = reconcile_circulation(fix=not options['dry_run'])
+        for user_id, stored, actual in drift:
+            self.stdout.write(f"user {user_id}: stored {stored}, actual {actual}")
+        verb = "Found" if options['dry_run'] else "Corrected"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(drift)} drifted patron summaries."))
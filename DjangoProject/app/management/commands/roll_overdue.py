@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from app.circulation import roll_overdue
+
+
+class Command(BaseCommand):
+    help = (
+        "Roll the overdue_loans table forward to today: flag open loans that "
+        "fell due and clear rows for returned or extended loans. Run daily, "
+        "shortly after midnight."
+    )
+
+    def handle(self, *args, **options):
+        flagged, cleared = roll_overdue()
+        self.stdout.write(self.style.SUCCESS(f"Flagged {flagged} overdue loans, cleared {cleared}."))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_add_book_description_and_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='books',
+            index=models.Index(fields=['title', 'book_id'], name='books_title_book_id_idx'),
+        ),
+    ]
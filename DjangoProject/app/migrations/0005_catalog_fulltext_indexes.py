@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# (table, index name, columns) for the catalog search FULLTEXT indexes
+FULLTEXT_INDEXES = [
+    ('books', 'books_title_ft', 'title'),
+    ('books', 'books_description_ft', 'description'),
+    ('authors', 'authors_name_ft', 'first_name, last_name'),
+    ('catalogs', 'catalogs_name_ft', 'category_name'),
+]
+
+
+def create_fulltext_indexes(apps, schema_editor):
+    # FULLTEXT is MySQL-only; other backends use app.search.InvertedIndex
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    for table, name, columns in FULLTEXT_INDEXES:
+        schema_editor.execute(f"ALTER TABLE `{table}` ADD FULLTEXT INDEX `{name}` ({columns})")
+
+
+def drop_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    for table, name, columns in FULLTEXT_INDEXES:
+        schema_editor.execute(f"ALTER TABLE `{table}` DROP INDEX `{name}`")
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('app', '0004_books_title_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_indexes, drop_fulltext_indexes),
+    ]
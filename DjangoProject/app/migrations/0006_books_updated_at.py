@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-17 05:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_catalog_fulltext_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='books',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
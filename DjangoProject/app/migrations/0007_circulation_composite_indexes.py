@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_books_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fines',
+            index=models.Index(fields=['user', 'paid', 'date_issued'], name='fines_user_paid_issued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loans',
+            index=models.Index(fields=['return_date', 'due_date'], name='loans_return_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loans',
+            index=models.Index(fields=['user', '-loan_date'], name='loans_user_loan_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notifications',
+            index=models.Index(fields=['user', 'is_read', 'created_at'], name='notif_user_read_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservations',
+            index=models.Index(fields=['book', 'status', 'reservation_date'], name='res_book_status_date_idx'),
+        ),
+    ]
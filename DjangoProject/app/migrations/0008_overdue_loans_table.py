@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+# The view from 0002 that overdue_loans replaces (recreated on reverse)
+OVERDUE_VIEW_SQL = """
+CREATE OR REPLACE VIEW `mydb`.`v_overdue_loans` AS
+SELECT l.loan_id, u.username, b.title, l.due_date
+FROM `mydb`.`Loans` l
+JOIN `mydb`.`Users` u ON l.user_id = u.user_id
+JOIN `mydb`.`Books` b ON l.book_id = b.book_id
+WHERE l.return_date IS NULL AND l.due_date < CURDATE();
+"""
+
+
+def populate_overdue_loans(apps, schema_editor):
+    Loans = apps.get_model('app', 'Loans')
+    Overdueloans = apps.get_model('app', 'Overdueloans')
+    overdue = Loans.objects.filter(return_date__isnull=True, due_date__lt=timezone.now().date())
+    Overdueloans.objects.bulk_create(
+        (Overdueloans(loan_id=loan_id, user_id=user_id, book_id=book_id, due_date=due_date)
+         for loan_id, user_id, book_id, due_date in
+         overdue.values_list('loan_id', 'user_id', 'book_id', 'due_date').iterator()),
+        batch_size=1000,
+    )
+
+
+def drop_overdue_view(apps, schema_editor):
+    # The view only exists where 0002 ran (MySQL)
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute("DROP VIEW IF EXISTS `mydb`.`v_overdue_loans`")
+
+
+def create_overdue_view(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute(OVERDUE_VIEW_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_circulation_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Overdueloans',
+            fields=[
+                ('loan', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='overdue', serialize=False, to='app.loans')),
+                ('due_date', models.DateField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.books')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.users')),
+            ],
+            options={
+                'db_table': 'overdue_loans',
+                'indexes': [models.Index(fields=['due_date'], name='overdue_loans_due_idx')],
+            },
+        ),
+        migrations.RunPython(populate_overdue_loans, migrations.RunPython.noop),
+        migrations.RunPython(drop_overdue_view, create_overdue_view),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-17 04:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_overdue_loans_table'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fines',
+            name='loan',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='app.loans'),
+        ),
+        migrations.CreateModel(
+            name='Loansarchive',
+            fields=[
+                ('loan_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('loan_date', models.DateTimeField()),
+                ('due_date', models.DateField()),
+                ('return_date', models.DateField(blank=True, null=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.books')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.users')),
+            ],
+            options={
+                'db_table': 'loans_archive',
+                'indexes': [models.Index(fields=['user', '-loan_date'], name='loans_arch_user_date_idx')],
+            },
+        ),
+    ]
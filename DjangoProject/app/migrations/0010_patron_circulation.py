@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-17 05:00
+
+import django.db.models.deletion
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_patron_circulation(apps, schema_editor):
+    Loans = apps.get_model('app', 'Loans')
+    Overdueloans = apps.get_model('app', 'Overdueloans')
+    Fines = apps.get_model('app', 'Fines')
+    Patroncirculation = apps.get_model('app', 'Patroncirculation')
+    sources = [
+        (Loans.objects.filter(return_date__isnull=True), Count('loan_id')),
+        (Overdueloans.objects.all(), Count('loan_id')),
+        (Fines.objects.filter(paid=0), Sum('amount')),
+    ]
+    totals = {}
+    for i, (queryset, aggregate) in enumerate(sources):
+        for user_id, value in queryset.order_by().values('user_id').annotate(value=aggregate) \
+                                      .values_list('user_id', 'value'):
+            totals.setdefault(user_id, [0, 0, Decimal('0.00')])[i] = value
+    Patroncirculation.objects.bulk_create(
+        (Patroncirculation(user_id=user_id, active_loans=active, overdue_loans=overdue, fine_balance=balance)
+         for user_id, (active, overdue, balance) in totals.items()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_loans_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Patroncirculation',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='circulation', serialize=False, to='app.users')),
+                ('active_loans', models.IntegerField(default=0)),
+                ('overdue_loans', models.IntegerField(default=0)),
+                ('fine_balance', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+            ],
+            options={
+                'db_table': 'patron_circulation',
+            },
+        ),
+        migrations.RunPython(populate_patron_circulation, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-17 05:07
+
+from django.db import migrations, models
+
+
+def number_pending_reservations(apps, schema_editor):
+    Reservations = apps.get_model('app', 'Reservations')
+    pending = Reservations.objects.filter(status='pending').order_by('book_id', 'reservation_date', 'reservation_id')
+    batch = []
+    book_id, position = None, 0
+    for reservation in pending.only('reservation_id', 'book_id').iterator(chunk_size=1000):
+        position = position + 1 if reservation.book_id == book_id else 1
+        book_id = reservation.book_id
+        reservation.queue_position = position
+        batch.append(reservation)
+        if len(batch) >= 1000:
+            Reservations.objects.bulk_update(batch, ['queue_position'])
+            batch = []
+    Reservations.objects.bulk_update(batch, ['queue_position'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_patron_circulation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservations',
+            name='queue_position',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='reservations',
+            index=models.Index(fields=['book', 'queue_position'], name='res_book_queue_idx'),
+        ),
+        migrations.RunPython(number_pending_reservations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-17 05:09
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def start_pickup_windows(apps, schema_editor):
+    # Reservations already waiting on the shelf get a full pickup window from now
+    Reservations = apps.get_model('app', 'Reservations')
+    Reservations.objects.filter(status='ready', ready_date__isnull=True).update(ready_date=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_reservation_queue_position'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservations',
+            name='ready_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='reservations',
+            index=models.Index(fields=['status', 'ready_date'], name='res_status_ready_idx'),
+        ),
+        migrations.RunPython(start_pickup_windows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-17 05:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_reservation_ready_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notifications',
+            name='dedupe_key',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='notifications',
+            name='event',
+            field=models.CharField(blank=True, choices=[('overdue', 'Overdue notice'), ('fine_issued', 'Fine issued'), ('reservation_ready', 'Reservation ready'), ('reservation_expired', 'Reservation expired')], max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='notifications',
+            name='fine',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notifications', to='app.fines'),
+        ),
+        migrations.AddField(
+            model_name='notifications',
+            name='loan',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='notifications', to='app.loans'),
+        ),
+        migrations.AddField(
+            model_name='notifications',
+            name='reservation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notifications', to='app.reservations'),
+        ),
+        migrations.AddIndex(
+            model_name='notifications',
+            index=models.Index(fields=['loan', 'event', 'created_at'], name='notif_loan_event_created_idx'),
+        ),
+    ]
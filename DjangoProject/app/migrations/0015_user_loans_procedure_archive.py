@@ -0,0 +1,50 @@
+from django.db import migrations
+
+# sp_user_loans from 0002 only read the live Loans table; returned loans
+# moved to loans_archive (0009) dropped out of it. Redefine it over both.
+USER_LOANS_SQL = """
+CREATE PROCEDURE `mydb`.`sp_user_loans` (IN uid INT)
+BEGIN
+    SELECT b.title, l.loan_date, l.due_date, l.return_date
+    FROM `mydb`.`Loans` l
+    JOIN `mydb`.`Books` b ON l.book_id = b.book_id
+    WHERE l.user_id = uid
+    UNION ALL
+    SELECT b.title, a.loan_date, a.due_date, a.return_date
+    FROM `mydb`.`loans_archive` a
+    JOIN `mydb`.`Books` b ON a.book_id = b.book_id
+    WHERE a.user_id = uid;
+END;
+"""
+
+# The 0002 definition (recreated on reverse)
+LIVE_USER_LOANS_SQL = """
+CREATE PROCEDURE `mydb`.`sp_user_loans` (IN uid INT)
+BEGIN
+    SELECT b.title, l.loan_date, l.due_date, l.return_date
+    FROM `mydb`.`Loans` l
+    JOIN `mydb`.`Books` b ON l.book_id = b.book_id
+    WHERE l.user_id = uid;
+END;
+"""
+
+
+def replace_procedure(sql):
+    def replace(apps, schema_editor):
+        # The procedure only exists where 0002 ran (MySQL)
+        if schema_editor.connection.vendor != 'mysql':
+            return
+        schema_editor.execute("DROP PROCEDURE IF EXISTS `mydb`.`sp_user_loans`")
+        schema_editor.execute(sql)
+    return replace
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(replace_procedure(USER_LOANS_SQL), replace_procedure(LIVE_USER_LOANS_SQL)),
+    ]
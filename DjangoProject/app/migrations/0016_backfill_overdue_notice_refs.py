@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.db import migrations
+from django.utils import timezone
+
+# NOTICE_INTERVAL_DAYS in app.circulation when 0013 was added: notices this
+# recent still decide whether a loan gets another one
+NOTICE_WINDOW_DAYS = 7
+
+
+def link_recent_overdue_notices(apps, schema_editor):
+    """
+    Give overdue notices sent before 0013 their event and loan, so
+    send_overdue_notices (which now looks them up by loan) doesn't send a
+    second notice inside the interval. Notices are matched to the patron's
+    open overdue loan by the book title quoted in the message.
+    """
+    Notifications = apps.get_model('app', 'Notifications')
+    Overdueloans = apps.get_model('app', 'Overdueloans')
+    since = timezone.now() - timedelta(days=NOTICE_WINDOW_DAYS)
+    notices = Notifications.objects.filter(notification_type='overdue', event__isnull=True,
+                                           created_at__gte=since)
+
+    loans = {}
+    for loan_id, user_id, title in Overdueloans.objects.filter(
+        user_id__in=notices.values('user_id')
+    ).values_list('loan_id', 'user_id', 'book__title').iterator():
+        loans.setdefault(user_id, []).append((loan_id, f"Your book '{title}' is "))
+
+    linked = []
+    for notification_id, user_id, message in notices.values_list(
+        'notification_id', 'user_id', 'message'
+    ).iterator():
+        for loan_id, quoted_title in loans.get(user_id, ()):
+            if quoted_title in (message or ''):
+                linked.append(Notifications(notification_id=notification_id, event='overdue', loan_id=loan_id))
+                break
+    Notifications.objects.bulk_update(linked, ['event', 'loan'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_user_loans_procedure_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(link_recent_overdue_notices, migrations.RunPython.noop),
+    ]
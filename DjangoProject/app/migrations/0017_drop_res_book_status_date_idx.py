@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-17 05:51
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_backfill_overdue_notice_refs'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='reservations',
+            name='res_book_status_date_idx',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_drop_res_book_status_date_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Referenceversion',
+            fields=[
+                ('table', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'reference_versions',
+            },
+        ),
+    ]
@@ -118,9 +118,17 @@ class Books(models.Model):
     available_copies = models.IntegerField()
     is_deleted = models.BooleanField(default=False)
 
+    # Row version for conditional GETs; bumped on every write, including
+    # queryset updates of available_copies (which must set it explicitly)
+    updated_at = models.DateTimeField(auto_now=True)
+
     class Meta:
         db_table = "books"
         app_label = "app"
+        indexes = [
+            # Keyset pagination seeks on (title, book_id)
+            models.Index(fields=["title", "book_id"], name="books_title_book_id_idx"),
+        ]
 
     def save(self, *args, **kwargs):
         self.full_clean()
@@ -215,6 +223,90 @@ class Loans(models.Model):
     class Meta:
         db_table = "loans"
         app_label = "app"
+        indexes = [
+            # Overdue processing: return_date IS NULL AND due_date < today
+            models.Index(fields=["return_date", "due_date"], name="loans_return_due_idx"),
+            # A patron's loans, newest first
+            models.Index(fields=["user", "-loan_date"], name="loans_user_loan_date_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.full_clean()
+        super().save(*args, **kwargs)
+
+
+# -----------------------
+# LOANS ARCHIVE
+# -----------------------
+class Loansarchive(models.Model):
+    """
+    Returned loans moved out of the hot loans table by archive_loans.
+    Rows keep their original loan_id (and the same columns as Loans), so
+    fines still point at them and per-user history can union both tables.
+    """
+    loan_id = models.IntegerField(primary_key=True)
+    user = models.ForeignKey(Users, on_delete=models.CASCADE)
+    book = models.ForeignKey(Books, on_delete=models.CASCADE)
+    loan_date = models.DateTimeField()
+    due_date = models.DateField()
+    return_date = models.DateField(blank=True, null=True)
+
+    class Meta:
+        db_table = "loans_archive"
+        app_label = "app"
+        indexes = [
+            models.Index(fields=["user", "-loan_date"], name="loans_arch_user_date_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.full_clean()
+        super().save(*args, **kwargs)
+
+
+# -----------------------
+# OVERDUE LOANS
+# -----------------------
+class Overdueloans(models.Model):
+    """
+    Open loans past their due date. Kept up to date by checkout, return
+    and the daily roll_overdue job (see app.circulation), so overdue
+    dashboards and notices read this small set instead of scanning loans.
+    """
+    loan = models.OneToOneField(Loans, on_delete=models.CASCADE, primary_key=True, related_name="overdue")
+    user = models.ForeignKey(Users, on_delete=models.CASCADE)
+    book = models.ForeignKey(Books, on_delete=models.CASCADE)
+    due_date = models.DateField()
+
+    class Meta:
+        db_table = "overdue_loans"
+        app_label = "app"
+        indexes = [
+            models.Index(fields=["due_date"], name="overdue_loans_due_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.full_clean()
+        super().save(*args, **kwargs)
+
+
+# -----------------------
+# PATRON CIRCULATION SUMMARY
+# -----------------------
+class Patroncirculation(models.Model):
+    """
+    Running per-patron totals used to enforce loan limits without
+    aggregating loans and fines on every checkout. Updated in the same
+    transaction as checkouts, returns and fine changes (see
+    app.circulation); reconcile_circulation recomputes it from scratch.
+    """
+    user = models.OneToOneField(Users, on_delete=models.CASCADE, primary_key=True, related_name="circulation")
+    active_loans = models.IntegerField(default=0)
+    overdue_loans = models.IntegerField(default=0)
+    fine_balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = "patron_circulation"
+        app_label = "app"
 
     def save(self, *args, **kwargs):
         self.full_clean()
@@ -228,7 +320,9 @@ class Fines(models.Model):
     fine_id = models.AutoField(primary_key=True)
 
     user = models.ForeignKey(Users, on_delete=models.CASCADE)
-    loan = models.ForeignKey(Loans, on_delete=models.CASCADE)
+    # No database constraint: the loan may have moved to loans_archive
+    # (same loan_id), and the fine must stay with it
+    loan = models.ForeignKey(Loans, on_delete=models.DO_NOTHING, db_constraint=False)
 
     amount = models.DecimalField(max_digits=6, decimal_places=2)
 
@@ -239,9 +333,15 @@ class Fines(models.Model):
     class Meta:
         db_table = "fines"
         app_label = "app"
+        indexes = [
+            # A patron's (unpaid) fines, newest first
+            models.Index(fields=["user", "paid", "date_issued"], name="fines_user_paid_issued_idx"),
+        ]
 
     def save(self, *args, **kwargs):
-        self.full_clean()
+        # The loan is checked when the fine is issued; afterwards it may
+        # have been archived, which must not block paying the fine
+        self.full_clean(exclude=["loan"] if self.pk else None)
         super().save(*args, **kwargs)
 
 
@@ -249,6 +349,13 @@ class Fines(models.Model):
 # NOTIFICATIONS
 # -----------------------
 class Notifications(models.Model):
+    EVENT_CHOICES = [
+        ("overdue", "Overdue notice"),
+        ("fine_issued", "Fine issued"),
+        ("reservation_ready", "Reservation ready"),
+        ("reservation_expired", "Reservation expired"),
+    ]
+
     notification_id = models.AutoField(primary_key=True)
     user = models.ForeignKey(Users, on_delete=models.CASCADE)
     message = models.TextField()
@@ -256,9 +363,71 @@ class Notifications(models.Model):
     created_at = models.DateTimeField()
     is_read = models.IntegerField()
 
+    # What a system notification is about, so flows can check for an
+    # earlier notice with an index instead of matching message text.
+    # Free-form notifications leave these empty.
+    event = models.CharField(max_length=20, choices=EVENT_CHOICES, blank=True, null=True)
+    # No database constraint: the loan may have moved to loans_archive
+    loan = models.ForeignKey(Loans, on_delete=models.DO_NOTHING, db_constraint=False,
+                             blank=True, null=True, related_name="notifications")
+    reservation = models.ForeignKey("Reservations", on_delete=models.SET_NULL, blank=True, null=True,
+                                    related_name="notifications")
+    fine = models.ForeignKey(Fines, on_delete=models.SET_NULL, blank=True, null=True,
+                             related_name="notifications")
+    # At most one notification per key, e.g. "reservation_ready:42"
+    dedupe_key = models.CharField(unique=True, max_length=100, blank=True, null=True)
+
     class Meta:
         db_table = "notifications"
         app_label = "app"
+        indexes = [
+            # A patron's (unread) notifications, newest first
+            models.Index(fields=["user", "is_read", "created_at"], name="notif_user_read_created_idx"),
+            # Latest notice of a kind for a loan
+            models.Index(fields=["loan", "event", "created_at"], name="notif_loan_event_created_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.full_clean()
+        super().save(*args, **kwargs)
+
+
+# -----------------------
+# NOTIFICATION OUTBOX
+# -----------------------
+class Notificationoutbox(models.Model):
+    """
+    Email deliveries owed for notifications, written in the same transaction
+    as the notification and drained by the deliver_notifications worker
+    (see app.outbox), so requests never wait on SMTP.
+    """
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("dead", "Dead"),
+    ]
+
+    outbox_id = models.AutoField(primary_key=True)
+    user = models.ForeignKey(Users, on_delete=models.CASCADE)
+    subject = models.CharField(max_length=150)
+    body = models.TextField()
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default="pending")
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField()
+    # When a worker claimed the row; a claim older than the timeout is retaken
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = "notification_outbox"
+        app_label = "app"
+        indexes = [
+            # Deliveries due, oldest first
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_status_next_idx"),
+        ]
 
     def save(self, *args, **kwargs):
         self.full_clean()
@@ -274,11 +443,40 @@ class Reservations(models.Model):
     book = models.ForeignKey(Books, on_delete=models.CASCADE)
     reservation_date = models.DateTimeField()
     status = models.CharField(max_length=9)
+    # Place in the title's queue while pending (1 = next in line), else null;
+    # maintained by app.circulation
+    queue_position = models.IntegerField(blank=True, null=True)
+    # When the reservation became ready; uncollected holds expire after
+    # the pickup window (see app.circulation.expire_reservations)
+    ready_date = models.DateTimeField(blank=True, null=True)
 
     class Meta:
         db_table = "reservations"
         app_label = "app"
+        indexes = [
+            # Next in line for a title
+            models.Index(fields=["book", "queue_position"], name="res_book_queue_idx"),
+            # Ready reservations past the pickup window
+            models.Index(fields=["status", "ready_date"], name="res_status_ready_idx"),
+        ]
 
     def save(self, *args, **kwargs):
         self.full_clean()
         super().save(*args, **kwargs)
+
+
+# -----------------------
+# REFERENCE DATA VERSIONS
+# -----------------------
+class Referenceversion(models.Model):
+    """
+    Version counter per reference table (authors, categories...), bumped
+    whenever the table changes (see app.refdata). Kept in the database so
+    every server process sees the same versions.
+    """
+    table = models.CharField(max_length=20, primary_key=True)
+    version = models.BigIntegerField()
+
+    class Meta:
+        db_table = "reference_versions"
+        app_label = "app"
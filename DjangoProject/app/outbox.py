@@ -0,0 +1,187 @@
+"""
+Email delivery of notifications through a transactional outbox.
+
+Code that creates notifications calls queue_delivery() in the same
+transaction, which writes one notification_outbox row per notification
+(and wakes any open notification streams on commit). The
+deliver_notifications worker drains the outbox: a pool of threads each
+claims a batch of due rows, sends the batch over one SMTP connection and
+records the outcome. Failed sends are retried with exponential backoff
+and dead-lettered after MAX_ATTEMPTS.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .models import Notificationoutbox
+from .streams import announce
+
+logger = logging.getLogger(__name__)
+
+# Rows claimed (and sent over one SMTP connection) at a time
+OUTBOX_BATCH_SIZE = 100
+# Sends per row before it is dead-lettered
+MAX_ATTEMPTS = 5
+# Retry n waits BACKOFF_SECONDS * 2 ** (n - 1)
+BACKOFF_SECONDS = 60
+# A claim older than this is assumed abandoned (worker died) and retaken
+CLAIM_TIMEOUT = timedelta(minutes=10)
+CLAIM_TIMEOUT_ERROR = 'Claim timed out before the send was recorded.'
+
+
+def notification_subject(notification):
+    return f"Library {notification.notification_type} notice"
+
+
+def queue_delivery(notifications):
+    """
+    Queue email delivery of these (just created) notifications in the
+    current transaction, and wake their recipients' streams on commit.
+    """
+    notifications = list(notifications)
+    if not notifications:
+        return
+    now = timezone.now()
+    Notificationoutbox.objects.bulk_create(
+        [Notificationoutbox(user_id=notification.user_id, subject=notification_subject(notification),
+                            body=notification.message, next_attempt_at=now, created_at=now)
+         for notification in notifications],
+        batch_size=1000,
+    )
+    announce(notification.user_id for notification in notifications)
+
+
+def claim_batch(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Claim up to `batch_size` due rows for this worker. Rows locked by another
+    worker are skipped, so concurrent workers never claim the same row.
+
+    Retaking an abandoned claim counts as an attempt, so a row whose send
+    keeps killing the worker is dead-lettered after MAX_ATTEMPTS like any
+    other failure.
+    """
+    now = timezone.now()
+    due = Q(status='pending', next_attempt_at__lte=now) | Q(status='sending', claimed_at__lt=now - CLAIM_TIMEOUT)
+    with transaction.atomic():
+        rows = list(Notificationoutbox.objects.select_for_update(skip_locked=True).filter(due)
+                    .order_by('next_attempt_at', 'outbox_id').values_list('outbox_id', 'status', 'attempts')
+                    [:batch_size])
+        if not rows:
+            return []
+        ids = [outbox_id for outbox_id, status, _ in rows if status == 'pending']
+        stale = [outbox_id for outbox_id, status, _ in rows if status == 'sending']
+        dead = [outbox_id for outbox_id, status, attempts in rows
+                if status == 'sending' and attempts + 1 >= MAX_ATTEMPTS]
+        if ids:
+            Notificationoutbox.objects.filter(pk__in=ids).update(status='sending', claimed_at=now)
+        if stale:
+            Notificationoutbox.objects.filter(pk__in=stale).update(
+                attempts=F('attempts') + 1,
+                status=Case(When(attempts__gte=MAX_ATTEMPTS - 1, then=Value('dead')), default=Value('sending')),
+                claimed_at=now,
+                last_error=CLAIM_TIMEOUT_ERROR,
+            )
+    for outbox_id in dead:
+        logger.warning("Dead-lettered outbox row %s after %s attempts: %s",
+                       outbox_id, MAX_ATTEMPTS, CLAIM_TIMEOUT_ERROR)
+    claimed = ids + [outbox_id for outbox_id in stale if outbox_id not in dead]
+    return list(Notificationoutbox.objects.filter(pk__in=claimed).select_related('user').order_by('outbox_id'))
+
+
+def send_batch(rows):
+    """
+    Send a claimed batch over one SMTP connection. Returns the ids sent and
+    {outbox_id: error} for the rest.
+    """
+    sent = []
+    failed = {}
+    messages = []
+    for row in rows:
+        if not row.user.email:
+            failed[row.outbox_id] = 'No email address for this user.'
+        else:
+            messages.append((row.outbox_id, EmailMessage(row.subject, row.body, settings.DEFAULT_FROM_EMAIL,
+                                                         [row.user.email])))
+    if not messages:
+        return sent, failed
+
+    smtp = get_connection()
+    try:
+        smtp.open()
+    except Exception as e:
+        return sent, {**failed, **{outbox_id: f'Could not connect: {e}' for outbox_id, _ in messages}}
+    try:
+        for outbox_id, message in messages:
+            try:
+                smtp.send_messages([message])
+                sent.append(outbox_id)
+            except Exception as e:
+                failed[outbox_id] = str(e) or e.__class__.__name__
+    finally:
+        smtp.close()
+    return sent, failed
+
+
+def record_results(rows, sent, failed):
+    """Mark sent rows, and reschedule or dead-letter failed ones"""
+    now = timezone.now()
+    if sent:
+        Notificationoutbox.objects.filter(pk__in=sent).update(status='sent', sent_at=now, last_error=None)
+    retried = []
+    dead = []
+    for row in rows:
+        if row.outbox_id not in failed:
+            continue
+        row.attempts += 1
+        row.last_error = failed[row.outbox_id][:1000]
+        if row.attempts >= MAX_ATTEMPTS or not row.user.email:
+            row.status = 'dead'
+            dead.append(row)
+        else:
+            row.status = 'pending'
+            row.next_attempt_at = now + timedelta(seconds=BACKOFF_SECONDS * 2 ** (row.attempts - 1))
+            retried.append(row)
+    if retried or dead:
+        Notificationoutbox.objects.bulk_update(retried + dead,
+                                               ['attempts', 'last_error', 'status', 'next_attempt_at'])
+    for row in dead:
+        logger.warning("Dead-lettered outbox row %s after %s attempts: %s",
+                       row.outbox_id, row.attempts, row.last_error)
+    return len(retried), len(dead)
+
+
+def _drain(batch_size, close_connection):
+    """One worker: claim, send and record batches until nothing is due"""
+    totals = {'sent': 0, 'retried': 0, 'dead': 0}
+    try:
+        while True:
+            rows = claim_batch(batch_size)
+            if not rows:
+                return totals
+            sent, failed = send_batch(rows)
+            retried, dead = record_results(rows, sent, failed)
+            totals['sent'] += len(sent)
+            totals['retried'] += retried
+            totals['dead'] += dead
+    finally:
+        if close_connection:
+            connection.close()
+
+
+def drain_outbox(workers=4, batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Deliver everything currently due with a pool of `workers` threads (one
+    worker runs in the calling thread). Returns the number of rows sent,
+    rescheduled and dead-lettered.
+    """
+    if workers <= 1:
+        return _drain(batch_size, close_connection=False)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda _: _drain(batch_size, close_connection=True), range(workers)))
+    return {key: sum(result[key] for result in results) for key in ('sent', 'retried', 'dead')}
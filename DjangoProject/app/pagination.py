@@ -0,0 +1,40 @@
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+# -----------------------
+# Keyset (cursor) pagination
+# -----------------------
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination that seeks on an indexed ordering instead of using
+    OFFSET, so every page costs the same no matter how deep the client goes.
+    Lists always come back paginated; clients follow ``next`` for more.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'prev': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class BookCursorPagination(KeysetPagination):
+    """Catalog pages ordered alphabetically, with book_id as tie-breaker"""
+    ordering = ('title', 'book_id')
+
+    def get_ordering(self, request, queryset, view):
+        # Search results (see app.search) page through in relevance order
+        if 'relevance' in queryset.query.annotations:
+            return ('-relevance', 'book_id')
+        return super().get_ordering(request, queryset, view)
+
+
+class LoanCursorPagination(KeysetPagination):
+    """Circulation history, newest loans first"""
+    ordering = ('-loan_date', '-loan_id')
@@ -0,0 +1,81 @@
+import time
+
+from django.core.cache import cache
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils.cache import get_conditional_response, patch_cache_control
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Authors, Catalogs, Publishers, Librarybranches, Referenceversion
+
+
+# -----------------------
+# Versioned reference-data cache
+# -----------------------
+# Authors, categories, publishers and branches rarely change, so their list
+# endpoints are served from the cache. Each table has a version counter in
+# reference_versions that save/delete signals bump (see app.signals); the
+# version is part of both the cache key and the ETag, so stale payloads are
+# never served and clients that send a matching If-None-Match get a 304
+# without touching those tables. The counters live in the database so all
+# server processes agree on them; the cached payloads may be per process.
+
+# Reference table name for each model (used in cache keys and ETags)
+REFERENCE_TABLES = {
+    Authors: 'authors',
+    Catalogs: 'categories',
+    Publishers: 'publishers',
+    Librarybranches: 'branches',
+}
+
+# Serialized payloads are keyed by version, so this only bounds memory use
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_versions():
+    """Get every reference table's version counter with one query"""
+    versions = dict(Referenceversion.objects.values_list('table', 'version'))
+    # A table that has never changed has no row yet
+    return {table: versions.get(table, 0) for table in REFERENCE_TABLES.values()}
+
+
+def get_version(table):
+    """Get the current version counter for a reference table"""
+    version = Referenceversion.objects.filter(table=table).values_list('version', flat=True).first()
+    return version or 0
+
+
+def bump_version(table):
+    """Invalidate cached payloads and ETags for a reference table"""
+    # Never below the clock: a bump rolled back with its transaction must not
+    # let a later bump reissue that version (its payload may still be cached)
+    now = time.time_ns()
+    updated = Referenceversion.objects.filter(table=table).update(
+        version=Greatest(F('version') + 1, Value(now))
+    )
+    if not updated:
+        Referenceversion.objects.get_or_create(table=table, defaults={'version': now})
+
+
+def cached_reference_response(request, table, build):
+    """
+    Serve a reference-data list with ETag/If-None-Match support.
+    `build` is only called (and the table only queried) on a cache miss.
+    """
+    version = get_version(table)
+    etag = f'"{table}-{version}"'
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        payload_key = f'refdata:{table}:{version}'
+        data = cache.get(payload_key)
+        if data is None:
+            data = build()
+            cache.set(payload_key, data, REFERENCE_CACHE_TIMEOUT)
+        response = Response(data, status=status.HTTP_200_OK)
+
+    response['ETag'] = etag
+    # Let browsers keep the body but revalidate it on every use
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,211 @@
+import heapq
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Case, FloatField, Value, When
+
+from .models import Books, Bookauthors, Bookcatalogs
+
+
+# -----------------------
+# Catalog search
+# -----------------------
+# Ranked search over title, ISBN, description, author names and category
+# names. On MySQL this uses the FULLTEXT indexes created in migration 0005;
+# other backends (SQLite test runs) use an in-process inverted index.
+
+# Maximum number of ranked hits returned for a search. The cap applies after
+# the caller's filters (see search_books); the books list reports when it
+# cut results off.
+SEARCH_RESULT_LIMIT = 500
+
+# Relative weight of each field when ranking matches
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'author': 2.0,
+    'category': 1.5,
+    'description': 1.0,
+}
+
+# Score given to an ISBN prefix match, so exact lookups always rank first
+ISBN_MATCH_SCORE = 100.0
+
+TOKEN_RE = re.compile(r'\w+')
+ISBN_RE = re.compile(r'^[0-9Xx-]{4,20}$')
+
+
+def tokenize(text):
+    """Split text into lowercase search tokens"""
+    if not text:
+        return []
+    return TOKEN_RE.findall(text.lower())
+
+
+class InvertedIndex:
+    """
+    In-process inverted index (token -> {book_id: weight}) used where the
+    database has no FULLTEXT support. Built lazily on first search and
+    rebuilt after any catalog write invalidates it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = None
+        self._book_count = 0
+
+    def invalidate(self):
+        """Drop the index so the next search rebuilds it"""
+        with self._lock:
+            self._postings = None
+
+    def _build(self):
+        postings = defaultdict(lambda: defaultdict(float))
+
+        def add(book_id, text, weight):
+            for token in tokenize(text):
+                postings[token][book_id] += weight
+
+        book_count = 0
+        for book_id, title, description in Books.objects.values_list(
+            'book_id', 'title', 'description'
+        ).iterator():
+            book_count += 1
+            add(book_id, title, FIELD_WEIGHTS['title'])
+            add(book_id, description, FIELD_WEIGHTS['description'])
+
+        for book_id, first_name, last_name in Bookauthors.objects.values_list(
+            'book_id', 'author__first_name', 'author__last_name'
+        ).iterator():
+            add(book_id, f"{first_name} {last_name}", FIELD_WEIGHTS['author'])
+
+        for book_id, category_name in Bookcatalogs.objects.values_list(
+            'book_id', 'catalog__category_name'
+        ).iterator():
+            add(book_id, category_name, FIELD_WEIGHTS['category'])
+
+        return {token: dict(hits) for token, hits in postings.items()}, book_count
+
+    def rank(self, term):
+        """Return {book_id: score} for every book matching the term"""
+        with self._lock:
+            if self._postings is None:
+                self._postings, self._book_count = self._build()
+            postings, book_count = self._postings, self._book_count
+
+        scores = defaultdict(float)
+        for token in set(tokenize(term)):
+            hits = postings.get(token)
+            if not hits:
+                continue
+            # Rare tokens count for more than common ones
+            idf = math.log(1 + book_count / len(hits))
+            for book_id, weight in hits.items():
+                scores[book_id] += weight * idf
+        return scores
+
+
+search_index = InvertedIndex()
+
+
+def invalidate_search_index():
+    """Mark the in-process index stale (no-op cost on MySQL)"""
+    search_index.invalidate()
+
+
+MYSQL_RANK_SQL = """
+    SELECT book_id, SUM(score) AS score FROM (
+        SELECT book_id, %s * MATCH(title) AGAINST (%s) AS score
+        FROM books WHERE MATCH(title) AGAINST (%s)
+        UNION ALL
+        SELECT book_id, %s * MATCH(description) AGAINST (%s)
+        FROM books WHERE MATCH(description) AGAINST (%s)
+        UNION ALL
+        SELECT ba.book_id, %s * MATCH(a.first_name, a.last_name) AGAINST (%s)
+        FROM authors a JOIN bookauthors ba ON ba.author_id = a.author_id
+        WHERE MATCH(a.first_name, a.last_name) AGAINST (%s)
+        UNION ALL
+        SELECT bc.book_id, %s * MATCH(c.category_name) AGAINST (%s)
+        FROM catalogs c JOIN bookcatalogs bc ON bc.catalog_id = c.catalog_id
+        WHERE MATCH(c.category_name) AGAINST (%s)
+    ) hits
+    WHERE book_id IN ({candidates})
+    GROUP BY book_id
+    ORDER BY score DESC, book_id
+    LIMIT %s
+"""
+
+
+def _rank_mysql(term, candidates, limit):
+    candidate_sql, candidate_params = candidates.order_by().values('book_id').query.sql_with_params()
+    params = []
+    for field in ('title', 'description', 'author', 'category'):
+        params.extend([FIELD_WEIGHTS[field], term, term])
+    params.extend(candidate_params)
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(MYSQL_RANK_SQL.format(candidates=candidate_sql), params)
+        return [(book_id, float(score)) for book_id, score in cursor.fetchall()]
+
+
+def _rank_in_process(term, candidates, limit):
+    scores = search_index.rank(term)
+    if not scores:
+        return []
+    allowed = set(candidates.filter(book_id__in=list(scores)).values_list('book_id', flat=True))
+    hits = ((book_id, score) for book_id, score in scores.items() if book_id in allowed)
+    return heapq.nlargest(limit, hits, key=lambda hit: (hit[1], -hit[0]))
+
+
+def rank_books(term, candidates=None, limit=None):
+    """
+    Rank catalog matches for a search term among `candidates` (a Books
+    queryset, default all books). Returns up to `limit` (book_id, score)
+    pairs, best first.
+    """
+    term = term.strip()
+    if not term:
+        return []
+    if candidates is None:
+        candidates = Books.objects.all()
+    if limit is None:
+        limit = SEARCH_RESULT_LIMIT
+
+    if connection.vendor == 'mysql':
+        ranked = _rank_mysql(term, candidates, limit)
+    else:
+        ranked = _rank_in_process(term, candidates, limit)
+
+    # ISBN lookups use the unique index with a prefix match
+    if ISBN_RE.match(term):
+        scores = dict(ranked)
+        for book_id in candidates.filter(isbn__startswith=term).values_list('book_id', flat=True)[:limit]:
+            scores[book_id] = scores.get(book_id, 0.0) + ISBN_MATCH_SCORE
+        ranked = heapq.nlargest(limit, scores.items(), key=lambda hit: (hit[1], -hit[0]))
+    return ranked
+
+
+def search_books(queryset, term):
+    """
+    Restrict a (filtered) Books queryset to its search matches, annotated
+    with `relevance` and ordered best first. Ranking only considers books in
+    the queryset, so filtered-out books never take up result slots.
+
+    Returns (queryset, truncated); `truncated` is True when more than
+    SEARCH_RESULT_LIMIT books matched and only the best were kept.
+    """
+    ranked = rank_books(term, candidates=queryset, limit=SEARCH_RESULT_LIMIT + 1)
+    truncated = len(ranked) > SEARCH_RESULT_LIMIT
+    ranked = ranked[:SEARCH_RESULT_LIMIT]
+    if not ranked:
+        return queryset.none(), truncated
+    relevance = Case(
+        *[When(book_id=book_id, then=Value(score)) for book_id, score in ranked],
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return queryset.filter(
+        book_id__in=[book_id for book_id, _ in ranked]
+    ).annotate(relevance=relevance).order_by('-relevance', 'book_id'), truncated
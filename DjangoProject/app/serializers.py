@@ -1,10 +1,12 @@
 from rest_framework import serializers
 from django.utils import timezone
+from django.db.models import Prefetch
 from .models import (
     Books, Loans, Reservations, Notifications, Fines,
     Authors, Publishers, Catalogs, Librarybranches,
-    Bookauthors, Bookcatalogs, Users
+    Bookauthors, Bookcatalogs, Users, Loansarchive
 )
+from .circulation import MAX_BATCH_CHECKOUT
 
 
 # -----------------------
@@ -200,13 +202,32 @@ class UserUpdateSerializer(serializers.ModelSerializer):
 # -----------------------
 
 class BookSerializer(serializers.ModelSerializer):
-    """Serializer for Books with nested relationships"""
+    """
+    Serializer for Books with nested relationships
+
+    Supports sparse fieldsets: pass `fields` (list of field names) to only
+    serialize those, and `expand` (subset of 'authors', 'categories') to
+    choose which relations render as full nested objects. When `fields` is
+    given, unexpanded authors/categories render as a list of names.
+    """
     publisher_name = serializers.CharField(source='publisher.name', read_only=True)
     branch_name = serializers.CharField(source='branch.branch_name', read_only=True)
     authors = serializers.SerializerMethodField()
     categories = serializers.SerializerMethodField()
     status = serializers.SerializerMethodField()
     
+    # Relations that can be expanded into nested objects
+    EXPANDABLE_FIELDS = ('authors', 'categories')
+    
+    # Model columns each output field needs (for .only() on sparse requests)
+    FIELD_COLUMNS = {
+        'publisher_name': ['publisher'],
+        'branch_name': ['branch'],
+        'status': ['available_copies'],
+        'authors': [],
+        'categories': [],
+    }
+    
     class Meta:
         model = Books
         fields = [
@@ -220,16 +241,66 @@ class BookSerializer(serializers.ModelSerializer):
             'is_deleted': {'required': False, 'allow_null': True}
         }
     
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        expand = kwargs.pop('expand', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        if expand is None:
+            # Full nested relations unless the client asked for a sparse view
+            expand = self.EXPANDABLE_FIELDS if fields is None else ()
+        self.expand = set(expand)
+    
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None):
+        """
+        Load publisher, branch, authors and categories up front so that
+        serializing any number of books costs a fixed number of queries.
+        With `fields`, only the columns and relations those fields need
+        are loaded.
+        """
+        if fields is None:
+            return queryset.select_related('publisher', 'branch').prefetch_related(
+                Prefetch('bookauthors_set', queryset=Bookauthors.objects.select_related('author')),
+                Prefetch('bookcatalogs_set', queryset=Bookcatalogs.objects.select_related('catalog')),
+            )
+        
+        fields = set(fields)
+        # Always needed: book_id/title for keyset pagination, updated_at for ETags
+        columns = {'book_id', 'title', 'updated_at'}
+        for name in fields & set(cls.Meta.fields):
+            columns.update(cls.FIELD_COLUMNS.get(name, [name]))
+        queryset = queryset.only(*columns)
+        
+        if 'publisher_name' in fields:
+            queryset = queryset.select_related('publisher')
+        if 'branch_name' in fields:
+            queryset = queryset.select_related('branch')
+        if 'authors' in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch('bookauthors_set', queryset=Bookauthors.objects.select_related('author'))
+            )
+        if 'categories' in fields:
+            queryset = queryset.prefetch_related(
+                Prefetch('bookcatalogs_set', queryset=Bookcatalogs.objects.select_related('catalog'))
+            )
+        return queryset
+    
     def get_authors(self, obj):
         """Get all authors for this book"""
-        book_authors = Bookauthors.objects.filter(book=obj)
-        authors = [ba.author for ba in book_authors]
+        # Uses the prefetched link rows when available (see setup_eager_loading)
+        authors = [ba.author for ba in obj.bookauthors_set.all()]
+        if 'authors' not in self.expand:
+            return [f"{author.first_name} {author.last_name}" for author in authors]
         return AuthorSerializer(authors, many=True).data
     
     def get_categories(self, obj):
         """Get all categories for this book"""
-        book_catalogs = Bookcatalogs.objects.filter(book=obj)
-        catalogs = [bc.catalog for bc in book_catalogs]
+        catalogs = [bc.catalog for bc in obj.bookcatalogs_set.all()]
+        if 'categories' not in self.expand:
+            return [catalog.category_name for catalog in catalogs]
         return CatalogSerializer(catalogs, many=True).data
     
     def get_status(self, obj):
@@ -243,9 +314,9 @@ class BookSerializer(serializers.ModelSerializer):
         """Override to handle missing fields gracefully"""
         data = super().to_representation(instance)
         # Handle missing fields if migration hasn't been run
-        if 'description' not in data or data['description'] is None:
+        if 'description' in self.fields and data.get('description') is None:
             data['description'] = None
-        if 'is_deleted' not in data:
+        if 'is_deleted' in self.fields and 'is_deleted' not in data:
             data['is_deleted'] = False
         return data
 
@@ -321,6 +392,46 @@ class LoanCreateSerializer(serializers.ModelSerializer):
         return attrs
 
 
+class BatchCheckoutItemSerializer(serializers.Serializer):
+    """One book in a batch checkout"""
+    book = serializers.IntegerField()
+    due_date = serializers.DateField(required=False)
+
+
+class BatchCheckoutSerializer(serializers.Serializer):
+    """
+    Validate a batch checkout: one user, a list of books, and a due date
+    used for any item that doesn't give its own. Books are checked by the
+    checkout itself, in one query.
+    """
+    user = serializers.PrimaryKeyRelatedField(queryset=Users.objects.all())
+    due_date = serializers.DateField(required=False)
+    items = BatchCheckoutItemSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        if len(items) > MAX_BATCH_CHECKOUT:
+            raise serializers.ValidationError(f'At most {MAX_BATCH_CHECKOUT} books per checkout.')
+        return items
+
+    def validate(self, attrs):
+        for item in attrs['items']:
+            item.setdefault('due_date', attrs.get('due_date'))
+            if item['due_date'] is None:
+                raise serializers.ValidationError({'due_date': 'Give a due_date for the batch or for every item.'})
+        return attrs
+
+
+class BulkReturnSerializer(serializers.Serializer):
+    """Validate a bulk return: loan ids and/or ISBNs of returned books"""
+    loan_ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    isbns = serializers.ListField(child=serializers.CharField(max_length=20), required=False, default=list)
+
+    def validate(self, attrs):
+        if not attrs['loan_ids'] and not attrs['isbns']:
+            raise serializers.ValidationError('Give loan_ids or isbns to return.')
+        return attrs
+
+
 # -----------------------
 # Reservations Serializers
 # -----------------------
@@ -336,9 +447,9 @@ class ReservationSerializer(serializers.ModelSerializer):
         model = Reservations
         fields = [
             'reservation_id', 'user', 'user_name', 'book', 'book_title', 'book_isbn',
-            'book_available_copies', 'reservation_date', 'status'
+            'book_available_copies', 'reservation_date', 'status', 'queue_position', 'ready_date'
         ]
-        read_only_fields = ['reservation_id', 'reservation_date']
+        read_only_fields = ['reservation_id', 'reservation_date', 'queue_position', 'ready_date']
     
     def get_user_name(self, obj):
         """Get user's full name"""
@@ -374,9 +485,9 @@ class NotificationSerializer(serializers.ModelSerializer):
         model = Notifications
         fields = [
             'notification_id', 'user', 'user_name', 'user_email', 'message', 
-            'notification_type', 'created_at', 'is_read'
+            'notification_type', 'created_at', 'is_read', 'event', 'loan', 'reservation', 'fine'
         ]
-        read_only_fields = ['notification_id', 'created_at']
+        read_only_fields = ['notification_id', 'created_at', 'event', 'loan', 'reservation', 'fine']
     
     def get_user_name(self, obj):
         """Get user's full name"""
@@ -391,6 +502,19 @@ class NotificationSerializer(serializers.ModelSerializer):
         return None
 
 
+class NotificationMarkReadSerializer(serializers.Serializer):
+    """Validate a bulk mark-as-read: notification ids, or everything up to a time"""
+    notification_ids = serializers.ListField(child=serializers.IntegerField(), required=False,
+                                             max_length=1000)
+    before = serializers.DateTimeField(required=False)
+    user_id = serializers.IntegerField(required=False, help_text="Librarians: whose notifications")
+
+    def validate(self, attrs):
+        if ('notification_ids' in attrs) == ('before' in attrs):
+            raise serializers.ValidationError('Give either notification_ids or before.')
+        return attrs
+
+
 class NotificationCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating custom notifications"""
     user_id = serializers.IntegerField(required=True, help_text="ID of the user to send notification to")
@@ -430,7 +554,7 @@ class FineSerializer(serializers.ModelSerializer):
     """Serializer for Fines"""
     user_name = serializers.SerializerMethodField()
     user_email = serializers.SerializerMethodField()
-    book_title = serializers.CharField(source='loan.book.title', read_only=True)
+    book_title = serializers.SerializerMethodField()
     is_paid = serializers.SerializerMethodField()
     
     class Meta:
@@ -453,9 +577,33 @@ class FineSerializer(serializers.ModelSerializer):
             return obj.user.email
         return None
     
+    def get_book_title(self, obj):
+        """Get the fined loan's book title (the loan may be archived)"""
+        # List views look the titles up in bulk (see loan_titles)
+        titles = self.context.get('loan_titles')
+        if titles is not None:
+            return titles.get(obj.loan_id)
+        try:
+            return obj.loan.book.title
+        except Loans.DoesNotExist:
+            archived = Loansarchive.objects.select_related('book').filter(pk=obj.loan_id).first()
+            return archived.book.title if archived else None
+    
     def get_is_paid(self, obj):
         """Check if fine is paid"""
         return obj.paid == 1
+    
+    @staticmethod
+    def loan_titles(fines):
+        """
+        Book titles for the fines' loans, live or archived, keyed by loan_id:
+        two queries however many fines there are.
+        """
+        loan_ids = {fine.loan_id for fine in fines}
+        titles = dict(Loans.objects.filter(loan_id__in=loan_ids).values_list('loan_id', 'book__title'))
+        titles.update(Loansarchive.objects.filter(loan_id__in=loan_ids - set(titles))
+                                          .values_list('loan_id', 'book__title'))
+        return titles
 
 
 class FineUpdateSerializer(serializers.ModelSerializer):
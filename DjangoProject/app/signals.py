@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Books, Authors, Catalogs, Publishers, Librarybranches, Bookauthors, Bookcatalogs
+from .search import invalidate_search_index
+from .catalog import syncing_book_links
+from .refdata import REFERENCE_TABLES, bump_version
+
+
+# -----------------------
+# Search index invalidation
+# -----------------------
+
+@receiver([post_save, post_delete], sender=Books)
+@receiver([post_save, post_delete], sender=Authors)
+@receiver([post_save, post_delete], sender=Catalogs)
+@receiver([post_save, post_delete], sender=Bookauthors)
+@receiver([post_save, post_delete], sender=Bookcatalogs)
+def catalog_changed(sender, **kwargs):
+    """Rebuild the in-process search index after catalog writes"""
+    invalidate_search_index()
+    # Invalidate again once committed so a rebuild racing the write can't stick
+    transaction.on_commit(invalidate_search_index)
+
+
+@receiver([post_save, post_delete], sender=Bookauthors)
+@receiver([post_save, post_delete], sender=Bookcatalogs)
+def book_links_changed(sender, instance, **kwargs):
+    """Bump the book's row version so its detail ETag changes"""
+    if syncing_book_links.get():
+        # sync_book_links bumps it once for the whole change
+        return
+    Books.objects.filter(pk=instance.book_id).update(updated_at=timezone.now())
+
+
+# -----------------------
+# Reference-data cache versions
+# -----------------------
+
+@receiver([post_save, post_delete], sender=Authors)
+@receiver([post_save, post_delete], sender=Catalogs)
+@receiver([post_save, post_delete], sender=Publishers)
+@receiver([post_save, post_delete], sender=Librarybranches)
+def reference_data_changed(sender, **kwargs):
+    """Bump the table version so cached lists and ETags are invalidated"""
+    table = REFERENCE_TABLES[sender]
+    bump_version(table)
+    # Bump again after commit so a payload cached mid-transaction is discarded
+    transaction.on_commit(lambda: bump_version(table))
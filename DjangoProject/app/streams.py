@@ -0,0 +1,57 @@
+"""
+In-process fan-out of new notifications to connected event streams.
+
+Streams (see api_views.notification_stream) subscribe per user and sleep
+until woken; code that creates notifications calls announce() with the
+recipients, which wakes their streams once the transaction commits. A
+wake-up carries no data: the stream then reads the user's rows past its
+cursor, so idle clients never touch the database.
+
+Fan-out is per process. Under several ASGI workers a stream only wakes for
+notifications created in its own process; the others still reach it on
+reconnect (Last-Event-ID) or the next wake-up.
+"""
+import threading
+
+from django.db import transaction
+
+
+class NotificationHub:
+    """Per-user registry of waiting streams (an event loop and an asyncio.Event each)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, user_id, loop, event):
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add((loop, event))
+
+    def unsubscribe(self, user_id, loop, event):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers:
+                subscribers.discard((loop, event))
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def publish(self, user_ids):
+        """Wake every stream of these users (callable from any thread)"""
+        with self._lock:
+            targets = [subscriber for user_id in user_ids for subscriber in self._subscribers.get(user_id, ())]
+        for loop, event in targets:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The stream's loop has closed; it unsubscribes on its way out
+                pass
+
+
+hub = NotificationHub()
+
+
+def announce(user_ids):
+    """Wake these users' streams when the current transaction commits"""
+    user_ids = set(user_ids)
+    if user_ids:
+        transaction.on_commit(lambda: hub.publish(user_ids))
@@ -1,14 +1,44 @@
-from django.test import TestCase, TransactionTestCase
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
 from django.urls import reverse
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from asgiref.sync import sync_to_async
 from django.utils import timezone
-from django.db import IntegrityError, DataError, transaction
+from django.db import IntegrityError, DataError, transaction, connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
 from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.cache import cache
 from decimal import Decimal
-from datetime import date
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+import asyncio
+import json
+import os
+import tempfile
+import threading
 from .models import (
     Authors, Bookauthors, Bookcatalogs, Books, Catalogs, Fines,
-    Librarians, Librarybranches, Loans, Notifications, Publishers,
-    Reservations, Students, Users
+    Librarians, Librarybranches, Loans, Loansarchive, Notificationoutbox, Notifications, Overdueloans,
+    Patroncirculation,
+    Publishers, Referenceversion, Reservations, Students, Users
+)
+from .catalog_export import export_catalog
+from .catalog_import import import_catalog
+from .pagination import BookCursorPagination
+from .streams import hub, announce
+from .outbox import claim_batch, drain_outbox, CLAIM_TIMEOUT, CLAIM_TIMEOUT_ERROR, MAX_ATTEMPTS
+from . import api_views
+from .circulation import (
+    checkout, return_many, roll_overdue, archive_loans, reconcile_circulation, reserve, expire_reservations,
+    send_overdue_notices,
+    NoCopiesAvailable, CheckoutBlocked, MAX_ACTIVE_LOANS,
 )
 
 
@@ -655,3 +685,1491 @@ class ViewIntegrationTests(TestCase):
         u = Users.objects.create(username="loginuser", password=password, email="log@me.com",
                                  first_name="Log", last_name="In", role="student", date_created=timezone.now())
         self.assertEqual(u.password, password)
+
+
+# ======================
+# Books API Tests
+# ======================
+class BookApiQueryCountTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.librarian = get_user_model().objects.create_user(
+            username="apilib", password="pass12345", role="librarian"
+        )
+        self.client.force_authenticate(user=self.librarian)
+        self.pub = Publishers.objects.create(name="QueryPub")
+        self.branch = Librarybranches.objects.create(branch_name="Query Branch", address="1 Q St")
+        self.authors = [Authors.objects.create(first_name="A%d" % i, last_name="L%d" % i) for i in range(3)]
+        self.cats = [Catalogs.objects.create(category_name="Cat%d" % i) for i in range(3)]
+
+    def make_books(self, count, start=0):
+        for i in range(start, start + count):
+            book = Books.objects.create(title="Book %d" % i, isbn="Q-%d" % i, available_copies=1,
+                                        publisher=self.pub, branch=self.branch)
+            for author in self.authors[:2]:
+                Bookauthors.objects.create(book=book, author=author)
+            for cat in self.cats[:2]:
+                Bookcatalogs.objects.create(book=book, catalog=cat)
+
+    def test_list_query_count_is_constant(self):
+        self.make_books(3)
+        # books + author links + category links, independent of page size
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/books/')
+        self.assertEqual(len(response.data['results']), 3)
+        self.make_books(10, start=3)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/books/')
+        results = response.data['results']
+        self.assertEqual(len(results), 13)
+        self.assertEqual(len(results[0]['authors']), 2)
+        self.assertEqual(results[0]['publisher_name'], "QueryPub")
+
+    def test_detail_query_count(self):
+        self.make_books(1)
+        book = Books.objects.get(isbn="Q-0")
+        with self.assertNumQueries(4):  # book, categories, authors, reference versions (ETag)
+            response = self.client.get('/api/books/%d/' % book.book_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['categories']), 2)
+        self.assertEqual(response.data['branch_name'], "Query Branch")
+
+    def test_cursor_pagination_walks_catalog(self):
+        self.make_books(7)
+        response = self.client.get('/api/books/', {'page_size': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['prev'])
+        titles = [b['title'] for b in response.data['results']]
+        next_url = response.data['next']
+        while next_url:
+            # every page costs the same fixed number of queries
+            with self.assertNumQueries(3):
+                response = self.client.get(next_url)
+            self.assertIsNotNone(response.data['prev'])
+            titles.extend(b['title'] for b in response.data['results'])
+            next_url = response.data['next']
+        self.assertEqual(titles, sorted("Book %d" % i for i in range(7)))
+
+    def test_list_is_paginated_by_default(self):
+        self.make_books(4)
+        with mock.patch.object(BookCursorPagination, 'page_size', 3):
+            response = self.client.get('/api/books/')
+        self.assertEqual([b['title'] for b in response.data['results']], ["Book 0", "Book 1", "Book 2"])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_sparse_fieldsets_skip_unrequested_relations(self):
+        self.make_books(4)
+        # no author/category prefetch, no publisher join
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/books/', {'fields': 'book_id,title,status'})
+        self.assertEqual(set(response.data['results'][0]), {'book_id', 'title', 'status'})
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/books/', {'fields': 'book_id,title,available_copies,authors'})
+        self.assertEqual(len(ctx.captured_queries), 2)
+        self.assertNotIn('description', ctx.captured_queries[0]['sql'])
+        self.assertEqual(response.data['results'][0]['authors'], ["A0 L0", "A1 L1"])
+
+        response = self.client.get('/api/books/', {'fields': 'title,authors', 'expand': 'authors'})
+        self.assertEqual(response.data['results'][0]['authors'][0]['last_name'], "L0")
+
+        book = Books.objects.get(isbn="Q-0")
+        with self.assertNumQueries(3):  # book, categories, reference versions (ETag)
+            response = self.client.get('/api/books/%d/' % book.book_id, {'fields': 'title,categories'})
+        self.assertEqual(response.data, {'title': "Book 0", 'categories': ["Cat0", "Cat1"]})
+
+
+class BookSearchApiTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            username="searcher", password="pass12345", role="student"
+        ))
+        tolkien = Authors.objects.create(first_name="John", last_name="Tolkien")
+        fantasy = Catalogs.objects.create(category_name="Fantasy")
+        self.hobbit = Books.objects.create(title="The Hobbit", isbn="978-0547928227", available_copies=2,
+                                           description="A dragon guards treasure")
+        self.dragons = Books.objects.create(title="Dragons of Autumn", isbn="978-0786915743", available_copies=1)
+        self.guide = Books.objects.create(title="Field Guide", isbn="111-2223334445", available_copies=1,
+                                          description="Includes a chapter on dragons")
+        Bookauthors.objects.create(book=self.hobbit, author=tolkien)
+        Bookcatalogs.objects.create(book=self.hobbit, catalog=fantasy)
+        Bookcatalogs.objects.create(book=self.dragons, catalog=fantasy)
+
+    def search(self, term, **params):
+        response = self.client.get('/api/books/', dict(params, search=term))
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_matches_author_and_category_names(self):
+        self.assertEqual([b['book_id'] for b in self.search("tolkien")], [self.hobbit.book_id])
+        self.assertEqual({b['book_id'] for b in self.search("fantasy")},
+                         {self.hobbit.book_id, self.dragons.book_id})
+
+    def test_title_matches_rank_above_description_matches(self):
+        results = self.search("dragons")
+        self.assertEqual([b['book_id'] for b in results], [self.dragons.book_id, self.guide.book_id])
+
+    def test_isbn_prefix(self):
+        self.assertEqual([b['book_id'] for b in self.search("978-0547")], [self.hobbit.book_id])
+
+    def test_index_follows_catalog_writes(self):
+        self.assertEqual(self.search("silmarillion"), [])
+        Books.objects.create(title="The Silmarillion", isbn="978-0618391110", available_copies=1)
+        self.assertEqual(len(self.search("silmarillion")), 1)
+
+    def test_result_cap_applies_after_filters(self):
+        Books.objects.create(title="Dragons Dragons", isbn="978-DEL", available_copies=1, is_deleted=True)
+        with mock.patch('app.search.SEARCH_RESULT_LIMIT', 1):
+            response = self.client.get('/api/books/', {'search': 'dragons'})
+            self.assertEqual([b['book_id'] for b in response.data['results']], [self.dragons.book_id])
+            self.assertEqual(response['X-Search-Truncated'], 'true')
+
+            response = self.client.get('/api/books/', {'search': 'dragons', 'available_only': 'true',
+                                                       'category': Catalogs.objects.get(category_name="Fantasy").pk})
+            self.assertEqual([b['book_id'] for b in response.data['results']], [self.dragons.book_id])
+            self.assertFalse(response.has_header('X-Search-Truncated'))
+
+    def test_paginated_search_keeps_rank_order(self):
+        first = self.client.get('/api/books/', {'search': "fantasy dragons", 'page_size': 1}).data
+        ids = [b['book_id'] for b in first['results']]
+        second = self.client.get(first['next']).data
+        ids += [b['book_id'] for b in second['results']]
+        self.assertEqual(ids[0], self.dragons.book_id)
+        self.assertEqual(len(set(ids)), 2)
+
+
+class BookImportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            username="importer", password="pass12345", role="librarian"
+        ))
+        self.pub = Publishers.objects.create(name="ImportPub")
+        self.author = Authors.objects.create(first_name="Ada", last_name="Lovelace")
+        self.cat = Catalogs.objects.create(category_name="Computing")
+
+    def test_csv_upload_creates_updates_and_reports_errors(self):
+        Books.objects.create(title="Old Title", isbn="IMP-1", available_copies=1)
+        csv_data = (
+            "title,isbn,pages,publisher,available_copies,authors,categories\n"
+            "New Title,IMP-1,100,%(pub)d,4,%(author)d,%(cat)d\n"
+            "Second,IMP-2,,%(pub)d,2,%(author)d,\n"
+            "Bad Copies,IMP-3,,,many,,\n"
+            "Missing Pub,IMP-4,,9999,1,,\n"
+            "Dup,IMP-2,,,1,,\n"
+        ) % {'pub': self.pub.publisher_id, 'author': self.author.author_id, 'cat': self.cat.catalog_id}
+        upload = SimpleUploadedFile("vendor.csv", csv_data.encode(), content_type="text/csv")
+        response = self.client.post('/api/books/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['rows'], 5)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(sorted(e['row'] for e in response.data['errors']), [4, 5, 6])
+
+        updated = Books.objects.get(isbn="IMP-1")
+        self.assertEqual(updated.title, "New Title")
+        # The live copy count of an existing book is left to circulation
+        self.assertEqual(updated.available_copies, 1)
+        self.assertEqual(Books.objects.get(isbn="IMP-2").available_copies, 2)
+        self.assertTrue(Bookauthors.objects.filter(book=updated, author=self.author).exists())
+        self.assertTrue(Bookcatalogs.objects.filter(book=updated, catalog=self.cat).exists())
+        self.assertFalse(Books.objects.filter(isbn__in=["IMP-3", "IMP-4"]).exists())
+
+    def test_partial_rows_only_update_their_columns(self):
+        Books.objects.create(title="Kept Title", isbn="IMP-P", available_copies=3, pages=120,
+                             description="Kept description", publisher=self.pub)
+        csv_data = (
+            "isbn,pages,description\n"
+            "IMP-P,150,\n"
+            "IMP-NEW,90,No title\n"
+        )
+        result = import_catalog(BytesIO(csv_data.encode()), 'csv')
+        self.assertEqual(result.updated, 1)
+        self.assertEqual(result.created, 0)
+        self.assertEqual([e['row'] for e in result.errors], [3])
+        self.assertIn('title', result.errors[0]['errors'])
+
+        book = Books.objects.get(isbn="IMP-P")
+        self.assertEqual(book.pages, 150)
+        self.assertEqual(book.title, "Kept Title")
+        self.assertEqual(book.description, "Kept description")
+        self.assertEqual(book.publisher_id, self.pub.publisher_id)
+        self.assertEqual(book.available_copies, 3)
+
+    def test_students_cannot_import(self):
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            username="student_imp", password="pass12345", role="student"
+        ))
+        upload = SimpleUploadedFile("vendor.csv", b"title,isbn\n", content_type="text/csv")
+        response = self.client.post('/api/books/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 403)
+
+    def test_jsonl_command_imports_in_batches(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as handle:
+            for i in range(250):
+                handle.write(json.dumps({'title': 'Bulk %d' % i, 'isbn': 'BULK-%d' % i,
+                                         'available_copies': 1, 'authors': [self.author.author_id]}) + "\n")
+            handle.write("not json\n")
+        self.addCleanup(os.remove, handle.name)
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', handle.name, '--batch-size', '100', stdout=out, stderr=err)
+        self.assertEqual(Books.objects.filter(isbn__startswith="BULK-").count(), 250)
+        self.assertEqual(Bookauthors.objects.filter(author=self.author).count(), 250)
+        self.assertIn("250 created", out.getvalue())
+        self.assertIn("Row 251", err.getvalue())
+
+
+class BookRelinkTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            username="relinker", password="pass12345", role="librarian"
+        ))
+        self.authors = [Authors.objects.create(first_name="F%d" % i, last_name="L%d" % i) for i in range(3)]
+        self.cats = [Catalogs.objects.create(category_name="Relink%d" % i) for i in range(2)]
+
+    def test_create_with_authors_and_categories(self):
+        response = self.client.post('/api/books/', {
+            'title': "Linked", 'isbn': "LINK-1", 'available_copies': 1,
+            'authors': [self.authors[0].author_id, self.authors[1].author_id, 9999],
+            'categories': [self.cats[0].catalog_id],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['authors']), 2)
+        self.assertEqual(len(response.data['categories']), 1)
+
+    def test_update_applies_only_the_difference(self):
+        book = Books.objects.create(title="Relink", isbn="LINK-2", available_copies=1)
+        kept = Bookauthors.objects.create(book=book, author=self.authors[0])
+        Bookauthors.objects.create(book=book, author=self.authors[1])
+        Bookcatalogs.objects.create(book=book, catalog=self.cats[0])
+        url = '/api/books/%d/' % book.book_id
+
+        # unchanged relationships cause no link writes at all
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.put(url, {
+                'title': "Relink 2",
+                'authors': [self.authors[1].author_id, self.authors[0].author_id],
+                'categories': [self.cats[0].catalog_id],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        link_writes = [q['sql'] for q in ctx.captured_queries
+                       if q['sql'].startswith(('INSERT', 'DELETE')) and ('bookauthors' in q['sql'] or 'bookcatalogs' in q['sql'])]
+        self.assertEqual(link_writes, [])
+
+        # swapping one author keeps the untouched link row, and the whole
+        # change bumps the book's row version with a single UPDATE
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.put(url, {
+                'authors': [self.authors[0].author_id, self.authors[2].author_id],
+                'categories': [],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        bump = 'UPDATE %s SET %s ' % (connection.ops.quote_name('books'), connection.ops.quote_name('updated_at'))
+        version_bumps = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith(bump)]
+        self.assertEqual(len(version_bumps), 1)
+        self.assertTrue(Bookauthors.objects.filter(pk=kept.pk).exists())
+        self.assertEqual(set(Bookauthors.objects.filter(book=book).values_list('author_id', flat=True)),
+                         {self.authors[0].author_id, self.authors[2].author_id})
+        self.assertEqual(response.data['categories'], [])
+
+
+class ReferenceDataCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            username="refdata", password="pass12345", role="librarian"
+        ))
+        Authors.objects.create(first_name="Cached", last_name="Author")
+
+    def test_etag_revalidation_and_invalidation(self):
+        response = self.client.get('/api/authors/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        # unchanged data: 304 without querying the table (only its version)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/authors/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # cached payload is reused for clients without an ETag
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/authors/')
+        self.assertEqual(len(response.data), 1)
+
+        Authors.objects.create(first_name="New", last_name="Author")
+        response = self.client.get('/api/authors/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data), 2)
+
+    def test_tables_are_versioned_independently(self):
+        for url in ('/api/branches/', '/api/categories/', '/api/publishers/'):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        etag = self.client.get('/api/publishers/')['ETag']
+        Librarybranches.objects.create(branch_name="Cache Branch", address="1 Cache St")
+        response = self.client.get('/api/publishers/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(self.client.get('/api/branches/').data), 1)
+
+    def test_versions_are_shared_between_processes(self):
+        etag = self.client.get('/api/authors/')['ETag']
+        # Another process with its own (empty) cache issues the same ETag
+        cache.clear()
+        self.assertEqual(self.client.get('/api/authors/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # ...and a change made there invalidates the payload cached here
+        self.client.get('/api/authors/')
+        Authors.objects.bulk_create([Authors(first_name="Elsewhere", last_name="Author")])
+        Referenceversion.objects.filter(table='authors').update(version=F('version') + 1)
+        response = self.client.get('/api/authors/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+
+
+class BookConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            username="etaglib", password="pass12345", role="librarian"
+        ))
+        self.author = Authors.objects.create(first_name="Etag", last_name="Author")
+        self.book = Books.objects.create(title="Versioned", isbn="VER-1", available_copies=2)
+        Bookauthors.objects.create(book=self.book, author=self.author)
+        self.url = '/api/books/%d/' % self.book.book_id
+
+    def test_unchanged_book_returns_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        with self.assertNumQueries(2):  # row version, reference versions
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_loan_changes_version(self):
+        etag = self.client.get(self.url)['ETag']
+        user = Users.objects.create(username="etagstudent", password="p", email="etag@e.com",
+                                    first_name="E", last_name="S", role="student", date_created=timezone.now())
+        response = self.client.post('/api/loans/', {
+            'user': user.user_id, 'book': self.book.book_id, 'due_date': date.today().isoformat()
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['available_copies'], 1)
+
+    def test_embedded_author_change_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.author.last_name = "Renamed"
+        self.author.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['authors'][0]['last_name'], "Renamed")
+
+    def test_fields_and_expand_change_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        sparse = self.client.get(self.url, {'fields': 'book_id,title'})
+        self.assertNotEqual(sparse['ETag'], etag)
+        response = self.client.get(self.url, {'fields': 'book_id,title'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {'book_id', 'title'})
+        response = self.client.get(self.url, {'fields': 'title,book_id'}, HTTP_IF_NONE_MATCH=sparse['ETag'])
+        self.assertEqual(response.status_code, 304)
+        expanded = self.client.get(self.url, {'fields': 'book_id,authors', 'expand': 'authors'})
+        self.assertNotEqual(expanded['ETag'], self.client.get(self.url, {'fields': 'book_id,authors'})['ETag'])
+
+
+class BookFacetsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            username="facets", password="pass12345", role="student"
+        ))
+        self.north = Librarybranches.objects.create(branch_name="North", address="1 N St")
+        self.south = Librarybranches.objects.create(branch_name="South", address="1 S St")
+        self.science = Catalogs.objects.create(category_name="Science")
+        self.history = Catalogs.objects.create(category_name="History")
+        rows = [
+            ("Physics Today", "1995", self.north, 1, [self.science]),
+            ("Chemistry Basics", "1998", self.north, 0, [self.science]),
+            ("Roman Empire", "2004", self.south, 2, [self.history]),
+            ("History of Science", "2011", self.south, 1, [self.science, self.history]),
+            ("Untitled Year", None, self.south, 1, []),
+        ]
+        for i, (title, year, branch, copies, cats) in enumerate(rows):
+            book = Books.objects.create(title=title, isbn="FAC-%d" % i, publication_year=year,
+                                        branch=branch, available_copies=copies)
+            for cat in cats:
+                Bookcatalogs.objects.create(book=book, catalog=cat)
+
+    def test_facet_counts(self):
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/books/', {'facets': 'true'})
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        self.assertEqual(data['count'], 5)
+        facets = data['facets']
+        self.assertEqual({f['branch_name']: f['count'] for f in facets['branch']}, {"North": 2, "South": 3})
+        self.assertEqual({f['category_name']: f['count'] for f in facets['category']}, {"Science": 3, "History": 2})
+        self.assertEqual({f['decade']: f['count'] for f in facets['decade']}, {1990: 2, 2000: 1, 2010: 1})
+        self.assertEqual(facets['availability'], {'available': 4, 'unavailable': 1})
+
+    def test_facets_follow_search_and_filters(self):
+        data = self.client.get('/api/books/', {'facets': 'true', 'search': 'science'}).data
+        self.assertEqual(data['count'], 3)
+        self.assertEqual({f['category_name']: f['count'] for f in data['facets']['category']},
+                         {"Science": 3, "History": 1})
+        data = self.client.get('/api/books/', {'facets': 'true', 'category': self.history.catalog_id}).data
+        self.assertEqual({f['branch_name']: f['count'] for f in data['facets']['branch']}, {"South": 2})
+
+    def test_new_list_filters(self):
+        titles = {b['title'] for b in self.client.get('/api/books/', {'decade': '1990'}).data['results']}
+        self.assertEqual(titles, {"Physics Today", "Chemistry Basics"})
+        titles = {b['title'] for b in self.client.get('/api/books/', {'category': self.science.catalog_id,
+                                                                      'available_only': 'true'}).data['results']}
+        self.assertEqual(titles, {"Physics Today", "History of Science"})
+
+    def test_malformed_filters_are_ignored(self):
+        for params in ({'category': 'abc'}, {'branch': 'x1'}, {'year': 'nineteen'}, {'decade': '19x0'}):
+            response = self.client.get('/api/books/', {'facets': 'true', **params})
+            self.assertEqual(response.status_code, 200, params)
+            self.assertEqual(response.data['count'], 5, params)
+
+
+class CatalogExportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            username="exporter", password="pass12345", role="librarian"
+        ))
+        self.author = Authors.objects.create(first_name="Ada", last_name="Lovelace")
+        self.cat = Catalogs.objects.create(category_name="Computing")
+        for i in range(5):
+            book = Books.objects.create(title="Export %d" % i, isbn="EXP-%d" % i, available_copies=i % 2)
+            Bookauthors.objects.create(book=book, author=self.author)
+            Bookcatalogs.objects.create(book=book, catalog=self.cat)
+        Books.objects.create(title="Gone", isbn="EXP-DEL", available_copies=1, is_deleted=True)
+
+    def test_jsonl_stream_reads_in_chunks(self):
+        response = self.client.get('/api/books/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        # Three queries (books, authors, categories) per chunk of two books
+        with CaptureQueriesContext(connection) as ctx:
+            lines = list(export_catalog(Books.objects.filter(is_deleted=False), 'jsonl', chunk_size=2))
+        self.assertEqual(len(ctx.captured_queries), 9)
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([r['isbn'] for r in rows], ["EXP-%d" % i for i in range(5)])
+        self.assertEqual(rows[0]['authors'][0]['last_name'], "Lovelace")
+
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(len(body.splitlines()), 5)
+
+    def test_csv_export_and_command(self):
+        response = self.client.get('/api/books/export/', {'output': 'csv', 'available_only': 'true'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith('book_id,title,isbn'))
+        self.assertEqual(len(lines), 3)
+        self.assertIn('Ada Lovelace', lines[1])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'catalog.jsonl')
+            call_command('export_catalog', '--output', path, '--chunk-size', '2', stdout=StringIO())
+            with open(path) as f:
+                self.assertEqual(len(f.readlines()), 5)
+
+    def test_students_cannot_export(self):
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            username="student_exp", password="pass12345", role="student"
+        ))
+        self.assertEqual(self.client.get('/api/books/export/').status_code, 403)
+        self.assertEqual(self.client.get('/api/books/export/', {'output': 'xml'}).status_code, 403)
+
+
+class CheckoutTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            username="desk", password="pass12345", role="librarian"
+        ))
+        self.patron = Users.objects.create(username="patron", password="p", email="patron@e.com",
+                                           first_name="P", last_name="T", role="student",
+                                           date_created=timezone.now())
+        self.book = Books.objects.create(title="Textbook", isbn="CHK-1", available_copies=1)
+
+    def test_checkout_claims_last_copy_once(self):
+        payload = {'user': self.patron.user_id, 'book': self.book.book_id, 'due_date': '2030-01-01'}
+        response = self.client.post('/api/loans/', payload)
+        self.assertEqual(response.status_code, 201)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+        response = self.client.post('/api/loans/', payload)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Loans.objects.filter(book=self.book).count(), 1)
+
+    def test_failed_claim_writes_nothing(self):
+        # Another desk took the copy after this request's validation read
+        Books.objects.filter(pk=self.book.pk).update(available_copies=0)
+        with self.assertRaises(NoCopiesAvailable):
+            checkout(self.patron, self.book, date(2030, 1, 1))
+        self.assertFalse(Loans.objects.exists())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+
+class CheckoutConcurrencyTest(TransactionTestCase):
+    COPIES = 5
+    WORKERS = 20
+
+    def test_concurrent_checkouts_never_oversell(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("Needs a test database shared between connections")
+        patron = Users.objects.create(username="rush", password="p", email="rush@e.com",
+                                      first_name="R", last_name="U", role="student",
+                                      date_created=timezone.now())
+        book = Books.objects.create(title="Semester Start", isbn="RUSH-1", available_copies=self.COPIES)
+        barrier = threading.Barrier(self.WORKERS)
+        results = []
+
+        def worker():
+            try:
+                barrier.wait()
+                checkout(patron, book, date(2030, 1, 1))
+                results.append('loaned')
+            except NoCopiesAvailable:
+                results.append('refused')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        book.refresh_from_db()
+        self.assertEqual(book.available_copies, 0)
+        self.assertEqual(results.count('loaned'), self.COPIES)
+        self.assertEqual(results.count('refused'), self.WORKERS - self.COPIES)
+        self.assertEqual(Loans.objects.filter(book=book).count(), self.COPIES)
+
+
+class FinePaymentConcurrencyTest(TransactionTestCase):
+    WORKERS = 8
+
+    def test_concurrent_payments_reduce_the_balance_once(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("Needs a test database shared between connections")
+        get_user_model().objects.create_user(username="fine_desk", password="pass12345", role="librarian")
+        patron = Users.objects.create(username="payer", password="p", email="payer@e.com",
+                                      first_name="P", last_name="Y", role="student",
+                                      date_created=timezone.now())
+        book = Books.objects.create(title="Costly", isbn="PAY-1", available_copies=1)
+        loan = checkout(patron, book, timezone.now().date() - timedelta(days=5))
+        return_many(loan_ids=[loan.pk])
+        fine = Fines.objects.get(loan=loan)
+        barrier = threading.Barrier(self.WORKERS)
+        codes = []
+
+        def worker():
+            try:
+                client = APIClient()
+                client.force_authenticate(user=get_user_model().objects.get(username="fine_desk"))
+                barrier.wait()
+                codes.append(client.post('/api/fines/%d/pay/' % fine.fine_id).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(codes.count(200), 1)
+        self.assertEqual(Patroncirculation.objects.get(user=patron).fine_balance, Decimal('0.00'))
+
+
+class BatchCheckoutTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            username="desk_batch", password="pass12345", role="librarian"
+        ))
+        self.patron = Users.objects.create(username="armful", password="p", email="armful@e.com",
+                                           first_name="A", last_name="F", role="student",
+                                           date_created=timezone.now())
+        self.books = [Books.objects.create(title="Batch %d" % i, isbn="BAT-%d" % i, available_copies=1)
+                      for i in range(5)]
+        Patroncirculation.objects.create(user=self.patron)
+
+    def test_one_round_trip_with_per_item_results(self):
+        Books.objects.filter(pk=self.books[4].pk).update(available_copies=0)
+        items = [{'book': b.book_id} for b in self.books[:4]]
+        items += [{'book': self.books[0].book_id},        # second copy of a single-copy title
+                  {'book': self.books[4].book_id},        # none on the shelf
+                  {'book': 999999, 'due_date': '2030-02-01'}]
+        payload = {'user': self.patron.user_id, 'due_date': '2030-01-01', 'items': items}
+
+        # user lookup, lock patron summary and books, savepoint pair,
+        # decrement, count the loans, bulk insert
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/loans/checkout/', payload, format='json')
+        self.assertLessEqual(len(ctx.captured_queries), 9)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['loaned'], response.data['failed']), (4, 3))
+        statuses = [r['status'] for r in response.data['results']]
+        self.assertEqual(statuses, ['loaned'] * 4 + ['failed'] * 3)
+        self.assertEqual(response.data['results'][0]['loan']['book_title'], "Batch 0")
+        self.assertIsNotNone(response.data['results'][0]['loan']['loan_id'])
+
+        self.assertEqual(Loans.objects.filter(user=self.patron).count(), 4)
+        self.assertEqual(set(Books.objects.values_list('available_copies', flat=True)), {0})
+
+    def test_nothing_available_is_a_400(self):
+        Books.objects.update(available_copies=0)
+        response = self.client.post('/api/loans/checkout/', {
+            'user': self.patron.user_id, 'due_date': '2030-01-01',
+            'items': [{'book': self.books[0].book_id}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Loans.objects.exists())
+
+    def test_due_date_required(self):
+        response = self.client.post('/api/loans/checkout/', {
+            'user': self.patron.user_id, 'items': [{'book': self.books[0].book_id}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('due_date', response.data)
+
+
+class BulkReturnTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            username="desk_return", password="pass12345", role="librarian"
+        ))
+        self.patron = Users.objects.create(username="reader", password="p", email="reader@e.com",
+                                           first_name="R", last_name="D", role="student",
+                                           date_created=timezone.now())
+        self.waiting = Users.objects.create(username="waiting", password="p", email="waiting@e.com",
+                                            first_name="W", last_name="T", role="student",
+                                            date_created=timezone.now())
+        self.today = timezone.now().date()
+
+    def lend(self, count, days_late=0, prefix="RET"):
+        loans = []
+        for i in range(count):
+            book = Books.objects.create(title="%s %d" % (prefix, i), isbn="%s-%d" % (prefix, i),
+                                        available_copies=0)
+            loans.append(Loans.objects.create(user=self.patron, book=book, loan_date=timezone.now(),
+                                              due_date=self.today - timedelta(days=days_late)))
+        # Loans made directly, so bring the patron summaries up to date
+        reconcile_circulation()
+        return loans
+
+    def test_fines_notices_and_reservations(self):
+        late, on_time = self.lend(1, days_late=3, prefix="LATE")[0], self.lend(1, prefix="OK")[0]
+        reserve(self.waiting, on_time.book)
+        response = self.client.post('/api/loans/return/', {
+            'loan_ids': [late.loan_id, 999999], 'isbns': [on_time.book.isbn, "NOPE"],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['returned'], response.data['failed'], response.data['fines_issued']),
+                         (2, 2, 1))
+        self.assertEqual(response.data['results'][0]['late_days'], 3)
+        self.assertEqual(response.data['results'][0]['fine_amount'], 3.0)
+
+        fine = Fines.objects.get(loan=late)
+        self.assertEqual(fine.amount, Decimal('3.00'))
+        self.assertEqual(Notifications.objects.get(event='fine_issued').fine, fine)
+        self.assertEqual(Notifications.objects.get(event='reservation_ready').reservation.user, self.waiting)
+        self.assertTrue(Notifications.objects.filter(user=self.patron, notification_type='overdue').exists())
+        self.assertEqual(Reservations.objects.get(book=on_time.book).status, 'ready')
+        self.assertTrue(Notifications.objects.filter(user=self.waiting, notification_type='reservation').exists())
+        self.assertEqual(set(Books.objects.values_list('available_copies', flat=True)), {1})
+        self.assertFalse(Loans.objects.filter(return_date__isnull=True).exists())
+
+        # Already returned, and no second fine
+        response = self.client.post('/api/loans/return/', {'loan_ids': [late.loan_id]}, format='json')
+        self.assertEqual(response.data['failed'], 1)
+        self.assertEqual(Fines.objects.filter(loan=late).count(), 1)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        def run(loans):
+            with CaptureQueriesContext(connection) as ctx:
+                results = return_many(loan_ids=[loan.loan_id for loan in loans])
+            self.assertTrue(all('loan' in r for r in results))
+            return len(ctx.captured_queries)
+
+        small = run(self.lend(3, days_late=2, prefix="S"))
+        large = run(self.lend(60, days_late=2, prefix="L"))
+        self.assertEqual(small, large)
+        self.assertEqual(Fines.objects.count(), 63)
+
+    def test_single_return_uses_same_path(self):
+        loan = self.lend(1, days_late=1)[0]
+        response = self.client.post('/api/loans/%d/return/' % loan.loan_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['fine_amount'], 1.0)
+        self.assertEqual(self.client.post('/api/loans/%d/return/' % loan.loan_id).status_code, 400)
+
+    def test_command(self):
+        loans = self.lend(2, prefix="CMD")
+        out = StringIO()
+        call_command('bulk_return', '--isbn', loans[0].book.isbn, '--loan', str(loans[1].loan_id), stdout=out)
+        self.assertIn("Returned 2 of 2 items", out.getvalue())
+
+
+class LoanListingTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            username="circ", password="pass12345", role="librarian"
+        ))
+        # Legacy record for the librarian, so the listing's lookup is a single query
+        Users.objects.create(username="circ", password="p", email="circ@e.com", first_name="C",
+                             last_name="L", role="librarian", date_created=timezone.now())
+        self.north = Librarybranches.objects.create(branch_name="North", address="1 N St")
+        self.south = Librarybranches.objects.create(branch_name="South", address="1 S St")
+        self.alice = Users.objects.create(username="alice", password="p", email="alice@e.com",
+                                          first_name="Alice", last_name="A", role="student",
+                                          date_created=timezone.now())
+        self.bob = Users.objects.create(username="bob", password="p", email="bob@e.com",
+                                        first_name="Bob", last_name="B", role="student",
+                                        date_created=timezone.now())
+        today = timezone.now().date()
+        self.loans = {}
+        rows = [
+            # name, user, branch, loaned days ago, due in days, returned
+            ("active", self.alice, self.north, 2, 12, False),
+            ("overdue", self.alice, self.south, 30, -16, False),
+            ("returned", self.bob, self.north, 40, -26, True),
+        ]
+        for i, (name, user, branch, ago, due, returned) in enumerate(rows):
+            book = Books.objects.create(title="Loaned %d" % i, isbn="LST-%d" % i,
+                                        available_copies=1, branch=branch)
+            self.loans[name] = Loans.objects.create(
+                user=user, book=book, loan_date=timezone.now() - timedelta(days=ago),
+                due_date=today + timedelta(days=due), return_date=today if returned else None,
+            )
+
+    def ids(self, params):
+        response = self.client.get('/api/loans/', params)
+        self.assertEqual(response.status_code, 200)
+        return {row['loan_id'] for row in response.data['results']}
+
+    def test_filters(self):
+        loan = self.loans
+        self.assertEqual(self.ids({'status': 'active'}), {loan['active'].loan_id, loan['overdue'].loan_id})
+        self.assertEqual(self.ids({'status': 'overdue'}), {loan['overdue'].loan_id})
+        self.assertEqual(self.ids({'status': 'returned'}), {loan['returned'].loan_id})
+        self.assertEqual(self.ids({'user': self.bob.user_id}), {loan['returned'].loan_id})
+        self.assertEqual(self.ids({'book': loan['active'].book_id}), {loan['active'].loan_id})
+        self.assertEqual(self.ids({'branch': self.north.branch_id}), {loan['active'].loan_id, loan['returned'].loan_id})
+        since = (timezone.now() - timedelta(days=35)).date().isoformat()
+        self.assertEqual(self.ids({'loaned_from': since}), {loan['active'].loan_id, loan['overdue'].loan_id})
+        self.assertEqual(self.ids({'loaned_to': since}), {loan['returned'].loan_id})
+        self.assertEqual(len(self.ids({'user': 'abc', 'loaned_from': '2024-02-30'})), 3)
+
+    def test_status_counts(self):
+        with self.assertNumQueries(1):
+            counts = self.client.get('/api/loans/counts/').data
+        self.assertEqual(counts, {'all': 3, 'active': 2, 'overdue': 1, 'returned': 1})
+        counts = self.client.get('/api/loans/counts/', {'branch': self.north.branch_id}).data
+        self.assertEqual(counts, {'all': 2, 'active': 1, 'overdue': 0, 'returned': 1})
+
+    def test_joined_loading_and_keyset_pages(self):
+        for i in range(10):
+            book = Books.objects.create(title="Bulk %d" % i, isbn="LSTB-%d" % i, available_copies=1)
+            Loans.objects.create(user=self.bob, book=book, loan_date=timezone.now(), due_date=timezone.now().date())
+        # loans joined with user and book (librarians skip the legacy user lookup)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/loans/')
+        # The default page (50) holds them all
+        self.assertEqual(len(response.data['results']), 13)
+        self.assertIsNone(response.data['next'])
+
+        seen = []
+        url, params = '/api/loans/', {'page_size': 5}
+        while url:
+            with self.assertNumQueries(1):
+                page = self.client.get(url, params).data
+            seen += [row['loan_id'] for row in page['results']]
+            url, params = page['next'], None
+        self.assertEqual(len(seen), 13)
+        self.assertEqual(len(set(seen)), 13)
+        self.assertEqual(seen[-1], self.loans['returned'].loan_id)
+
+
+class CirculationIndexPlanTest(TestCase):
+    """EXPLAIN the queries the API actually runs and check they pick the composite indexes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.student = get_user_model().objects.create_user(
+            username="planner", password="pass12345", role="student"
+        )
+        self.librarian = get_user_model().objects.create_user(
+            username="plan_lib", password="pass12345", role="librarian"
+        )
+        self.patron = Users.objects.create(username="planner", password="p", email="planner@e.com",
+                                           first_name="P", last_name="L", role="student",
+                                           date_created=timezone.now())
+        Users.objects.create(username="plan_lib", password="p", email="plan_lib@e.com", first_name="P",
+                             last_name="L", role="librarian", date_created=timezone.now())
+        today = timezone.now().date()
+        for i in range(5):
+            book = Books.objects.create(title="Plan %d" % i, isbn="PLAN-%d" % i, available_copies=0)
+            loan = Loans.objects.create(user=self.patron, book=book, loan_date=timezone.now(),
+                                        due_date=today - timedelta(days=i))
+            reserve(self.patron, book)
+            Notifications.objects.create(user=self.patron, message="n", notification_type='overdue',
+                                         created_at=timezone.now(), is_read=0)
+            Fines.objects.create(user=self.patron, loan=loan, amount=Decimal('1.00'), paid=0,
+                                 date_issued=timezone.now())
+
+    def plans(self, table, request):
+        """Run an API request and return the EXPLAIN output of each SELECT it made on `table`"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = request()
+        self.assertLess(response.status_code, 300)
+        marker = 'FROM %s' % connection.ops.quote_name(table)
+        explain = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        plans = []
+        with connection.cursor() as cursor:
+            for query in ctx.captured_queries:
+                if query['sql'].startswith('SELECT') and marker in query['sql']:
+                    cursor.execute(explain + query['sql'])
+                    plans.append(str(cursor.fetchall()))
+        self.assertTrue(plans, "no query on %s" % table)
+        return plans
+
+    def assertUsesIndex(self, index, table, request):
+        plans = self.plans(table, request)
+        self.assertTrue(any(index in plan for plan in plans), plans)
+
+    def test_api_queries_use_composite_indexes(self):
+        self.client.force_authenticate(user=self.student)
+        self.assertUsesIndex('loans_user_loan_date_idx', 'loans',
+                             lambda: self.client.get('/api/loans/'))
+        self.assertUsesIndex('notif_user_read_created_idx', 'notifications',
+                             lambda: self.client.get('/api/notifications/', {'is_read': 'false'}))
+        self.assertUsesIndex('COVERING INDEX notif_user_read_created_idx' if connection.vendor == 'sqlite'
+                             else 'notif_user_read_created_idx', 'notifications',
+                             lambda: self.client.get('/api/notifications/unread-count/'))
+        self.assertUsesIndex('fines_user_paid_issued_idx', 'fines',
+                             lambda: self.client.get('/api/fines/', {'paid': 'false'}))
+
+        self.client.force_authenticate(user=self.librarian)
+        self.assertUsesIndex('loans_return_due_idx', 'loans',
+                             lambda: self.client.get('/api/loans/', {'status': 'overdue'}))
+        loan_ids = list(Loans.objects.values_list('loan_id', flat=True))
+        self.assertUsesIndex('notif_loan_event_created_idx', 'notifications',
+                             lambda: self.client.post('/api/notifications/trigger-overdue/'))
+        self.assertUsesIndex('res_book_queue_idx', 'reservations',
+                             lambda: self.client.post('/api/loans/return/', {'loan_ids': loan_ids}, format='json'))
+
+
+class OverdueLoansTableTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            username="desk_overdue", password="pass12345", role="librarian"
+        ))
+        self.patron = Users.objects.create(username="late", password="p", email="late@e.com",
+                                           first_name="L", last_name="T", role="student",
+                                           date_created=timezone.now())
+        self.today = timezone.now().date()
+
+    def loan(self, isbn, due_in):
+        book = Books.objects.create(title="Due %s" % isbn, isbn=isbn, available_copies=1)
+        return checkout(self.patron, book, self.today + timedelta(days=due_in))
+
+    def test_checkout_return_and_daily_roll_forward(self):
+        backdated = self.loan("OD-1", -2)
+        due_today = self.loan("OD-2", 0)
+        self.loan("OD-3", 5)
+        self.assertEqual(list(Overdueloans.objects.values_list('loan_id', flat=True)), [backdated.loan_id])
+
+        # Next day: the loan due today rolls into the table
+        flagged, cleared = roll_overdue(self.today + timedelta(days=1))
+        self.assertEqual((flagged, cleared), (1, 0))
+        self.assertEqual(Overdueloans.objects.count(), 2)
+
+        return_many(loan_ids=[backdated.loan_id])
+        self.assertFalse(Overdueloans.objects.filter(loan=backdated).exists())
+
+        # Rows for loans that are no longer overdue are cleared
+        Loans.objects.filter(pk=due_today.pk).update(due_date=self.today + timedelta(days=14))
+        self.assertEqual(roll_overdue(self.today + timedelta(days=1)), (0, 1))
+
+    def test_dashboard_and_notices_read_the_table(self):
+        self.loan("OD-4", -3)
+        Loans.objects.create(user=self.patron, book=Books.objects.create(title="Unrolled", isbn="OD-5",
+                                                                         available_copies=1),
+                             loan_date=timezone.now(), due_date=self.today - timedelta(days=1))
+        self.assertEqual(self.client.get('/api/dashboard/stats/').data['overdue_loans'], 1)
+        call_command('roll_overdue', stdout=StringIO())
+        self.assertEqual(self.client.get('/api/dashboard/stats/').data['overdue_loans'], 2)
+
+        response = self.client.post('/api/notifications/trigger-overdue/')
+        self.assertEqual(response.data['notifications_created'], 2)
+
+
+class LoanArchiveTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.student = get_user_model().objects.create_user(
+            username="historian", password="pass12345", role="student"
+        )
+        self.patron = Users.objects.create(username="historian", password="p", email="historian@e.com",
+                                           first_name="H", last_name="S", role="student",
+                                           date_created=timezone.now())
+        today = timezone.now().date()
+        self.old = []
+        for i in range(5):
+            book = Books.objects.create(title="Old %d" % i, isbn="ARC-%d" % i, available_copies=1)
+            self.old.append(Loans.objects.create(
+                user=self.patron, book=book, loan_date=timezone.now() - timedelta(days=800 + i),
+                due_date=today - timedelta(days=780), return_date=today - timedelta(days=770),
+            ))
+        self.fine = Fines.objects.create(user=self.patron, loan=self.old[0], amount=Decimal('2.00'),
+                                         paid=0, date_issued=timezone.now())
+        book = Books.objects.create(title="Recent", isbn="ARC-NEW", available_copies=1)
+        self.recent = Loans.objects.create(user=self.patron, book=book, loan_date=timezone.now(),
+                                           due_date=today + timedelta(days=14))
+
+    def test_archive_in_chunks_keeps_fines(self):
+        out = StringIO()
+        call_command('archive_loans', '--older-than-days', '365', '--chunk-size', '2', stdout=out)
+        self.assertIn("Archived 5 loans", out.getvalue())
+        self.assertEqual(list(Loans.objects.values_list('loan_id', flat=True)), [self.recent.loan_id])
+        self.assertEqual(set(Loansarchive.objects.values_list('loan_id', flat=True)),
+                         {loan.loan_id for loan in self.old})
+
+        # The fine still points at the (archived) loan and can be paid
+        self.fine.refresh_from_db()
+        self.assertEqual(self.fine.loan_id, self.old[0].loan_id)
+        self.fine.paid = 1
+        self.fine.save()
+        self.client.force_authenticate(user=self.student)
+        fines = self.client.get('/api/fines/').data
+        self.assertEqual(fines[0]['book_title'], "Old 0")
+
+    def test_fine_titles_are_looked_up_in_bulk(self):
+        for loan in self.old[1:] + [self.recent]:
+            Fines.objects.create(user=self.patron, loan=loan, amount=Decimal('1.00'), paid=0,
+                                 date_issued=timezone.now())
+        archive_loans(older_than_days=365)
+        self.client.force_authenticate(user=self.student)
+        with self.assertNumQueries(4):  # legacy user, fines with users, live titles, archived titles
+            fines = self.client.get('/api/fines/').data
+        self.assertEqual({fine['book_title'] for fine in fines},
+                         {"Old %d" % i for i in range(5)} | {"Recent"})
+
+    def test_history_unions_live_and_archived(self):
+        archive_loans(older_than_days=365)
+        self.client.force_authenticate(user=self.student)
+        with self.assertNumQueries(4):  # legacy user, union, users, books
+            rows = self.client.get('/api/loans/').data['results']
+        self.assertEqual([r['loan_id'] for r in rows],
+                         [self.recent.loan_id] + [loan.loan_id for loan in self.old])
+        self.assertEqual(rows[1]['book_title'], "Old 0")
+        returned = self.client.get('/api/loans/', {'status': 'returned'}).data['results']
+        self.assertEqual(len(returned), 5)
+
+        seen = []
+        url, params = '/api/loans/', {'page_size': 2}
+        while url:
+            page = self.client.get(url, params).data
+            seen += [row['loan_id'] for row in page['results']]
+            url, params = page['next'], None
+        self.assertEqual(seen, [r['loan_id'] for r in rows])
+
+    def test_status_counts_include_archived_loans(self):
+        archive_loans(older_than_days=365)
+        self.client.force_authenticate(user=self.student)
+        with self.assertNumQueries(2):  # legacy user, one aggregate
+            counts = self.client.get('/api/loans/counts/', {'status': 'active'}).data
+        self.assertEqual(counts, {'all': 6, 'active': 1, 'overdue': 0, 'returned': 5})
+
+
+class PatronCirculationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            username="desk_limits", password="pass12345", role="librarian"
+        ))
+        self.patron = Users.objects.create(username="limited", password="p", email="limited@e.com",
+                                           first_name="L", last_name="M", role="student",
+                                           date_created=timezone.now())
+        self.today = timezone.now().date()
+        self.books = [Books.objects.create(title="Limit %d" % i, isbn="LIM-%d" % i, available_copies=1)
+                      for i in range(MAX_ACTIVE_LOANS + 1)]
+
+    def summary(self):
+        row = Patroncirculation.objects.get(user=self.patron)
+        return row.active_loans, row.overdue_loans, row.fine_balance
+
+    def test_loan_limit(self):
+        for book in self.books[:MAX_ACTIVE_LOANS]:
+            checkout(self.patron, book, self.today + timedelta(days=14))
+        with self.assertRaises(CheckoutBlocked):
+            checkout(self.patron, self.books[-1], self.today + timedelta(days=14))
+        self.assertEqual(Books.objects.get(pk=self.books[-1].pk).available_copies, 1)
+
+        # One conditional UPDATE for the slot, then the copy and the loan
+        return_many(loan_ids=[Loans.objects.filter(user=self.patron).first().pk])
+        with CaptureQueriesContext(connection) as ctx:
+            checkout(self.patron, self.books[-1], self.today + timedelta(days=14))
+        self.assertEqual(sum('patron_circulation' in q['sql'] for q in ctx.captured_queries), 1)
+        self.assertEqual(self.summary(), (MAX_ACTIVE_LOANS, 0, Decimal('0.00')))
+
+    def test_patron_without_summary_row(self):
+        loan = Loans.objects.create(user=self.patron, book=self.books[0], loan_date=timezone.now(),
+                                    due_date=self.today - timedelta(days=5))
+        self.assertFalse(Patroncirculation.objects.filter(user=self.patron).exists())
+        return_many(loan_ids=[loan.pk])
+        self.assertEqual(self.summary(), (0, 0, Decimal('5.00')))
+
+        Patroncirculation.objects.filter(user=self.patron).delete()
+        fine = Fines.objects.get(loan=loan)
+        self.assertEqual(self.client.post('/api/fines/%d/pay/' % fine.fine_id).status_code, 200)
+        self.assertEqual(self.summary(), (0, 0, Decimal('0.00')))
+
+    def test_batch_checkout_stops_at_limit(self):
+        checkout(self.patron, self.books[0], self.today + timedelta(days=14))
+        response = self.client.post('/api/loans/checkout/', {
+            'user': self.patron.user_id, 'due_date': '2030-01-01',
+            'items': [{'book': b.book_id} for b in self.books[1:]],
+        }, format='json')
+        self.assertEqual((response.data['loaned'], response.data['failed']), (MAX_ACTIVE_LOANS - 1, 1))
+        self.assertIn("Loan limit", response.data['results'][-1]['error'])
+        self.assertEqual(self.summary()[0], MAX_ACTIVE_LOANS)
+
+    def test_fines_block_until_paid(self):
+        loans = [checkout(self.patron, book, self.today - timedelta(days=8)) for book in self.books[:2]]
+        self.assertEqual(self.summary(), (2, 2, Decimal('0.00')))
+        return_many(loan_ids=[loan.pk for loan in loans])
+        self.assertEqual(self.summary(), (0, 0, Decimal('16.00')))
+
+        response = self.client.post('/api/loans/', {
+            'user': self.patron.user_id, 'book': self.books[2].book_id, 'due_date': '2030-01-01',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Outstanding fines", response.data['error'])
+
+        fines = list(Fines.objects.filter(user=self.patron))
+        self.client.post('/api/fines/%d/pay/' % fines[0].fine_id)
+        self.client.put('/api/fines/%d/update/' % fines[1].fine_id, {'amount': '5.00'}, format='json')
+        self.assertEqual(self.summary()[2], Decimal('5.00'))
+        response = self.client.post('/api/loans/', {
+            'user': self.patron.user_id, 'book': self.books[2].book_id, 'due_date': '2030-01-01',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        self.client.delete('/api/fines/%d/delete/' % fines[1].fine_id)
+        self.assertEqual(self.summary(), (1, 0, Decimal('0.00')))
+
+    def test_paying_a_fine_twice_reduces_the_balance_once(self):
+        loan = checkout(self.patron, self.books[0], self.today - timedelta(days=4))
+        return_many(loan_ids=[loan.pk])
+        fine = Fines.objects.get(loan=loan)
+        self.assertEqual(self.summary()[2], Decimal('4.00'))
+        self.assertEqual(self.client.post('/api/fines/%d/pay/' % fine.fine_id).status_code, 200)
+        self.assertEqual(self.client.post('/api/fines/%d/pay/' % fine.fine_id).status_code, 400)
+        self.assertEqual(self.summary()[2], Decimal('0.00'))
+
+    def test_roll_overdue_and_reconcile(self):
+        checkout(self.patron, self.books[0], self.today + timedelta(days=1))
+        roll_overdue(self.today + timedelta(days=5))
+        self.assertEqual(self.summary()[1], 1)
+
+        Loans.objects.create(user=self.patron, book=self.books[1], loan_date=timezone.now(),
+                             due_date=self.today + timedelta(days=14))
+        Patroncirculation.objects.filter(user=self.patron).update(fine_balance=Decimal('3.00'))
+        out = StringIO()
+        call_command('reconcile_circulation', '--dry-run', stdout=out)
+        self.assertIn("Found 1 drifted", out.getvalue())
+        call_command('reconcile_circulation', stdout=StringIO())
+        self.assertEqual(self.summary(), (2, 1, Decimal('0.00')))
+        self.assertEqual(reconcile_circulation(), [])
+
+
+class ReservationQueueTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.librarian = get_user_model().objects.create_user(
+            username="queue_desk", password="pass12345", role="librarian", first_name="Q", last_name="D"
+        )
+        self.client.force_authenticate(user=self.librarian)
+        self.book = Books.objects.create(title="Popular", isbn="QUEUE-1", available_copies=0)
+        self.patrons = [Users.objects.create(username="queue%d" % i, password="p", email="queue%d@e.com" % i,
+                                             first_name="Q", last_name=str(i), role="student",
+                                             date_created=timezone.now())
+                        for i in range(5)]
+
+    def queue(self):
+        return list(Reservations.objects.filter(book=self.book, queue_position__isnull=False)
+                    .order_by('queue_position').values_list('user_id', 'queue_position'))
+
+    def test_positions_follow_create_cancel_and_return(self):
+        created = [self.client.post('/api/reservations/', {'user': p.user_id, 'book': self.book.book_id,
+                                                           'status': 'pending'}, format='json').data
+                   for p in self.patrons]
+        self.assertEqual([r['queue_position'] for r in created], [1, 2, 3, 4, 5])
+
+        # Leaving the queue moves everyone behind up
+        self.client.post('/api/reservations/%d/cancel/' % created[1]['reservation_id'])
+        self.client.post('/api/reservations/%d/update-status/' % created[3]['reservation_id'], {'status': 'picked_up'})
+        self.assertEqual(self.queue(), [(self.patrons[0].user_id, 1), (self.patrons[2].user_id, 2),
+                                        (self.patrons[4].user_id, 3)])
+
+        # Two copies back: the first two in line are ready, the last moves to the front
+        loans = [Loans.objects.create(user=self.patrons[1], book=self.book, loan_date=timezone.now(),
+                                      due_date=timezone.now().date()) for _ in range(2)]
+        return_many(loan_ids=[loan.pk for loan in loans])
+        ready = Reservations.objects.filter(book=self.book, status='ready').values_list('user_id', flat=True)
+        self.assertEqual(set(ready), {self.patrons[0].user_id, self.patrons[2].user_id})
+        self.assertEqual(self.queue(), [(self.patrons[4].user_id, 1)])
+
+        response = self.client.get('/api/reservations/')
+        positions = {r['user']: r['queue_position'] for r in response.data}
+        self.assertEqual(positions[self.patrons[4].user_id], 1)
+        self.assertIsNone(positions[self.patrons[0].user_id])
+
+    def test_non_pending_reservation_has_no_position(self):
+        reservation = reserve(self.patrons[0], self.book, 'ready')
+        self.assertIsNone(reservation.queue_position)
+        self.assertEqual(reserve(self.patrons[1], self.book).queue_position, 1)
+
+
+class ReservationExpiryTest(TestCase):
+    def setUp(self):
+        self.patrons = [Users.objects.create(username="hold%d" % i, password="p", email="hold%d@e.com" % i,
+                                             first_name="H", last_name=str(i), role="student",
+                                             date_created=timezone.now())
+                        for i in range(3)]
+        self.book = Books.objects.create(title="On Hold", isbn="HOLD-1", available_copies=1)
+        self.now = timezone.now()
+
+    def test_expires_and_promotes_next_in_line(self):
+        stale = reserve(self.patrons[0], self.book, 'ready')
+        Reservations.objects.filter(pk=stale.pk).update(ready_date=self.now - timedelta(days=8))
+        fresh = reserve(self.patrons[1], Books.objects.create(title="Fresh", isbn="HOLD-2", available_copies=1),
+                        'ready')
+        waiting = reserve(self.patrons[2], self.book)
+
+        out = StringIO()
+        call_command('expire_reservations', '--days', '7', stdout=out)
+        self.assertIn("Expired 1 reservations, promoted 1", out.getvalue())
+
+        self.assertEqual(Reservations.objects.get(pk=stale.pk).status, 'expired')
+        self.assertEqual(Reservations.objects.get(pk=fresh.pk).status, 'ready')
+        waiting.refresh_from_db()
+        self.assertEqual((waiting.status, waiting.queue_position), ('ready', None))
+        self.assertIsNotNone(waiting.ready_date)
+        self.assertEqual(Notifications.objects.filter(user=self.patrons[0]).count(), 1)
+        self.assertIn("is ready", Notifications.objects.get(user=self.patrons[2]).message)
+        self.assertEqual(expire_reservations(), (0, 0))
+
+    def test_query_count_is_per_batch_not_per_reservation(self):
+        books = Books.objects.bulk_create([Books(title="Shelf %d" % i, isbn="SHELF-%d" % i, available_copies=0)
+                                           for i in range(600)])
+        old = self.now - timedelta(days=30)
+        Reservations.objects.bulk_create(
+            [Reservations(user=self.patrons[i % 3], book=book, reservation_date=old, status='ready', ready_date=old)
+             for i, book in enumerate(books) for _ in range(2)]
+            + [Reservations(user=self.patrons[2], book=book, reservation_date=old, status='pending',
+                            queue_position=1) for book in books[:100]]
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(expire_reservations(now=self.now), (1200, 100))
+        # lock + update, then lookup + two updates per 500 titles (inserts
+        # are batched by the backend's parameter limit)
+        queries = [q['sql'] for q in ctx.captured_queries if not q['sql'].startswith('INSERT')]
+        self.assertLessEqual(len(queries), 10)
+        self.assertEqual(Notifications.objects.count(), 1300)
+
+
+class OverdueNoticeTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=get_user_model().objects.create_user(
+            username="notice_desk", password="pass12345", role="librarian"
+        ))
+        self.patron = Users.objects.create(username="tardy", password="p", email="tardy@e.com",
+                                           first_name="T", last_name="Y", role="student",
+                                           date_created=timezone.now())
+        self.today = timezone.now().date()
+
+    def lend_overdue(self, count, prefix):
+        for i in range(count):
+            book = Books.objects.create(title="%s %d%%" % (prefix, i), isbn="%s-%d" % (prefix, i),
+                                        available_copies=0)
+            Loans.objects.create(user=self.patron, book=book, loan_date=timezone.now(),
+                                 due_date=self.today - timedelta(days=3))
+        roll_overdue()
+
+    def test_notices_once_per_interval(self):
+        self.lend_overdue(3, "Late")
+        loans = list(Loans.objects.order_by('loan_id'))
+        for loan, days_ago in ((loans[0], 2), (loans[1], 8)):
+            Notifications.objects.create(user=self.patron, notification_type='overdue', is_read=0,
+                                         created_at=timezone.now() - timedelta(days=days_ago),
+                                         message="Overdue", event='overdue', loan=loan)
+        response = self.client.post('/api/notifications/trigger-overdue/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['notifications_created'], response.data['overdue_loans_count']), (2, 3))
+        self.assertEqual(set(response.data['timings_ms']), {'roll', 'select', 'insert', 'total'})
+        self.assertIn("'Late 2%' is 3 days overdue", Notifications.objects.latest('notification_id').message)
+        self.assertEqual(send_overdue_notices()['created'], 0)
+        self.assertEqual(Notifications.objects.filter(loan=loans[2], event='overdue').count(), 1)
+
+    def test_rolls_overdue_loans_first(self):
+        # Fell due since the last roll: not in overdue_loans yet
+        late = Loans.objects.create(user=self.patron, loan_date=timezone.now(),
+                                    due_date=self.today - timedelta(days=1),
+                                    book=Books.objects.create(title="Unrolled", isbn="ROLL-1", available_copies=0))
+        self.assertFalse(Overdueloans.objects.filter(loan=late).exists())
+        response = self.client.post('/api/notifications/trigger-overdue/')
+        self.assertEqual((response.data['notifications_created'], response.data['overdue_loans_count']), (1, 1))
+        self.assertTrue(Notifications.objects.filter(loan=late, event='overdue').exists())
+        self.assertEqual(Patroncirculation.objects.get(user=self.patron).overdue_loans, 1)
+
+    def test_titles_that_contain_each_other_are_separate(self):
+        for isbn, title in (("DUNE-1", "Dune"), ("DUNE-2", "Dune Messiah")):
+            Loans.objects.create(user=self.patron, loan_date=timezone.now(),
+                                 due_date=self.today - timedelta(days=3),
+                                 book=Books.objects.create(title=title, isbn=isbn, available_copies=0))
+        roll_overdue()
+        Notifications.objects.create(user=self.patron, notification_type='overdue', is_read=0,
+                                     created_at=timezone.now(), message="Your book 'Dune Messiah' is overdue",
+                                     event='overdue', loan=Loans.objects.get(book__isbn="DUNE-2"))
+        self.assertEqual(send_overdue_notices()['created'], 1)
+        self.assertTrue(Notifications.objects.filter(loan__book__isbn="DUNE-1", event='overdue').exists())
+
+    def test_query_count_is_per_chunk(self):
+        self.lend_overdue(2, "Few")
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(send_overdue_notices(chunk_size=50)['created'], 2)
+        few = len(ctx.captured_queries)
+        Notifications.objects.all().delete()
+        self.lend_overdue(40, "Many")
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(send_overdue_notices(chunk_size=50)['created'], 42)
+        self.assertEqual(len(ctx.captured_queries), few)
+
+
+class NotificationBulkReadTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.student = get_user_model().objects.create_user(
+            username="inbox", password="pass12345", role="student", first_name="I", last_name="B"
+        )
+        self.client.force_authenticate(user=self.student)
+        self.me = Users.objects.create(username="inbox", password="p", email="inbox@e.com", first_name="I",
+                                       last_name="B", role="student", date_created=timezone.now())
+        self.other = Users.objects.create(username="other_inbox", password="p", email="other_inbox@e.com",
+                                          first_name="O", last_name="B", role="student",
+                                          date_created=timezone.now())
+        now = timezone.now()
+        self.mine = [Notifications.objects.create(user=self.me, message="m%d" % i, notification_type='general',
+                                                  created_at=now - timedelta(days=i), is_read=0)
+                     for i in range(4)]
+        self.theirs = Notifications.objects.create(user=self.other, message="x", notification_type='general',
+                                                   created_at=now, is_read=0)
+
+    def test_mark_ids_and_before(self):
+        self.assertEqual(self.client.get('/api/notifications/unread-count/').data['unread'], 4)
+        with self.assertNumQueries(2):  # legacy user, one UPDATE
+            response = self.client.post('/api/notifications/read/', {
+                'notification_ids': [self.mine[0].pk, self.theirs.pk],
+            }, format='json')
+        self.assertEqual(response.data['marked'], 1)
+        self.assertEqual(Notifications.objects.get(pk=self.theirs.pk).is_read, 0)
+
+        before = (timezone.now() - timedelta(hours=36)).isoformat()
+        response = self.client.post('/api/notifications/read/', {'before': before}, format='json')
+        self.assertEqual(response.data['marked'], 2)
+        with self.assertNumQueries(2):  # legacy user, count
+            self.assertEqual(self.client.get('/api/notifications/unread-count/').data['unread'], 1)
+
+    def test_needs_exactly_one_selector(self):
+        self.assertEqual(self.client.post('/api/notifications/read/', {}, format='json').status_code, 400)
+        response = self.client.post('/api/notifications/read/', {
+            'notification_ids': [self.mine[0].pk], 'before': timezone.now().isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class NotificationStreamTest(TestCase):
+    def setUp(self):
+        self.account = get_user_model().objects.create_user(
+            username="listener", password="pass12345", role="student", first_name="L", last_name="S"
+        )
+        self.me = Users.objects.create(username="listener", password="p", email="listener@e.com", first_name="L",
+                                       last_name="S", role="student", date_created=timezone.now())
+        self.old = Notifications.objects.create(user=self.me, message="before connecting",
+                                                notification_type='general', created_at=timezone.now(), is_read=0)
+        client = APIClient()
+        client.force_authenticate(user=self.account)
+        self.ticket = client.post('/api/notifications/stream/ticket/').data['ticket']
+
+    def notify(self, message):
+        with self.captureOnCommitCallbacks(execute=True):
+            notification = Notifications.objects.create(user=self.me, message=message, notification_type='general',
+                                                        created_at=timezone.now(), is_read=0)
+            announce([self.me.user_id])
+        return notification
+
+    async def test_pushes_new_notifications(self):
+        stream = api_views.notification_events(self.me.user_id, self.old.pk)
+        first = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.05)
+        self.assertFalse(first.done())  # nothing new yet
+
+        notification = await sync_to_async(self.notify)("hello")
+        chunk = await asyncio.wait_for(first, 5)
+        self.assertTrue(chunk.startswith("id: %d\nevent: notification\n" % notification.pk))
+        self.assertIn('"message": "hello"', chunk)
+        await stream.aclose()
+
+    async def test_resumes_after_last_event_id(self):
+        newer = await sync_to_async(self.notify)("while away")
+        response = await self.async_client.get('/api/notifications/stream/', {'ticket': self.ticket},
+                                               headers={"Last-Event-ID": str(self.old.pk)})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        chunk = await asyncio.wait_for(anext(stream), 5)
+        self.assertIn(b"id: %d\n" % newer.pk, chunk)
+        await response.streaming_content.aclose()
+
+    async def test_idle_stream_only_sends_keepalives(self):
+        reads = []
+        original = api_views.STREAM_KEEPALIVE, api_views._notifications_after
+        api_views.STREAM_KEEPALIVE = 0.01
+        api_views._notifications_after = lambda *args: reads.append(args) or original[1](*args)
+        try:
+            stream = api_views.notification_events(self.me.user_id, self.old.pk)
+            chunks = [await asyncio.wait_for(anext(stream), 5) for _ in range(3)]
+            self.assertEqual(chunks, [": keep-alive\n\n"] * 3)
+            self.assertEqual(len(reads), 1)  # the catch-up read on connect
+            self.assertIn(self.me.user_id, hub._subscribers)
+            await stream.aclose()
+            self.assertNotIn(self.me.user_id, hub._subscribers)
+        finally:
+            api_views.STREAM_KEEPALIVE, api_views._notifications_after = original
+
+    async def test_requires_valid_ticket(self):
+        response = await self.async_client.get('/api/notifications/stream/', {'ticket': 'nope'})
+        self.assertEqual(response.status_code, 401)
+        with mock.patch.object(api_views, 'STREAM_TICKET_MAX_AGE', -1):
+            response = await self.async_client.get('/api/notifications/stream/', {'ticket': self.ticket})
+        self.assertEqual(response.status_code, 401)
+        token = str(RefreshToken.for_user(self.account).access_token)
+        response = await self.async_client.get('/api/notifications/stream/', {'token': token})
+        self.assertEqual(response.status_code, 401)  # JWTs don't go in the query string
+
+    def test_not_served_under_wsgi(self):
+        response = self.client.get('/api/notifications/stream/', {'ticket': self.ticket})
+        self.assertEqual(response.status_code, 501)
+
+
+class BouncingEmailBackend(LocmemEmailBackend):
+    """locmem backend that refuses mail to addresses starting with 'bounce'"""
+
+    def send_messages(self, messages):
+        for message in messages:
+            if any(address.startswith('bounce') for address in message.to):
+                raise ConnectionRefusedError("550 mailbox unavailable")
+        return super().send_messages(messages)
+
+
+class NotificationOutboxTest(TestCase):
+    def setUp(self):
+        self.patron = Users.objects.create(username="mailbox", password="p", email="mailbox@e.com",
+                                           first_name="M", last_name="B", role="student",
+                                           date_created=timezone.now())
+        self.today = timezone.now().date()
+
+    def test_return_queues_email_with_its_notifications(self):
+        book = Books.objects.create(title="Post Office", isbn="MAIL-1", available_copies=0)
+        loan = Loans.objects.create(user=self.patron, book=book, loan_date=timezone.now(),
+                                    due_date=self.today - timedelta(days=2))
+        return_many(loan_ids=[loan.pk])
+        self.assertEqual(Notificationoutbox.objects.count(), Notifications.objects.count())
+        self.assertEqual(len(mail.outbox), 0)  # nothing sent inline
+
+        out = StringIO()
+        call_command('deliver_notifications', '--workers', '1', stdout=out)
+        self.assertIn("Sent 1, rescheduled 0, dead-lettered 0", out.getvalue())
+        self.assertEqual(mail.outbox[0].to, ["mailbox@e.com"])
+        self.assertIn("Post Office", mail.outbox[0].body)
+        self.assertEqual(Notificationoutbox.objects.get().status, 'sent')
+        self.assertEqual(drain_outbox(workers=1), {'sent': 0, 'retried': 0, 'dead': 0})
+
+    @override_settings(EMAIL_BACKEND='app.tests.BouncingEmailBackend')
+    def test_retries_with_backoff_then_dead_letters(self):
+        self.patron.email = "bounce@e.com"
+        self.patron.save()
+        for user, message in ((self.patron, "bounces"), (Users.objects.create(
+                username="fine_mail", password="p", email="fine_mail@e.com", first_name="F", last_name="M",
+                role="student", date_created=timezone.now()), "arrives")):
+            Notificationoutbox.objects.create(user=user, subject="s", body=message, next_attempt_at=timezone.now(),
+                                              created_at=timezone.now())
+        self.assertEqual(drain_outbox(workers=1), {'sent': 1, 'retried': 1, 'dead': 0})
+        row = Notificationoutbox.objects.get(user=self.patron)
+        self.assertEqual((row.status, row.attempts), ('pending', 1))
+        self.assertIn("550", row.last_error)
+        self.assertGreater(row.next_attempt_at, timezone.now())
+        self.assertEqual(drain_outbox(workers=1)['retried'], 0)  # not due yet
+
+        for _ in range(MAX_ATTEMPTS - 1):
+            Notificationoutbox.objects.filter(pk=row.pk).update(next_attempt_at=timezone.now())
+            drain_outbox(workers=1)
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), ('dead', MAX_ATTEMPTS))
+        self.assertEqual(len(mail.outbox), 1)
+
+
+    def test_abandoned_claims_count_as_attempts(self):
+        row = Notificationoutbox.objects.create(user=self.patron, subject="s", body="stuck",
+                                                next_attempt_at=timezone.now(), created_at=timezone.now())
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            # A worker claimed the row and died before recording the send
+            Notificationoutbox.objects.filter(pk=row.pk).update(
+                status='sending', claimed_at=timezone.now() - CLAIM_TIMEOUT - timedelta(minutes=1))
+            claimed = claim_batch()
+            row.refresh_from_db()
+            self.assertEqual(row.attempts, attempt)
+            if attempt < MAX_ATTEMPTS:
+                self.assertEqual([r.pk for r in claimed], [row.pk])
+                self.assertEqual(row.status, 'sending')
+        self.assertEqual(claimed, [])
+        self.assertEqual(row.status, 'dead')
+        self.assertEqual(row.last_error, CLAIM_TIMEOUT_ERROR)
+
+
+class NotificationOutboxWorkerPoolTest(TransactionTestCase):
+    def test_each_row_is_sent_once(self):
+        if not connection.features.has_select_for_update_skip_locked:
+            self.skipTest("Workers claim rows with SELECT ... FOR UPDATE SKIP LOCKED")
+        now = timezone.now()
+        users = [Users.objects.create(username="pool%d" % i, password="p", email="pool%d@e.com" % i,
+                                      first_name="P", last_name=str(i), role="student", date_created=now)
+                 for i in range(60)]
+        Notificationoutbox.objects.bulk_create([
+            Notificationoutbox(user=user, subject="s", body="b", next_attempt_at=now, created_at=now)
+            for user in users
+        ])
+        self.assertEqual(drain_outbox(workers=4, batch_size=7)['sent'], 60)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), sorted(u.email for u in users))
+        self.assertFalse(Notificationoutbox.objects.exclude(status='sent').exists())
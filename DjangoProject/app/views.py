@@ -1,9 +1,9 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse_lazy
-from django.utils import timezone
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from .models import Books, Users, Loans
 from .forms import BookForm, UserForm, LoanForm
+from .circulation import checkout, return_many, CheckoutError
 
 # ----------------------------
 # Books CRUD
@@ -88,16 +88,11 @@ def loan_create(request):
     if request.method == 'POST':
         form = LoanForm(request.POST)
         if form.is_valid():
-            loan = form.save(commit=False)
-            book = loan.book
-            if book.available_copies > 0:
-                book.available_copies -= 1
-                book.save()
-                loan.loan_date = timezone.now()
-                loan.save()
+            try:
+                checkout(form.cleaned_data['user'], form.cleaned_data['book'], form.cleaned_data['due_date'])
                 return redirect('loan_list')
-            else:
-                form.add_error('book', 'No available copies for this book.')
+            except CheckoutError as e:
+                form.add_error('book', str(e))
     else:
         form = LoanForm()
     return render(request, 'loans/loan_form.html', {'form': form})
@@ -106,8 +101,5 @@ def loan_create(request):
 def loan_return(request, loan_id):
     loan = get_object_or_404(Loans, pk=loan_id)
     if loan.return_date is None:
-        loan.return_date = timezone.now()
-        loan.book.available_copies += 1
-        loan.book.save()
-        loan.save()
+        return_many(loan_ids=[loan.pk])
     return redirect('loan_list')
\ No newline at end of file
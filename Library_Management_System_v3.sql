@@ -218,6 +218,8 @@ CREATE TABLE IF NOT EXISTS `mydb`.`Loans` (
   PRIMARY KEY (`loan_id`),
   INDEX `idx_loans_user` (`user_id` ASC) VISIBLE,
   INDEX `idx_loans_book` (`book_id` ASC) VISIBLE,
+  INDEX `loans_user_loan_date_idx` (`user_id` ASC, `loan_date` DESC) VISIBLE,
+  INDEX `loans_return_due_idx` (`return_date` ASC, `due_date` ASC) VISIBLE,
   CONSTRAINT `fk_loans_user`
     FOREIGN KEY (`user_id`)
     REFERENCES `mydb`.`Users` (`user_id`)
@@ -271,6 +273,7 @@ CREATE TABLE IF NOT EXISTS `mydb`.`Fines` (
   PRIMARY KEY (`fine_id`),
   INDEX `idx_fines_loan` (`loan_id` ASC) VISIBLE,
   INDEX `idx_fines_user` (`user_id` ASC) VISIBLE,
+  INDEX `fines_user_paid_issued_idx` (`user_id` ASC, `paid` ASC, `date_issued` ASC) VISIBLE,
   CONSTRAINT `fk_fines_user`
     FOREIGN KEY (`user_id`)
     REFERENCES `mydb`.`Users` (`user_id`)
@@ -297,6 +300,7 @@ CREATE TABLE IF NOT EXISTS `mydb`.`Notifications` (
   `is_read` TINYINT(1) NOT NULL DEFAULT 0,
   PRIMARY KEY (`notification_id`),
   INDEX `idx_notifications_user` (`user_id` ASC),
+  INDEX `notif_user_read_created_idx` (`user_id` ASC, `is_read` ASC, `created_at` ASC) VISIBLE,
   CONSTRAINT `fk_notifications_user`
     FOREIGN KEY (`user_id`)
     REFERENCES `mydb`.`Users` (`user_id`)
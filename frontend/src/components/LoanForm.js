@@ -1,7 +1,15 @@
 import React, { useState, useEffect } from 'react';
+import api from '../utils/axiosConfig';
 import './LoanForm.css';
 
-function LoanForm({ onSubmit, onCancel, loading, books = [], users = [] }) {
+// Only what the picker renders, and only the first page of matches
+const BOOK_PICKER_PARAMS = {
+  fields: 'book_id,title,isbn,available_copies',
+  available_only: 'true',
+  page_size: 20,
+};
+
+function LoanForm({ onSubmit, onCancel, loading, users = [] }) {
   const [form, setForm] = useState({
     user: '',
     book: '',
@@ -9,6 +17,8 @@ function LoanForm({ onSubmit, onCancel, loading, books = [], users = [] }) {
   });
   const [studentSearch, setStudentSearch] = useState('');
   const [bookSearch, setBookSearch] = useState('');
+  const [books, setBooks] = useState([]);
+  const [searchingBooks, setSearchingBooks] = useState(false);
 
   // Calculate default due date (14 days from now)
   useEffect(() => {
@@ -19,6 +29,28 @@ function LoanForm({ onSubmit, onCancel, loading, books = [], users = [] }) {
     setForm(prev => ({ ...prev, due_date: formattedDate }));
   }, []);
 
+  // Search the catalog as the librarian types, once typing pauses
+  useEffect(() => {
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        setSearchingBooks(true);
+        const term = bookSearch.trim();
+        const params = term ? { ...BOOK_PICKER_PARAMS, search: term } : BOOK_PICKER_PARAMS;
+        const res = await api.get('/books/', { params });
+        if (!cancelled) setBooks(res.data.results);
+      } catch (err) {
+        console.error('Error searching books:', err);
+      } finally {
+        if (!cancelled) setSearchingBooks(false);
+      }
+    }, 300);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [bookSearch]);
+
   const handleChange = (e) => {
     const { name, value } = e.target;
     setForm(prev => ({ ...prev, [name]: value }));
@@ -36,15 +68,6 @@ function LoanForm({ onSubmit, onCancel, loading, books = [], users = [] }) {
            username.includes(searchLower);
   });
 
-  // Filter books by search term (title or ISBN)
-  const filteredBooks = books.filter(book => {
-    if (!bookSearch) return true;
-    const searchLower = bookSearch.toLowerCase();
-    const title = (book.title || '').toLowerCase();
-    const isbn = (book.isbn || '').toLowerCase();
-    return title.includes(searchLower) || isbn.includes(searchLower);
-  });
-
   const handleSubmit = (e) => {
     e.preventDefault();
     onSubmit({
@@ -108,18 +131,17 @@ function LoanForm({ onSubmit, onCancel, loading, books = [], users = [] }) {
             className="form-select"
           >
             <option value="">Select a book...</option>
-            {filteredBooks
-              .filter(book => book.available_copies > 0)
-              .map((book) => (
-                <option key={book.book_id} value={book.book_id}>
-                  {book.title} (ISBN: {book.isbn}) - {book.available_copies} available
-                </option>
-              ))}
+            {books.map((book) => (
+              <option key={book.book_id} value={book.book_id}>
+                {book.title} (ISBN: {book.isbn}) - {book.available_copies} available
+              </option>
+            ))}
           </select>
-          {bookSearch && filteredBooks.filter(book => book.available_copies > 0).length === 0 && (
+          {searchingBooks && <p className="form-hint">Searching...</p>}
+          {!searchingBooks && bookSearch && books.length === 0 && (
             <p className="form-hint">No available books found matching "{bookSearch}"</p>
           )}
-          {!bookSearch && filteredBooks.filter(book => book.available_copies > 0).length === 0 && (
+          {!searchingBooks && !bookSearch && books.length === 0 && (
             <p className="form-hint">No books available for loan</p>
           )}
         </div>
@@ -7,6 +7,8 @@ import './Books.css';
 
 function Books() {
   const [books, setBooks] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [searchTerm, setSearchTerm] = useState('');
@@ -38,7 +40,8 @@ function Books() {
       const url = queryString ? `/books/?${queryString}` : '/books/';
 
       const response = await api.get(url);
-      setBooks(response.data);
+      setBooks(response.data.results);
+      setNextPage(response.data.next);
     } catch (err) {
       if (err.response?.status === 401) {
         navigate('/login');
@@ -52,6 +55,23 @@ function Books() {
     }
   };
 
+  const loadMore = async () => {
+    try {
+      setLoadingMore(true);
+      const response = await api.get(nextPage);
+      setBooks((current) => [...current, ...response.data.results]);
+      setNextPage(response.data.next);
+    } catch (err) {
+      if (err.response?.status === 401) {
+        navigate('/login');
+      } else {
+        console.error('Error loading more books:', err.response?.data || err);
+      }
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleSearch = (term) => {
     setSearchTerm(term);
   };
@@ -116,13 +136,20 @@ function Books() {
             ) : (
               <>
                 <div className="books-count">
-                  Found {books.length} {books.length === 1 ? 'book' : 'books'}
+                  {nextPage ? 'Showing' : 'Found'} {books.length} {books.length === 1 ? 'book' : 'books'}
                 </div>
                 <div className="books-grid">
                   {books.map((book) => (
                     <BookCard key={book.book_id} book={book} />
                   ))}
                 </div>
+                {nextPage && (
+                  <div className="load-more-container">
+                    <button onClick={loadMore} className="load-more-btn" disabled={loadingMore}>
+                      {loadingMore ? 'Loading...' : 'Load More'}
+                    </button>
+                  </div>
+                )}
               </>
             )}
           </>
@@ -7,6 +7,8 @@ import './LibrarianBooks.css';
 
 function LibrarianBooks() {
   const [books, setBooks] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [authors, setAuthors] = useState([]);
   const [categories, setCategories] = useState([]);
   const [publishers, setPublishers] = useState([]);
@@ -31,7 +33,8 @@ function LibrarianBooks() {
       setLoading(true);
       setError('');
       const res = await api.get('/books/');
-      setBooks(res.data);
+      setBooks(res.data.results);
+      setNextPage(res.data.next);
     } catch (err) {
       if (err.response?.status === 401) {
         navigate('/login');
@@ -45,6 +48,23 @@ function LibrarianBooks() {
     }
   };
 
+  const loadMoreBooks = async () => {
+    try {
+      setLoadingMore(true);
+      const res = await api.get(nextPage);
+      setBooks((current) => [...current, ...res.data.results]);
+      setNextPage(res.data.next);
+    } catch (err) {
+      if (err.response?.status === 401) {
+        navigate('/login');
+      } else {
+        console.error('Error loading more books:', err.response?.data || err);
+      }
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const fetchAuthors = async () => {
     try {
       const res = await api.get('/authors/');
@@ -280,6 +300,13 @@ function LibrarianBooks() {
                 ))
               )}
             </div>
+            {nextPage && (
+              <div className="load-more-container">
+                <button className="secondary-btn" onClick={loadMoreBooks} disabled={loadingMore}>
+                  {loadingMore ? 'Loading...' : 'Load More'}
+                </button>
+              </div>
+            )}
           </>
         )}
       </div>
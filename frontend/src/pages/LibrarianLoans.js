@@ -7,7 +7,9 @@ import './LibrarianLoans.css';
 
 function LibrarianLoans() {
   const [loans, setLoans] = useState([]);
-  const [books, setBooks] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [counts, setCounts] = useState({ all: 0, active: 0, overdue: 0, returned: 0 });
   const [users, setUsers] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
@@ -17,17 +19,27 @@ function LibrarianLoans() {
   const navigate = useNavigate();
 
   useEffect(() => {
-    fetchLoans();
-    fetchBooks();
     fetchUsers();
   }, []);
 
+  useEffect(() => {
+    fetchLoans();
+  }, [filter]);
+
   const fetchLoans = async () => {
     try {
       setLoading(true);
       setError('');
-      const response = await api.get('/loans/');
-      setLoans(response.data);
+      // One page of the selected tab; the summary and tab counts come
+      // from a single aggregate request
+      const params = filter === 'all' ? {} : { status: filter };
+      const [res, countsRes] = await Promise.all([
+        api.get('/loans/', { params }),
+        api.get('/loans/counts/'),
+      ]);
+      setLoans(res.data.results);
+      setNextPage(res.data.next);
+      setCounts(countsRes.data);
     } catch (err) {
       if (err.response?.status === 401) {
         navigate('/login');
@@ -40,12 +52,20 @@ function LibrarianLoans() {
     }
   };
 
-  const fetchBooks = async () => {
+  const loadMoreLoans = async () => {
     try {
-      const response = await api.get('/books/');
-      setBooks(response.data);
+      setLoadingMore(true);
+      const res = await api.get(nextPage);
+      setLoans((current) => [...current, ...res.data.results]);
+      setNextPage(res.data.next);
     } catch (err) {
-      console.error('Error fetching books:', err);
+      if (err.response?.status === 401) {
+        navigate('/login');
+      } else {
+        console.error('Error loading more loans:', err.response?.data || err);
+      }
+    } finally {
+      setLoadingMore(false);
     }
   };
 
@@ -66,7 +86,6 @@ function LibrarianLoans() {
       await api.post('/loans/', data);
       setShowForm(false);
       await fetchLoans();
-      await fetchBooks(); // Refresh to update available copies
     } catch (err) {
       const errorData = err.response?.data;
       let errorMessage = 'Failed to create loan.';
@@ -107,7 +126,6 @@ function LibrarianLoans() {
       setReturning(loanId);
       const response = await api.post(`/loans/${loanId}/return/`);
       await fetchLoans();
-      await fetchBooks(); // Refresh to update available copies
       
       // Show fine information if applicable
       if (response.data.fine_created) {
@@ -131,16 +149,6 @@ function LibrarianLoans() {
     }
   };
 
-  const filteredLoans = loans.filter(loan => {
-    if (filter === 'active') return !loan.return_date;
-    if (filter === 'returned') return loan.return_date;
-    if (filter === 'overdue') return loan.is_overdue && !loan.return_date;
-    return true; // all
-  });
-
-  const activeLoans = loans.filter(loan => !loan.return_date);
-  const overdueLoans = activeLoans.filter(loan => loan.is_overdue);
-
   if (loading && loans.length === 0) {
     return (
       <div className="librarian-loans-page">
@@ -178,15 +186,15 @@ function LibrarianLoans() {
         {/* Summary Stats */}
         <div className="loans-summary">
           <div className="stat-card">
-            <div className="stat-number">{loans.length}</div>
+            <div className="stat-number">{counts.all}</div>
             <div className="stat-label">Total Loans</div>
           </div>
           <div className="stat-card active-stat">
-            <div className="stat-number">{activeLoans.length}</div>
+            <div className="stat-number">{counts.active}</div>
             <div className="stat-label">Active</div>
           </div>
           <div className="stat-card overdue-stat">
-            <div className="stat-number">{overdueLoans.length}</div>
+            <div className="stat-number">{counts.overdue}</div>
             <div className="stat-label">Overdue</div>
           </div>
         </div>
@@ -197,25 +205,25 @@ function LibrarianLoans() {
             className={`filter-tab ${filter === 'all' ? 'active' : ''}`}
             onClick={() => setFilter('all')}
           >
-            All ({loans.length})
+            All ({counts.all})
           </button>
           <button 
             className={`filter-tab ${filter === 'active' ? 'active' : ''}`}
             onClick={() => setFilter('active')}
           >
-            Active ({activeLoans.length})
+            Active ({counts.active})
           </button>
           <button 
             className={`filter-tab ${filter === 'overdue' ? 'active' : ''}`}
             onClick={() => setFilter('overdue')}
           >
-            Overdue ({overdueLoans.length})
+            Overdue ({counts.overdue})
           </button>
           <button 
             className={`filter-tab ${filter === 'returned' ? 'active' : ''}`}
             onClick={() => setFilter('returned')}
           >
-            Returned ({loans.filter(l => l.return_date).length})
+            Returned ({counts.returned})
           </button>
         </div>
 
@@ -230,7 +238,6 @@ function LibrarianLoans() {
               onSubmit={handleCreateLoan}
               onCancel={() => setShowForm(false)}
               loading={loading}
-              books={books}
               users={users}
             />
           </div>
@@ -244,7 +251,7 @@ function LibrarianLoans() {
           </div>
         )}
 
-        {filteredLoans.length === 0 ? (
+        {loans.length === 0 ? (
           <div className="empty-state">
             <p className="empty-message">
               {filter === 'all' 
@@ -253,17 +260,26 @@ function LibrarianLoans() {
             </p>
           </div>
         ) : (
-          <div className="loans-list">
-            {filteredLoans.map((loan) => (
-              <LoanCard
-                key={loan.loan_id}
-                loan={loan}
-                onReturn={handleReturn}
-                showReturnButton={!loan.return_date}
-                isLibrarian={true}
-              />
-            ))}
-          </div>
+          <>
+            <div className="loans-list">
+              {loans.map((loan) => (
+                <LoanCard
+                  key={loan.loan_id}
+                  loan={loan}
+                  onReturn={handleReturn}
+                  showReturnButton={!loan.return_date}
+                  isLibrarian={true}
+                />
+              ))}
+            </div>
+            {nextPage && (
+              <div className="load-more-container">
+                <button className="secondary-btn" onClick={loadMoreLoans} disabled={loadingMore}>
+                  {loadingMore ? 'Loading...' : 'Load More'}
+                </button>
+              </div>
+            )}
+          </>
         )}
       </div>
     </div>
@@ -5,7 +5,12 @@ import LoanCard from '../components/LoanCard';
 import './StudentLoans.css';
 
 function StudentLoans() {
-  const [loans, setLoans] = useState([]);
+  const [activeLoans, setActiveLoans] = useState([]);
+  const [returnedLoans, setReturnedLoans] = useState([]);
+  const [nextActive, setNextActive] = useState(null);
+  const [nextReturned, setNextReturned] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [counts, setCounts] = useState({ all: 0, active: 0, overdue: 0, returned: 0 });
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [returning, setReturning] = useState(null);
@@ -19,8 +24,17 @@ function StudentLoans() {
     try {
       setLoading(true);
       setError('');
-      const response = await api.get('/loans/');
-      setLoans(response.data);
+      // First page of each section; the summary comes from one aggregate request
+      const [activeRes, returnedRes, countsRes] = await Promise.all([
+        api.get('/loans/', { params: { status: 'active' } }),
+        api.get('/loans/', { params: { status: 'returned' } }),
+        api.get('/loans/counts/'),
+      ]);
+      setActiveLoans(activeRes.data.results);
+      setNextActive(activeRes.data.next);
+      setReturnedLoans(returnedRes.data.results);
+      setNextReturned(returnedRes.data.next);
+      setCounts(countsRes.data);
     } catch (err) {
       if (err.response?.status === 401) {
         navigate('/login');
@@ -33,6 +47,23 @@ function StudentLoans() {
     }
   };
 
+  const loadMore = async (nextPage, setSectionLoans, setNextPage) => {
+    try {
+      setLoadingMore(true);
+      const res = await api.get(nextPage);
+      setSectionLoans((current) => [...current, ...res.data.results]);
+      setNextPage(res.data.next);
+    } catch (err) {
+      if (err.response?.status === 401) {
+        navigate('/login');
+      } else {
+        console.error('Error loading more loans:', err.response?.data || err);
+      }
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleReturn = async (loanId) => {
     const confirmReturn = window.confirm('Are you sure you want to return this book?');
     if (!confirmReturn) return;
@@ -49,10 +80,6 @@ function StudentLoans() {
     }
   };
 
-  const activeLoans = loans.filter(loan => !loan.return_date);
-  const returnedLoans = loans.filter(loan => loan.return_date);
-  const overdueLoans = activeLoans.filter(loan => loan.is_overdue);
-
   if (loading) {
     return (
       <div className="student-loans-page">
@@ -97,15 +124,15 @@ function StudentLoans() {
         {/* Summary Stats */}
         <div className="loans-summary">
           <div className="stat-card">
-            <div className="stat-number">{activeLoans.length}</div>
+            <div className="stat-number">{counts.active}</div>
             <div className="stat-label">Active Loans</div>
           </div>
           <div className="stat-card overdue-stat">
-            <div className="stat-number">{overdueLoans.length}</div>
+            <div className="stat-number">{counts.overdue}</div>
             <div className="stat-label">Overdue</div>
           </div>
           <div className="stat-card returned-stat">
-            <div className="stat-number">{returnedLoans.length}</div>
+            <div className="stat-number">{counts.returned}</div>
             <div className="stat-label">Returned</div>
           </div>
         </div>
@@ -125,6 +152,17 @@ function StudentLoans() {
                 />
               ))}
             </div>
+            {nextActive && (
+              <div className="load-more-container">
+                <button
+                  className="load-more-btn"
+                  onClick={() => loadMore(nextActive, setActiveLoans, setNextActive)}
+                  disabled={loadingMore}
+                >
+                  {loadingMore ? 'Loading...' : 'Load More'}
+                </button>
+              </div>
+            )}
           </div>
         )}
 
@@ -142,11 +180,22 @@ function StudentLoans() {
                 />
               ))}
             </div>
+            {nextReturned && (
+              <div className="load-more-container">
+                <button
+                  className="load-more-btn"
+                  onClick={() => loadMore(nextReturned, setReturnedLoans, setNextReturned)}
+                  disabled={loadingMore}
+                >
+                  {loadingMore ? 'Loading...' : 'Load More'}
+                </button>
+              </div>
+            )}
           </div>
         )}
 
         {/* Empty State */}
-        {loans.length === 0 && (
+        {counts.all === 0 && (
           <div className="empty-state">
             <p className="empty-message">You don't have any loans yet.</p>
             <button 